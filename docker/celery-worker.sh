@@ -0,0 +1,26 @@
+#!/usr/bin/env bash
+
+# Starts one of the celery workers.  The consume worker processes the
+# documents, with PAPERLESS_TASK_WORKERS processes.  The default worker
+# processes all other tasks and the documents uploaded through the API, so
+# they don't wait until a backlog of documents is processed.
+
+case "${1}" in
+	consume)
+		queues="${PAPERLESS_CONSUMER_TASK_QUEUE:-consume}"
+		# PAPERLESS_TASK_WORKERS is the default concurrency of the workers
+		concurrency_args=()
+		;;
+	default)
+		queues="celery,${PAPERLESS_CONSUMER_PRIORITY_TASK_QUEUE:-consume_priority}"
+		concurrency_args=(--concurrency "${PAPERLESS_PRIORITY_TASK_WORKERS:-1}")
+		;;
+	*)
+		echo "Unknown worker ${1}, expected consume or default"
+		exit 1
+		;;
+esac
+
+echo "Starting the ${1} worker for the queues ${queues}"
+exec celery --app paperless worker --loglevel INFO --without-mingle --without-gossip \
+	--hostname "${1}@%h" --queues "${queues}" "${concurrency_args[@]}"
@@ -8,10 +8,18 @@ class DocumentsConfig(AppConfig):
     verbose_name = _("Documents")
 
     def ready(self):
+        from django.db.models.signals import m2m_changed
+        from django.db.models.signals import post_delete
+        from django.db.models.signals import post_save
+
+        from documents.models import Workflow
+        from documents.models import WorkflowAction
+        from documents.models import WorkflowTrigger
         from documents.signals import document_consumption_finished
         from documents.signals import document_updated
         from documents.signals.handlers import add_inbox_tags
         from documents.signals.handlers import add_to_index
+        from documents.signals.handlers import invalidate_workflow_plans
         from documents.signals.handlers import run_workflow_added
         from documents.signals.handlers import run_workflow_updated
         from documents.signals.handlers import set_correspondent
@@ -30,4 +38,25 @@ class DocumentsConfig(AppConfig):
         document_consumption_finished.connect(run_workflow_added)
         document_updated.connect(run_workflow_updated)
 
+        for model in (Workflow, WorkflowTrigger, WorkflowAction):
+            post_save.connect(invalidate_workflow_plans, sender=model)
+            post_delete.connect(invalidate_workflow_plans, sender=model)
+            for field in model._meta.many_to_many:
+                m2m_changed.connect(
+                    invalidate_workflow_plans,
+                    sender=field.remote_field.through,
+                )
+        # Deleting these clears references from workflows without any signal
+        for model in (
+            "documents.Tag",
+            "documents.Correspondent",
+            "documents.DocumentType",
+            "documents.StoragePath",
+            "documents.CustomField",
+            "auth.User",
+            "auth.Group",
+            "paperless_mail.MailRule",
+        ):
+            post_delete.connect(invalidate_workflow_plans, sender=model)
+
         AppConfig.ready(self)
@@ -0,0 +1,84 @@
+from collections.abc import Iterable
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Model
+from django.db.models.signals import pre_save
+from django.utils.encoding import smart_str
+
+from documents.models import CustomFieldInstance
+
+
+def audit_logged(model: type[Model]) -> bool:
+    """
+    Whether auditlog would log saving instances of the model right now.  Models
+    may not be registered, and logging may be disabled for a while.
+    """
+    from auditlog.context import auditlog_disabled
+    from auditlog.registry import auditlog
+
+    return auditlog.contains(model) and not auditlog_disabled.get()
+
+
+def log_bulk_changes(instances: Iterable[Model], action: int) -> None:
+    """
+    Logs the creation or deletion of many instances of a model with a single
+    insert, with the same entries auditlog creates when instances are saved or
+    deleted one by one.  Pass the instances after creating them, or before
+    deleting them.
+    """
+    from auditlog.cid import get_cid
+    from auditlog.diff import model_instance_diff
+    from auditlog.models import LogEntry
+
+    instances = list(instances)
+    if not instances or not audit_logged(type(instances[0])):
+        return
+
+    content_type = ContentType.objects.get_for_model(instances[0])
+    cid = get_cid()
+    entries = []
+    for instance in instances:
+        if action == LogEntry.Action.CREATE:
+            changes = model_instance_diff(None, instance)
+        else:
+            changes = model_instance_diff(instance, None)
+        if not changes:
+            continue
+
+        entry = LogEntry(
+            content_type=content_type,
+            object_pk=instance.pk,
+            object_id=instance.pk if isinstance(instance.pk, int) else None,
+            object_repr=smart_str(instance),
+            action=action,
+            changes=changes,
+            cid=cid,
+        )
+        # Sets the actor of the current request, like for any saved entry
+        pre_save.send(sender=LogEntry, instance=entry, raw=False, using=None)
+        entries.append(entry)
+
+    LogEntry.objects.bulk_create(entries)
+
+
+def log_created_custom_fields(instances: list[CustomFieldInstance]) -> None:
+    """
+    Logs the creation of custom field instances created with bulk_create
+    """
+    from auditlog.models import LogEntry
+
+    if not instances:
+        return
+
+    created = {(instance.document_id, instance.field_id) for instance in instances}
+    # Not every database returns the primary keys from a bulk insert, and the
+    # entries show the name of the field
+    instances = [
+        instance
+        for instance in CustomFieldInstance.objects.filter(
+            document_id__in={document_id for document_id, _ in created},
+            field_id__in={field_id for _, field_id in created},
+        ).select_related("field")
+        if (instance.document_id, instance.field_id) in created
+    ]
+    log_bulk_changes(instances, LogEntry.Action.CREATE)
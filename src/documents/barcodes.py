@@ -1,6 +1,12 @@
+import itertools
 import logging
 import re
 import tempfile
+import uuid
+from collections.abc import Callable
+from collections.abc import Iterator
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
@@ -15,6 +21,10 @@ from PIL import Image
 from documents.converters import convert_from_tiff_to_pdf
 from documents.data_models import ConsumableDocument
 from documents.models import Tag
+from documents.parsers import ParseError
+from documents.parsers import get_parser_class_for_mime_type
+from documents.parsers import pdfium_available
+from documents.parsers import render_pdf_pages_pdfium
 from documents.plugins.base import ConsumeTaskPlugin
 from documents.plugins.base import StopConsumeTaskError
 from documents.plugins.helpers import ProgressStatusOptions
@@ -24,6 +34,9 @@ from documents.utils import maybe_override_pixel_limit
 
 logger = logging.getLogger("paperless.barcodes")
 
+# The number of pages rendered at once, and kept in memory while reading them
+RENDER_BATCH_SIZE = 8
+
 
 @dataclass(frozen=True)
 class Barcode:
@@ -117,6 +130,9 @@ class BarcodePlugin(ConsumeTaskPlugin):
                 ),
             ).resolve()
 
+            if settings.CONSUMER_BARCODE_OCR_BEFORE_SPLIT:
+                self.ocr_before_split()
+
             from documents import tasks
 
             # Create the split document tasks
@@ -159,6 +175,42 @@ class BarcodePlugin(ConsumeTaskPlugin):
     def cleanup(self) -> None:
         self.temp_dir.cleanup()
 
+    def ocr_before_split(self) -> None:
+        """
+        Parses the whole batch once, so that all of its pages are OCRed by a
+        single OCRmyPDF run and stored in the OCR cache.  The documents split
+        from it are then assembled from the cached pages instead of being
+        OCRed again.
+        """
+        parser_class = get_parser_class_for_mime_type("application/pdf")
+        if parser_class is None:  # pragma: no cover
+            return
+
+        document_parser = parser_class(logging_group=uuid.uuid4())
+        if not document_parser.caches_pages():
+            logger.warning(
+                "Not OCRing the documents before splitting them, the parser "
+                "does not cache pages",
+            )
+            document_parser.cleanup()
+            return
+
+        logger.info("OCRing all pages before splitting the documents")
+        self.status_mgr.send_progress(
+            ProgressStatusOptions.WORKING,
+            "Running OCR before splitting...",
+            10,
+            100,
+        )
+
+        try:
+            document_parser.parse(self.pdf_file, "application/pdf")
+        except ParseError as e:
+            # The split documents are OCRed on their own then
+            logger.warning(f"Unable to OCR the documents before splitting: {e}")
+        finally:
+            document_parser.cleanup()
+
     def convert_from_tiff_to_pdf(self):
         """
         May convert a TIFF image into a PDF, if the input is a TIFF and
@@ -210,6 +262,125 @@ class BarcodePlugin(ConsumeTaskPlugin):
 
         return barcodes
 
+    def render_pages(
+        self,
+        pages: list[int],
+        dpi: int,
+    ) -> Iterator[tuple[int, Image.Image]]:
+        """
+        Renders the pages in grayscale, a batch of pages at a time.  Pages are
+        rendered in process if possible, otherwise every consecutive range of
+        pages in a batch is converted by a single pdftoppm call.  The first
+        page is rendered in color, see render_first_page.
+        """
+        for start in range(0, len(pages), RENDER_BATCH_SIZE):
+            batch = pages[start : start + RENDER_BATCH_SIZE]
+
+            if batch[0] == 0:
+                yield 0, self.render_first_page(dpi).convert("L")
+                batch = batch[1:]
+                if not batch:
+                    continue
+
+            if pdfium_available():
+                yield from render_pdf_pages_pdfium(
+                    self.pdf_file,
+                    batch,
+                    dpi,
+                    grayscale=True,
+                )
+                continue
+
+            for _, run in itertools.groupby(
+                enumerate(batch),
+                key=lambda item: item[1] - item[0],
+            ):
+                page_range = [page for _, page in run]
+                images = convert_from_path(
+                    self.pdf_file,
+                    dpi=dpi,
+                    first_page=page_range[0] + 1,
+                    last_page=page_range[-1] + 1,
+                    grayscale=True,
+                )
+                yield from zip(page_range, images)
+
+    def render_first_page(self, dpi: int) -> Image.Image:
+        """
+        Renders the first page in color and keeps it for the thumbnail, so the
+        parser does not have to render it again
+        """
+        if pdfium_available():
+            [(_, image)] = render_pdf_pages_pdfium(self.pdf_file, [0], dpi)
+        else:
+            [image] = convert_from_path(
+                self.pdf_file,
+                dpi=dpi,
+                first_page=1,
+                last_page=1,
+            )
+        image = image.convert("RGB")
+
+        try:
+            key = self.page_images.document_key(self.pdf_file)
+            self.page_images.put(key, 0, dpi, image)
+        except OSError as e:  # pragma: no cover
+            logger.warning(f"Unable to keep the rendered first page: {e}")
+
+        return image
+
+    @staticmethod
+    def read_page(
+        image: Image.Image,
+        reader: Callable[[Image.Image], list[str]],
+    ) -> list[str]:
+        # Upscale image if configured
+        factor = settings.CONSUMER_BARCODE_UPSCALE
+        if factor > 1.0:
+            x, y = image.size
+            image = image.resize(
+                (int(round(x * factor)), (int(round(y * factor)))),
+            )
+        return reader(image)
+
+    def scan_pages(
+        self,
+        pages: list[int],
+        dpi: int,
+        reader: Callable[[Image.Image], list[str]],
+    ) -> dict[int, list[str]]:
+        """
+        Renders the pages and reads their barcodes in parallel.  Returns the
+        barcode values of every page with barcodes.
+        """
+        if settings.CONSUMER_BARCODE_UPSCALE > 1.0:
+            logger.debug(
+                f"Upscaling images by {settings.CONSUMER_BARCODE_UPSCALE} "
+                f"for better barcode detection",
+            )
+
+        found = {}
+        with ThreadPoolExecutor(
+            max_workers=max(int(settings.THREADS_PER_WORKER), 1),
+        ) as executor:
+            futures = {}
+            for page_number, image in self.render_pages(pages, dpi):
+                logger.debug(f"Processing page {page_number}")
+                futures[page_number] = executor.submit(self.read_page, image, reader)
+                # Keep at most a batch of images in memory
+                if len(futures) >= RENDER_BATCH_SIZE:
+                    self._collect(futures, found)
+            self._collect(futures, found)
+
+        return found
+
+    @staticmethod
+    def _collect(futures: dict[int, Future], found: dict[int, list[str]]) -> None:
+        for page_number, future in futures.items():
+            if values := future.result():
+                found[page_number] = values
+        futures.clear()
+
     def detect(self) -> None:
         """
         Scan all pages of the PDF as images, updating barcodes and the pages
@@ -248,42 +419,31 @@ class BarcodePlugin(ConsumeTaskPlugin):
                     f"Barcodes detection will be limited to the first {barcode_max_pages} pages",
                 )
 
-            # Loop al page
-            for current_page_number in range(min(num_of_pages, barcode_max_pages)):
-                logger.debug(f"Processing page {current_page_number}")
-
-                # Convert page to image
-                page = convert_from_path(
-                    self.pdf_file,
-                    dpi=settings.CONSUMER_BARCODE_DPI,
-                    output_folder=self.temp_dir.name,
-                    first_page=current_page_number + 1,
-                    last_page=current_page_number + 1,
-                )[0]
-
-                # Remember filename, since it is lost by upscaling
-                page_filepath = Path(page.filename)
-                logger.debug(f"Image is at {page_filepath}")
-
-                # Upscale image if configured
-                factor = settings.CONSUMER_BARCODE_UPSCALE
-                if factor > 1.0:
-                    logger.debug(
-                        f"Upscaling image by {factor} for better barcode detection",
-                    )
-                    x, y = page.size
-                    page = page.resize(
-                        (int(round(x * factor)), (int(round(y * factor)))),
-                    )
+            pages = list(range(min(num_of_pages, barcode_max_pages)))
 
-                # Detect barcodes
-                for barcode_value in reader(page):
-                    self.barcodes.append(
-                        Barcode(current_page_number, barcode_value),
+            preview_dpi = settings.CONSUMER_BARCODE_PREVIEW_DPI
+            if 0 < preview_dpi < settings.CONSUMER_BARCODE_DPI:
+                # Most pages don't have barcodes, so find the pages which may
+                # have some at a low resolution, then read those again at the
+                # configured one
+                found = self.scan_pages(pages, preview_dpi, reader)
+                logger.debug(
+                    f"Found barcodes on pages {sorted(found)} at {preview_dpi} DPI",
+                )
+                if found:
+                    found.update(
+                        self.scan_pages(
+                            sorted(found),
+                            settings.CONSUMER_BARCODE_DPI,
+                            reader,
+                        ),
                     )
+            else:
+                found = self.scan_pages(pages, settings.CONSUMER_BARCODE_DPI, reader)
 
-                # Delete temporary image file
-                page_filepath.unlink()
+            for page_number in sorted(found):
+                for barcode_value in found[page_number]:
+                    self.barcodes.append(Barcode(page_number, barcode_value))
 
         # Password protected files can't be checked
         # This is the exception raised for those
@@ -1,4 +1,3 @@
-import hashlib
 import itertools
 import logging
 import os
@@ -13,6 +12,12 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.db.models import Q
 
+from documents.audit import log_bulk_changes
+from documents.audit import log_created_custom_fields
+from documents.caching import clear_bulk_edit_job_progress
+from documents.caching import get_bulk_edit_job_progress
+from documents.caching import set_archive_source_checksum
+from documents.caching import set_bulk_edit_job_progress
 from documents.data_models import ConsumableDocument
 from documents.data_models import DocumentMetadataOverrides
 from documents.data_models import DocumentSource
@@ -20,11 +25,16 @@ from documents.models import Correspondent
 from documents.models import CustomFieldInstance
 from documents.models import Document
 from documents.models import DocumentType
+from documents.models import PaperlessTask
 from documents.models import StoragePath
-from documents.permissions import set_permissions_for_object
+from documents.permissions import set_permissions_for_objects
 from documents.tasks import bulk_update_documents
 from documents.tasks import consume_file
+from documents.tasks import reuse_archive_pages
 from documents.tasks import update_document_archive_file
+from documents.utils import compute_checksum
+from documents.utils import remove_pdf_pages
+from documents.utils import rotate_pdf_pages
 
 logger = logging.getLogger("paperless.bulk_edit")
 
@@ -142,16 +152,37 @@ def modify_custom_fields(doc_ids: list[int], add_custom_fields, remove_custom_fi
     qs = Document.objects.filter(id__in=doc_ids).only("pk")
     affected_docs = list(qs.values_list("pk", flat=True))
 
-    for field in add_custom_fields:
-        for doc_id in affected_docs:
-            CustomFieldInstance.objects.update_or_create(
-                document_id=doc_id,
-                field_id=field,
-            )
-    CustomFieldInstance.objects.filter(
+    if add_custom_fields:
+        existing = set(
+            CustomFieldInstance.objects.filter(
+                document_id__in=affected_docs,
+                field_id__in=add_custom_fields,
+            ).values_list("document_id", "field_id"),
+        )
+        missing = [
+            CustomFieldInstance(document_id=doc_id, field_id=field)
+            for field in add_custom_fields
+            for doc_id in affected_docs
+            if (doc_id, field) not in existing
+        ]
+        # Fields added by someone else in the meantime are kept as they are
+        CustomFieldInstance.objects.bulk_create(missing, ignore_conflicts=True)
+        if settings.AUDIT_LOG_ENABLED:
+            log_created_custom_fields(missing)
+
+    removed = CustomFieldInstance.objects.filter(
         document_id__in=affected_docs,
         field_id__in=remove_custom_fields,
-    ).delete()
+    )
+    if settings.AUDIT_LOG_ENABLED:
+        from auditlog.context import disable_auditlog
+        from auditlog.models import LogEntry
+
+        log_bulk_changes(removed.select_related("field"), LogEntry.Action.DELETE)
+        with disable_auditlog():
+            removed.delete()
+    else:
+        removed.delete()
 
     bulk_update_documents.delay(document_ids=affected_docs)
 
@@ -189,8 +220,7 @@ def set_permissions(doc_ids: list[int], set_permissions, owner=None, merge=False
     else:
         qs.update(owner=owner)
 
-    for doc in qs:
-        set_permissions_for_object(permissions=set_permissions, object=doc, merge=merge)
+    set_permissions_for_objects(permissions=set_permissions, objects=qs, merge=merge)
 
     affected_docs = list(qs.values_list("pk", flat=True))
 
@@ -215,15 +245,20 @@ def rotate(doc_ids: list[int], degrees: int):
             )
             continue
         try:
+            source_checksum = doc.checksum
+            set_archive_source_checksum(doc.id, source_checksum, only_if_unknown=True)
             with pikepdf.open(doc.source_path, allow_overwriting_input=True) as pdf:
-                for page in pdf.pages:
-                    page.rotate(degrees, relative=True)
+                rotate_pdf_pages(pdf, degrees)
                 pdf.save()
-                doc.checksum = hashlib.md5(doc.source_path.read_bytes()).hexdigest()
+                doc.checksum = compute_checksum(doc.source_path)
                 doc.save()
                 rotate_tasks.append(
                     update_document_archive_file.s(
                         document_id=doc.id,
+                        rotated_by=degrees,
+                        archive_checksum=doc.archive_checksum,
+                        source_checksum=source_checksum,
+                        checksum=doc.checksum,
                     ),
                 )
                 logger.info(
@@ -292,21 +327,23 @@ def merge(
 
     logger.info("Adding merged document to the task queue.")
 
+    # The pages of the archive files are reused, instead of OCRing them again
+    reuse_task = reuse_archive_pages.si(affected_docs)
     consume_task = consume_file.s(
         ConsumableDocument(
             source=DocumentSource.ConsumeFolder,
             original_file=filepath,
         ),
         overrides,
-    )
+    ).set(immutable=True)
 
     if delete_originals:
         logger.info(
             "Queueing removal of original documents after consumption of merged document",
         )
-        chain(consume_task, delete.si(affected_docs)).delay()
+        chain(reuse_task, consume_task, delete.si(affected_docs)).delay()
     else:
-        consume_task.delay()
+        chain(reuse_task, consume_task).delay()
 
     return "OK"
 
@@ -353,16 +390,21 @@ def split(
                             original_file=filepath,
                         ),
                         overrides,
-                    ),
+                    ).set(immutable=True),
                 )
 
+            # The pages of the archive file are reused, instead of OCRing them again
+            reuse_task = reuse_archive_pages.si([doc.id])
             if delete_originals:
                 logger.info(
                     "Queueing removal of original document after consumption of the split documents",
                 )
-                chord(header=consume_tasks, body=delete.si([doc.id])).delay()
+                chain(
+                    reuse_task,
+                    chord(header=consume_tasks, body=delete.si([doc.id])),
+                ).delay()
             else:
-                group(consume_tasks).delay()
+                chain(reuse_task, group(consume_tasks)).delay()
 
     except Exception as e:
         logger.exception(f"Error splitting document {doc.id}: {e}")
@@ -375,22 +417,77 @@ def delete_pages(doc_ids: list[int], pages: list[int]):
         f"Attempting to delete pages {pages} from {len(doc_ids)} documents",
     )
     doc = Document.objects.get(id=doc_ids[0])
-    pages = sorted(pages)  # sort pages to avoid index issues
+    pages = sorted(pages)
     import pikepdf
 
     try:
+        source_checksum = doc.checksum
+        set_archive_source_checksum(doc.id, source_checksum, only_if_unknown=True)
         with pikepdf.open(doc.source_path, allow_overwriting_input=True) as pdf:
-            offset = 1  # pages are 1-indexed
-            for page_num in pages:
-                pdf.pages.remove(pdf.pages[page_num - offset])
-                offset += 1  # remove() changes the index of the pages
-            pdf.remove_unreferenced_resources()
+            remove_pdf_pages(pdf, pages)
             pdf.save()
-            doc.checksum = hashlib.md5(doc.source_path.read_bytes()).hexdigest()
+            doc.checksum = compute_checksum(doc.source_path)
             doc.save()
-            update_document_archive_file.delay(document_id=doc.id)
+            update_document_archive_file.delay(
+                document_id=doc.id,
+                deleted_pages=pages,
+                archive_checksum=doc.archive_checksum,
+                source_checksum=source_checksum,
+                checksum=doc.checksum,
+            )
             logger.info(f"Deleted pages {pages} from document {doc.id}")
     except Exception as e:
         logger.exception(f"Error deleting pages from document {doc.id}: {e}")
 
     return "OK"
+
+
+# These methods edit each document on its own, so large selections can be
+# edited a chunk at a time
+CHUNKED_METHODS = (
+    set_correspondent,
+    set_storage_path,
+    set_document_type,
+    add_tag,
+    remove_tag,
+    modify_tags,
+    modify_custom_fields,
+    delete,
+    reprocess,
+    set_permissions,
+)
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def bulk_edit_job(self, method, doc_ids: list[int], parameters: dict):
+    """
+    Runs one of the CHUNKED_METHODS on settings.BULK_EDIT_CHUNK_SIZE documents
+    at a time, and reports the progress as the result of its PaperlessTask.
+    The task is only acknowledged when it is done, so if the worker is lost,
+    the task is delivered again and continues after the chunks edited already.
+    """
+    job_id = self.request.id
+    chunk_size = settings.BULK_EDIT_CHUNK_SIZE
+    edited = get_bulk_edit_job_progress(job_id)
+    if edited:
+        logger.info(f"Resuming bulk edit {job_id} after {edited} documents")
+
+    try:
+        while edited < len(doc_ids):
+            chunk = doc_ids[edited : edited + chunk_size]
+            # Not in a transaction, since the methods queue tasks for the
+            # edited documents right away.  Editing a chunk again when the
+            # task is delivered again is harmless.
+            method(chunk, **parameters)
+            edited += len(chunk)
+            set_bulk_edit_job_progress(job_id, edited)
+            PaperlessTask.objects.filter(task_id=job_id).update(
+                result=f"Edited {edited} of {len(doc_ids)} documents",
+            )
+    except Exception as e:
+        logger.exception(f"Error performing bulk edit {job_id}: {e}")
+        clear_bulk_edit_job_progress(job_id)
+        raise
+
+    clear_bulk_edit_job_progress(job_id)
+    return f"Edited {len(doc_ids)} documents"
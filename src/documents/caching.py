@@ -1,28 +1,24 @@
+import hashlib
 import logging
+import uuid
 from binascii import hexlify
+from collections.abc import Iterable
 from dataclasses import dataclass
+from pathlib import Path
 from typing import TYPE_CHECKING
 from typing import Final
 from typing import Optional
+from typing import Union
 
+from django.conf import settings
 from django.core.cache import cache
 
-from documents.models import Document
-
 if TYPE_CHECKING:
     from documents.classifier import DocumentClassifier
 
 logger = logging.getLogger("paperless.caching")
 
 
-@dataclass(frozen=True)
-class MetadataCacheData:
-    original_checksum: str
-    original_metadata: list
-    archive_checksum: Optional[str]
-    archive_metadata: Optional[list]
-
-
 @dataclass(frozen=True)
 class SuggestionCacheData:
     classifier_version: int
@@ -33,10 +29,17 @@ class SuggestionCacheData:
 CLASSIFIER_VERSION_KEY: Final[str] = "classifier_version"
 CLASSIFIER_HASH_KEY: Final[str] = "classifier_hash"
 CLASSIFIER_MODIFIED_KEY: Final[str] = "classifier_modified"
+WORKFLOW_GENERATION_KEY: Final[str] = "workflow_generation"
+CONSUMER_METRICS_KEY: Final[str] = "consumer_metrics"
+CONSUMER_JOURNAL_KEY_PREFIX: Final[str] = "consumer_queued_"
+BULK_EDIT_JOB_KEY_PREFIX: Final[str] = "bulk_edit_job_"
+ARCHIVE_SOURCE_KEY_PREFIX: Final[str] = "doc_archive_source_"
 
 CACHE_1_MINUTE: Final[int] = 60
 CACHE_5_MINUTES: Final[int] = 5 * CACHE_1_MINUTE
 CACHE_50_MINUTES: Final[int] = 50 * CACHE_1_MINUTE
+CACHE_1_DAY: Final[int] = 24 * 60 * CACHE_1_MINUTE
+CACHE_1_YEAR: Final[int] = 365 * 24 * 60 * CACHE_1_MINUTE
 
 
 def get_suggestion_cache_key(document_id: int) -> str:
@@ -114,84 +117,53 @@ def refresh_suggestions_cache(
     cache.touch(doc_key, timeout)
 
 
-def get_metadata_cache_key(document_id: int) -> str:
-    """
-    Returns the basic key for a document's metadata
-    """
-    return f"doc_{document_id}_metadata"
-
-
-def get_metadata_cache(document_id: int) -> Optional[MetadataCacheData]:
-    """
-    Returns the cached document metadata for the given document ID, as long as the metadata
-    was cached once and the checksums have not changed
-    """
-    doc_key = get_metadata_cache_key(document_id)
-    doc_metadata: Optional[MetadataCacheData] = cache.get(doc_key)
-    # The metadata exists in the cache
-    if doc_metadata is not None:
-        try:
-            doc = Document.objects.only(
-                "pk",
-                "checksum",
-                "archive_checksum",
-                "archive_filename",
-            ).get(pk=document_id)
-            # The original checksums match
-            # If it has one, the archive checksums match
-            # Then, we can use the metadata
-            if (
-                doc_metadata.original_checksum == doc.checksum
-                and doc.has_archive_version
-                and doc_metadata.archive_checksum is not None
-                and doc_metadata.archive_checksum == doc.archive_checksum
-            ):
-                # Refresh cache
-                cache.touch(doc_key, CACHE_50_MINUTES)
-                return doc_metadata
-            else:  # pragma: no cover
-                # Something didn't match, delete the key
-                cache.delete(doc_key)
-        except Document.DoesNotExist:  # pragma: no cover
-            # Basically impossible, but the key existed, but the Document didn't
-            cache.delete(doc_key)
-    return None
-
-
-def set_metadata_cache(
-    document: Document,
-    original_metadata: list,
-    archive_metadata: Optional[list],
-    *,
-    timeout=CACHE_50_MINUTES,
-) -> None:
+def get_date_suggestions_cache_key(filename: Optional[str], content: str) -> str:
+    """
+    Builds the key to store the dates suggested for the given content.  The key
+    is a hash of the content and of all settings affecting the dates, so it does
+    not need to be removed when a document changes.
+    """
+    digest = hashlib.sha256()
+    for part in (
+        settings.TIME_ZONE,
+        settings.DATE_ORDER,
+        settings.FILENAME_DATE_ORDER or "",
+        settings.NUMBER_OF_SUGGESTED_DATES,
+        settings.DATE_PARSER_MAX_CHARACTERS,
+        settings.DATE_PARSER_MAX_MATCHES,
+        filename or "",
+        content or "",
+    ):
+        digest.update(str(part).encode("utf-8", errors="surrogatepass"))
+        digest.update(b"\0")
+    return f"date_suggestions_{digest.hexdigest()}"
+
+
+def get_date_suggestions_cache(
+    filename: Optional[str],
+    content: str,
+) -> Optional[list[str]]:
     """
-    Sets the metadata into cache for the given Document
+    Returns the cached dates suggested for the given content, if there are any
     """
-    doc_key = get_metadata_cache_key(document.pk)
-    cache.set(
-        doc_key,
-        MetadataCacheData(
-            document.checksum,
-            original_metadata,
-            document.archive_checksum,
-            archive_metadata,
-        ),
-        timeout,
-    )
+    key = get_date_suggestions_cache_key(filename, content)
+    dates: Optional[list[str]] = cache.get(key)
+    if dates is not None:
+        cache.touch(key, CACHE_50_MINUTES)
+    return dates
 
 
-def refresh_metadata_cache(
-    document_id: int,
+def set_date_suggestions_cache(
+    filename: Optional[str],
+    content: str,
+    dates: list[str],
     *,
     timeout: int = CACHE_50_MINUTES,
 ) -> None:
     """
-    Refreshes the expiration of the metadata for the given document ID
-    to the given timeout
+    Caches the dates suggested for the given content
     """
-    doc_key = get_metadata_cache_key(document_id)
-    cache.touch(doc_key, timeout)
+    cache.set(get_date_suggestions_cache_key(filename, content), dates, timeout)
 
 
 def get_thumbnail_modified_key(document_id: int) -> str:
@@ -205,10 +177,116 @@ def clear_document_caches(document_id: int) -> None:
     """
     Removes all cached items for the given document
     """
-    cache.delete_many(
-        [
-            get_suggestion_cache_key(document_id),
-            get_metadata_cache_key(document_id),
-            get_thumbnail_modified_key(document_id),
-        ],
-    )
+    bulk_clear_document_caches([document_id])
+
+
+def bulk_clear_document_caches(document_ids: Iterable[int]) -> None:
+    """
+    Removes all cached items for the given documents, in one call to the cache
+    """
+    keys = []
+    for document_id in document_ids:
+        keys.append(get_suggestion_cache_key(document_id))
+        keys.append(get_thumbnail_modified_key(document_id))
+    if keys:
+        cache.delete_many(keys)
+
+
+def get_workflow_generation() -> Optional[str]:
+    """
+    Returns the current generation of the workflow configuration.  The generation
+    is an opaque token shared by all processes through the cache, which changes
+    whenever a workflow, trigger or action is modified.
+
+    Returns None if the cache backend cannot store the generation at all
+    """
+    generation: Optional[str] = cache.get(WORKFLOW_GENERATION_KEY)
+    if generation is None:
+        # First use or the key was evicted, start a new generation
+        cache.add(WORKFLOW_GENERATION_KEY, uuid.uuid4().hex, None)
+        generation = cache.get(WORKFLOW_GENERATION_KEY)
+    return generation
+
+
+def bump_workflow_generation() -> None:
+    """
+    Starts a new workflow generation, marking any compiled workflows as outdated
+    """
+    cache.set(WORKFLOW_GENERATION_KEY, uuid.uuid4().hex, None)
+
+
+def set_consumer_metrics(metrics: dict) -> None:
+    """
+    Publishes the metrics of the consumer watching the consumption directory.
+    They expire if the consumer stops refreshing them.
+    """
+    cache.set(CONSUMER_METRICS_KEY, metrics, CACHE_1_MINUTE)
+
+
+def get_consumer_metrics() -> Optional[dict]:
+    """
+    Returns the metrics of the running consumer, if there is one
+    """
+    return cache.get(CONSUMER_METRICS_KEY)
+
+
+def get_consumer_journal_key(filepath: Union[str, Path]) -> str:
+    """
+    Builds the key recording that the consumer queued the given file
+    """
+    digest = hashlib.sha256(str(filepath).encode()).hexdigest()
+    return f"{CONSUMER_JOURNAL_KEY_PREFIX}{digest}"
+
+
+def clear_consumer_journal(filepath: Union[str, Path]) -> None:
+    """
+    Forgets that the consumer queued the given file, once its task is done.  A
+    file which failed to consume is then queued again when the consumer
+    restarts.
+    """
+    cache.delete(get_consumer_journal_key(filepath))
+
+
+def get_bulk_edit_job_progress(job_id: str) -> int:
+    """
+    Returns how many documents the bulk edit job edited already
+    """
+    return cache.get(f"{BULK_EDIT_JOB_KEY_PREFIX}{job_id}", 0)
+
+
+def set_bulk_edit_job_progress(job_id: str, edited: int) -> None:
+    """
+    Remembers how many documents the bulk edit job edited, long enough for a
+    lost task to be delivered again
+    """
+    cache.set(f"{BULK_EDIT_JOB_KEY_PREFIX}{job_id}", edited, CACHE_1_DAY)
+
+
+def clear_bulk_edit_job_progress(job_id: str) -> None:
+    cache.delete(f"{BULK_EDIT_JOB_KEY_PREFIX}{job_id}")
+
+
+def get_archive_source_checksum(document_id: int) -> Optional[str]:
+    """
+    Returns the checksum of the original which the archive file of the
+    document was created from, if it is known
+    """
+    return cache.get(f"{ARCHIVE_SOURCE_KEY_PREFIX}{document_id}")
+
+
+def set_archive_source_checksum(
+    document_id: int,
+    checksum: str,
+    *,
+    only_if_unknown: bool = False,
+) -> None:
+    """
+    Remembers the checksum of the original which the archive file of the
+    document was created from.  With only_if_unknown, a checksum remembered
+    before is kept, since the archive file may not have been updated since.
+    """
+    key = f"{ARCHIVE_SOURCE_KEY_PREFIX}{document_id}"
+    if only_if_unknown:
+        cache.add(key, checksum, CACHE_1_YEAR)
+    else:
+        cache.set(key, checksum, CACHE_1_YEAR)
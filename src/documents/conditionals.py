@@ -13,6 +13,8 @@ from documents.caching import CLASSIFIER_VERSION_KEY
 from documents.caching import get_thumbnail_modified_key
 from documents.classifier import DocumentClassifier
 from documents.models import Document
+from documents.previews import PAGE_PREVIEW_SIZE_DEFAULT
+from documents.previews import page_preview_tag
 
 
 def suggestions_etag(request, pk: int) -> Optional[str]:
@@ -123,6 +125,20 @@ def preview_last_modified(request, pk: int) -> Optional[datetime]:
     return None
 
 
+def page_preview_etag(request, pk: int, page: str) -> Optional[str]:
+    """
+    Page previews are rendered from the archive version if there is one, so
+    its checksum, the page and the size identify the image
+    """
+    try:
+        doc = Document.objects.only("checksum", "archive_checksum").get(pk=pk)
+        size = request.query_params.get("size", PAGE_PREVIEW_SIZE_DEFAULT)
+        return page_preview_tag(doc, page, size)
+    except Document.DoesNotExist:  # pragma: no cover
+        return None
+    return None
+
+
 def thumbnail_last_modified(request, pk: int) -> Optional[datetime]:
     """
     Returns the filesystem last modified either from cache or from filesystem.
@@ -1,10 +1,8 @@
 import datetime
-import hashlib
 import os
 import tempfile
 from enum import Enum
 from pathlib import Path
-from typing import TYPE_CHECKING
 from typing import Optional
 from typing import Union
 
@@ -14,16 +12,16 @@ from django.contrib.auth.models import User
 from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
-from filelock import FileLock
 from rest_framework.reverse import reverse
 
 from documents.classifier import load_classifier
 from documents.data_models import ConsumableDocument
 from documents.data_models import DocumentMetadataOverrides
-from documents.file_handling import create_source_path_directory
-from documents.file_handling import generate_unique_filename
+from documents.file_handling import claim_unique_filename
+from documents.locks import lock_documents
 from documents.loggers import LoggingMixin
 from documents.matching import document_matches_workflow
+from documents.metadata import update_document_metadata
 from documents.models import Correspondent
 from documents.models import CustomField
 from documents.models import CustomFieldInstance
@@ -32,7 +30,6 @@ from documents.models import DocumentType
 from documents.models import FileInfo
 from documents.models import StoragePath
 from documents.models import Tag
-from documents.models import Workflow
 from documents.models import WorkflowAction
 from documents.models import WorkflowTrigger
 from documents.parsers import DocumentParser
@@ -48,9 +45,12 @@ from documents.plugins.helpers import ProgressManager
 from documents.plugins.helpers import ProgressStatusOptions
 from documents.signals import document_consumption_finished
 from documents.signals import document_consumption_started
+from documents.utils import compute_checksum
 from documents.utils import copy_basic_file_stats
 from documents.utils import copy_file_with_basic_stats
+from documents.utils import copy_file_with_checksum
 from documents.utils import run_subprocess
+from documents.workflows import get_workflow_plans
 
 
 class WorkflowTriggerPlugin(
@@ -67,23 +67,7 @@ class WorkflowTriggerPlugin(
         """
         msg = ""
         overrides = DocumentMetadataOverrides()
-        for workflow in (
-            Workflow.objects.filter(enabled=True)
-            .prefetch_related("actions")
-            .prefetch_related("actions__assign_view_users")
-            .prefetch_related("actions__assign_view_groups")
-            .prefetch_related("actions__assign_change_users")
-            .prefetch_related("actions__assign_change_groups")
-            .prefetch_related("actions__assign_custom_fields")
-            .prefetch_related("actions__remove_tags")
-            .prefetch_related("actions__remove_correspondents")
-            .prefetch_related("actions__remove_document_types")
-            .prefetch_related("actions__remove_storage_paths")
-            .prefetch_related("actions__remove_custom_fields")
-            .prefetch_related("actions__remove_owners")
-            .prefetch_related("triggers")
-            .order_by("order")
-        ):
+        for workflow in get_workflow_plans():
             action_overrides = DocumentMetadataOverrides()
 
             if document_matches_workflow(
@@ -91,106 +75,79 @@ class WorkflowTriggerPlugin(
                 workflow,
                 WorkflowTrigger.WorkflowTriggerType.CONSUMPTION,
             ):
-                for action in workflow.actions.all():
-                    if TYPE_CHECKING:
-                        assert isinstance(action, WorkflowAction)
+                for action in workflow.actions:
                     msg += f"Applying {action} from {workflow}\n"
                     if action.type == WorkflowAction.WorkflowActionType.ASSIGNMENT:
                         if action.assign_title is not None:
                             action_overrides.title = action.assign_title
-                        if action.assign_tags is not None:
-                            action_overrides.tag_ids = list(
-                                action.assign_tags.values_list("pk", flat=True),
-                            )
-
-                        if action.assign_correspondent is not None:
+                        action_overrides.tag_ids = list(action.assign_tag_ids)
+                        if action.assign_correspondent_id is not None:
                             action_overrides.correspondent_id = (
-                                action.assign_correspondent.pk
+                                action.assign_correspondent_id
                             )
-                        if action.assign_document_type is not None:
+                        if action.assign_document_type_id is not None:
                             action_overrides.document_type_id = (
-                                action.assign_document_type.pk
+                                action.assign_document_type_id
                             )
-                        if action.assign_storage_path is not None:
+                        if action.assign_storage_path_id is not None:
                             action_overrides.storage_path_id = (
-                                action.assign_storage_path.pk
-                            )
-                        if action.assign_owner is not None:
-                            action_overrides.owner_id = action.assign_owner.pk
-                        if action.assign_view_users is not None:
-                            action_overrides.view_users = list(
-                                action.assign_view_users.values_list("pk", flat=True),
-                            )
-                        if action.assign_view_groups is not None:
-                            action_overrides.view_groups = list(
-                                action.assign_view_groups.values_list("pk", flat=True),
-                            )
-                        if action.assign_change_users is not None:
-                            action_overrides.change_users = list(
-                                action.assign_change_users.values_list("pk", flat=True),
-                            )
-                        if action.assign_change_groups is not None:
-                            action_overrides.change_groups = list(
-                                action.assign_change_groups.values_list(
-                                    "pk",
-                                    flat=True,
-                                ),
-                            )
-                        if action.assign_custom_fields is not None:
-                            action_overrides.custom_field_ids = list(
-                                action.assign_custom_fields.values_list(
-                                    "pk",
-                                    flat=True,
-                                ),
+                                action.assign_storage_path_id
                             )
+                        if action.assign_owner_id is not None:
+                            action_overrides.owner_id = action.assign_owner_id
+                        action_overrides.view_users = list(action.assign_view_user_ids)
+                        action_overrides.view_groups = list(
+                            action.assign_view_group_ids,
+                        )
+                        action_overrides.change_users = list(
+                            action.assign_change_user_ids,
+                        )
+                        action_overrides.change_groups = list(
+                            action.assign_change_group_ids,
+                        )
+                        action_overrides.custom_field_ids = list(
+                            action.assign_custom_field_ids,
+                        )
                         overrides.update(action_overrides)
                     elif action.type == WorkflowAction.WorkflowActionType.REMOVAL:
                         # Removal actions overwrite the current overrides
                         if action.remove_all_tags:
                             overrides.tag_ids = []
                         elif overrides.tag_ids:
-                            for tag in action.remove_custom_fields.filter(
-                                pk__in=overrides.tag_ids,
-                            ):
-                                overrides.tag_ids.remove(tag.pk)
+                            overrides.tag_ids = [
+                                tag_id
+                                for tag_id in overrides.tag_ids
+                                if tag_id not in action.remove_tag_ids
+                            ]
 
                         if action.remove_all_correspondents or (
-                            overrides.correspondent_id is not None
-                            and action.remove_correspondents.filter(
-                                pk=overrides.correspondent_id,
-                            ).exists()
+                            overrides.correspondent_id
+                            in action.remove_correspondent_ids
                         ):
                             overrides.correspondent_id = None
 
                         if action.remove_all_document_types or (
-                            overrides.document_type_id is not None
-                            and action.remove_document_types.filter(
-                                pk=overrides.document_type_id,
-                            ).exists()
+                            overrides.document_type_id
+                            in action.remove_document_type_ids
                         ):
                             overrides.document_type_id = None
 
                         if action.remove_all_storage_paths or (
-                            overrides.storage_path_id is not None
-                            and action.remove_storage_paths.filter(
-                                pk=overrides.storage_path_id,
-                            ).exists()
+                            overrides.storage_path_id in action.remove_storage_path_ids
                         ):
                             overrides.storage_path_id = None
 
                         if action.remove_all_custom_fields:
                             overrides.custom_field_ids = []
                         elif overrides.custom_field_ids:
-                            for field in action.remove_custom_fields.filter(
-                                pk__in=overrides.custom_field_ids,
-                            ):
-                                overrides.custom_field_ids.remove(field.pk)
+                            overrides.custom_field_ids = [
+                                field_id
+                                for field_id in overrides.custom_field_ids
+                                if field_id not in action.remove_custom_field_ids
+                            ]
 
                         if action.remove_all_owners or (
-                            overrides.owner_id is not None
-                            and action.remove_owners.filter(
-                                pk=overrides.owner_id,
-                            ).exists()
+                            overrides.owner_id in action.remove_owner_ids
                         ):
                             overrides.owner_id = None
 
@@ -201,25 +158,29 @@ class WorkflowTriggerPlugin(
                             overrides.change_groups = []
                         else:
                             if overrides.view_users:
-                                for user in action.remove_view_users.filter(
-                                    pk__in=overrides.view_users,
-                                ):
-                                    overrides.view_users.remove(user.pk)
+                                overrides.view_users = [
+                                    user_id
+                                    for user_id in overrides.view_users
+                                    if user_id not in action.remove_view_user_ids
+                                ]
                             if overrides.change_users:
-                                for user in action.remove_change_users.filter(
-                                    pk__in=overrides.change_users,
-                                ):
-                                    overrides.change_users.remove(user.pk)
+                                overrides.change_users = [
+                                    user_id
+                                    for user_id in overrides.change_users
+                                    if user_id not in action.remove_change_user_ids
+                                ]
                             if overrides.view_groups:
-                                for user in action.remove_view_groups.filter(
-                                    pk__in=overrides.view_groups,
-                                ):
-                                    overrides.view_groups.remove(user.pk)
+                                overrides.view_groups = [
+                                    group_id
+                                    for group_id in overrides.view_groups
+                                    if group_id not in action.remove_view_group_ids
+                                ]
                             if overrides.change_groups:
-                                for user in action.remove_change_groups.filter(
-                                    pk__in=overrides.change_groups,
-                                ):
-                                    overrides.change_groups.remove(user.pk)
+                                overrides.change_groups = [
+                                    group_id
+                                    for group_id in overrides.change_groups
+                                    if group_id not in action.remove_change_group_ids
+                                ]
 
         self.metadata.update(overrides)
         return msg
@@ -272,6 +233,8 @@ class ConsumerPlugin(
         self.renew_logging_group()
 
         self.filename = self.metadata.filename or self.input_doc.original_file.name
+        # The MD5 of the working copy, calculated once while copying the input
+        self.checksum: Optional[str] = None
 
     def _send_progress(
         self,
@@ -317,8 +280,7 @@ class ConsumerPlugin(
         """
         Using the MD5 of the file, check this exact file doesn't already exist
         """
-        with open(self.input_doc.original_file, "rb") as f:
-            checksum = hashlib.md5(f.read()).hexdigest()
+        checksum = self.checksum or compute_checksum(self.input_doc.original_file)
         existing_doc = Document.global_objects.filter(
             Q(checksum=checksum) | Q(archive_checksum=checksum),
         )
@@ -425,6 +387,10 @@ class ConsumerPlugin(
                 exception=e,
             )
 
+        # The script may have changed the working copy
+        self.checksum = compute_checksum(self.working_copy)
+        self.page_images.remember_key(self.working_copy, self.checksum)
+
     def run_post_consume_script(self, document: Document):
         """
         If one is configured and exists, run the pre-consume script and
@@ -520,18 +486,25 @@ class ConsumerPlugin(
 
             self.pre_check_file_exists()
             self.pre_check_directories()
-            self.pre_check_duplicate()
-            self.pre_check_asn_value()
-
-            self.log.info(f"Consuming {self.filename}")
 
-            # For the actual work, copy the file into a tempdir
+            # For the actual work, copy the file into a tempdir.  The checksum
+            # is calculated while copying, so the input is only read once
             tempdir = tempfile.TemporaryDirectory(
                 prefix="paperless-ngx",
                 dir=settings.SCRATCH_DIR,
             )
             self.working_copy = Path(tempdir.name) / Path(self.filename)
-            copy_file_with_basic_stats(self.input_doc.original_file, self.working_copy)
+            self.checksum = copy_file_with_basic_stats(
+                self.input_doc.original_file,
+                self.working_copy,
+                checksum=True,
+            )
+            self.page_images.remember_key(self.working_copy, self.checksum)
+
+            self.pre_check_duplicate()
+            self.pre_check_asn_value()
+
+            self.log.info(f"Consuming {self.filename}")
 
             # Determine the parser class.
 
@@ -577,6 +550,7 @@ class ConsumerPlugin(
             self.logging_group,
             progress_callback=progress_callback,
         )
+        document_parser.page_images = self.page_images
 
         self.log.debug(f"Parser: {type(document_parser).__name__}")
 
@@ -594,6 +568,14 @@ class ConsumerPlugin(
                 ProgressStatusOptions.WORKING,
                 ConsumerStatusShortMessage.PARSING_DOCUMENT,
             )
+            # Parsers may create the thumbnail while parsing, when the thumbnail
+            # does not depend on the parse results
+            document_parser.start_thumbnail(
+                self.working_copy,
+                mime_type,
+                self.filename,
+            )
+
             self.log.debug(f"Parsing {self.filename}...")
             document_parser.parse(self.working_copy, mime_type, self.filename)
 
@@ -604,7 +586,7 @@ class ConsumerPlugin(
                 ProgressStatusOptions.WORKING,
                 ConsumerStatusShortMessage.GENERATING_THUMBNAIL,
             )
-            thumbnail = document_parser.get_thumbnail(
+            thumbnail = document_parser.finish_thumbnail(
                 self.working_copy,
                 mime_type,
                 self.filename,
@@ -676,39 +658,30 @@ class ConsumerPlugin(
 
                 # After everything is in the database, copy the files into
                 # place. If this fails, we'll also rollback the transaction.
-                with FileLock(settings.MEDIA_LOCK):
-                    document.filename = generate_unique_filename(document)
-                    create_source_path_directory(document.source_path)
+                with lock_documents(document.pk):
+                    # Claimed filenames are kept by the copied files
+                    document.filename = claim_unique_filename(document)
 
                     self._write(
-                        document.storage_type,
                         self.working_copy,
                         document.source_path,
                     )
 
                     self._write(
-                        document.storage_type,
                         thumbnail,
                         document.thumbnail_path,
                     )
 
                     if archive_path and os.path.isfile(archive_path):
-                        document.archive_filename = generate_unique_filename(
+                        document.archive_filename = claim_unique_filename(
                             document,
                             archive_filename=True,
                         )
-                        create_source_path_directory(document.archive_path)
-                        self._write(
-                            document.storage_type,
+                        document.archive_checksum = self._write(
                             archive_path,
                             document.archive_path,
                         )
 
-                        with open(archive_path, "rb") as f:
-                            document.archive_checksum = hashlib.md5(
-                                f.read(),
-                            ).hexdigest()
-
                 # Don't save with the lock active. Saving will cause the file
                 # renaming logic to acquire the lock as well.
                 # This triggers things like file renaming
@@ -729,6 +702,14 @@ class ConsumerPlugin(
                     self.log.debug(f"Deleting file {shadow_file}")
                     os.unlink(shadow_file)
 
+            # Reading the files and detecting the language takes a while, so
+            # it's not done while the transaction holds the database.  If it
+            # fails, the metadata is extracted once it is requested.
+            try:
+                update_document_metadata(document, parser=document_parser)
+            except Exception as e:
+                self.log.warning(f"Unable to store the metadata of {document}: {e}")
+
         except Exception as e:
             self._fail(
                 str(e),
@@ -831,7 +812,7 @@ class ConsumerPlugin(
             title=title[:127],
             content=text,
             mime_type=mime_type,
-            checksum=hashlib.md5(self.working_copy.read_bytes()).hexdigest(),
+            checksum=self.checksum,
             created=create_date,
             modified=create_date,
             storage_type=storage_type,
@@ -898,9 +879,11 @@ class ConsumerPlugin(
                     document=document,
                 )  # adds to document
 
-    def _write(self, storage_type, source, target):
-        with open(source, "rb") as read_file, open(target, "wb") as write_file:
-            write_file.write(read_file.read())
+    def _write(self, source, target) -> str:
+        """
+        Copies source to target, returning the MD5 checksum of the copied data
+        """
+        checksum = copy_file_with_checksum(source, target)
 
         # Attempt to copy file's original stats, but it's ok if we can't
         try:
@@ -908,6 +891,8 @@ class ConsumerPlugin(
         except Exception:  # pragma: no cover
             pass
 
+        return checksum
+
 
 def parse_doc_title_w_placeholders(
     title: str,
@@ -1,5 +1,6 @@
 import logging
 import os
+import shutil
 from collections import defaultdict
 from pathlib import PurePath
 
@@ -22,6 +23,22 @@ def create_source_path_directory(source_path):
     os.makedirs(os.path.dirname(source_path), exist_ok=True)
 
 
+def move_file(source, target):
+    """
+    Moves source to target, creating the directory of target.  Changes to
+    other documents may delete the directory as empty before the file is in
+    it, so this creates it again once in that case.
+    """
+    create_source_path_directory(target)
+    try:
+        shutil.move(source, target)
+    except FileNotFoundError:
+        if not os.path.isfile(source):
+            raise
+        create_source_path_directory(target)
+        shutil.move(source, target)
+
+
 def delete_empty_directories(directory, root):
     if not os.path.isdir(directory):
         return
@@ -127,6 +144,42 @@ def generate_unique_filename(doc, archive_filename=False):
             return new_filename
 
 
+def claim_unique_filename(doc, archive_filename=False):
+    """
+    Generates a unique filename like generate_unique_filename, and claims it
+    by creating an empty file with an exclusive open.  Concurrent changes to
+    other documents can't pick the same filename then, before the file is
+    moved or copied over the empty one.
+
+    The current filename of the document is returned without claiming it.
+    """
+    if archive_filename:
+        old_filename = doc.archive_filename
+        root = settings.ARCHIVE_DIR
+    else:
+        old_filename = doc.filename
+        root = settings.ORIGINALS_DIR
+
+    while True:
+        new_filename = generate_unique_filename(
+            doc,
+            archive_filename=archive_filename,
+        )
+        if new_filename == old_filename:
+            return new_filename
+
+        path = os.path.join(root, new_filename)
+        create_source_path_directory(path)
+        try:
+            with open(path, "x"):
+                pass
+        except (FileExistsError, FileNotFoundError):
+            # Another process took the filename or deleted the empty
+            # directory since then, so try again
+            continue
+        return new_filename
+
+
 def generate_filename(
     doc: Document,
     counter=0,
@@ -2,6 +2,8 @@ import logging
 import math
 import os
 from collections import Counter
+from collections import defaultdict
+from collections.abc import Iterable
 from contextlib import contextmanager
 from datetime import datetime
 from datetime import timezone
@@ -9,8 +11,13 @@ from shutil import rmtree
 from typing import Optional
 
 from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Prefetch
 from django.db.models import QuerySet
 from django.utils import timezone as django_timezone
+from guardian.models import GroupObjectPermission
+from guardian.models import UserObjectPermission
 from guardian.shortcuts import get_users_with_perms
 from whoosh import classify
 from whoosh import highlight
@@ -42,7 +49,6 @@ from whoosh.writing import AsyncWriter
 
 from documents.models import CustomFieldInstance
 from documents.models import Document
-from documents.models import Note
 from documents.models import User
 
 logger = logging.getLogger("paperless.index")
@@ -123,16 +129,64 @@ def open_index_searcher() -> Searcher:
         searcher.close()
 
 
-def update_document(writer: AsyncWriter, doc: Document):
+# The relations read by update_document, to be prefetched when many documents
+# are indexed at once
+INDEX_SELECT_RELATED = ("correspondent", "document_type", "storage_path", "owner")
+INDEX_PREFETCH_RELATED = (
+    "tags",
+    "notes",
+    Prefetch(
+        "custom_fields",
+        queryset=CustomFieldInstance.objects.select_related("field"),
+    ),
+)
+
+
+def get_viewer_ids(document_ids: Iterable[int]) -> dict[int, list[int]]:
+    """
+    Returns the users allowed to view each of the documents, directly or
+    through one of their groups, with a few queries for all documents
+    """
+    object_pks = [str(document_id) for document_id in document_ids]
+    ctype = ContentType.objects.get_for_model(Document)
+    permission = Permission.objects.get(content_type=ctype, codename="view_document")
+
+    viewers: dict[int, set[int]] = defaultdict(set)
+    for object_pk, user_id in UserObjectPermission.objects.filter(
+        content_type=ctype,
+        permission=permission,
+        object_pk__in=object_pks,
+    ).values_list("object_pk", "user_id"):
+        viewers[int(object_pk)].add(user_id)
+
+    group_pks: dict[int, list[int]] = defaultdict(list)
+    for object_pk, group_id in GroupObjectPermission.objects.filter(
+        content_type=ctype,
+        permission=permission,
+        object_pk__in=object_pks,
+    ).values_list("object_pk", "group_id"):
+        group_pks[group_id].append(int(object_pk))
+
+    if group_pks:
+        for group_id, user_id in User.groups.through.objects.filter(
+            group_id__in=group_pks,
+        ).values_list("group_id", "user_id"):
+            for object_pk in group_pks[group_id]:
+                viewers[object_pk].add(user_id)
+
+    return {object_pk: sorted(user_ids) for object_pk, user_ids in viewers.items()}
+
+
+def update_document(
+    writer: AsyncWriter,
+    doc: Document,
+    viewer_ids: Optional[list[int]] = None,
+):
     tags = ",".join([t.name for t in doc.tags.all()])
     tags_ids = ",".join([str(t.id) for t in doc.tags.all()])
-    notes = ",".join([str(c.note) for c in Note.objects.filter(document=doc)])
-    custom_fields = ",".join(
-        [str(c) for c in CustomFieldInstance.objects.filter(document=doc)],
-    )
-    custom_fields_ids = ",".join(
-        [str(f.field.id) for f in CustomFieldInstance.objects.filter(document=doc)],
-    )
+    notes = ",".join([str(c.note) for c in doc.notes.all()])
+    custom_fields = ",".join([str(c) for c in doc.custom_fields.all()])
+    custom_fields_ids = ",".join([str(f.field.id) for f in doc.custom_fields.all()])
     asn = doc.archive_serial_number
     if asn is not None and (
         asn < Document.ARCHIVE_SERIAL_NUMBER_MIN
@@ -145,11 +199,12 @@ def update_document(writer: AsyncWriter, doc: Document):
             f"{Document.ARCHIVE_SERIAL_NUMBER_MAX:,}.",
         )
         asn = 0
-    users_with_perms = get_users_with_perms(
-        doc,
-        only_with_perms_in=["view_document"],
-    )
-    viewer_ids = ",".join([str(u.id) for u in users_with_perms])
+    if viewer_ids is None:
+        viewer_ids = [
+            u.id
+            for u in get_users_with_perms(doc, only_with_perms_in=["view_document"])
+        ]
+    viewer_ids = ",".join([str(u) for u in viewer_ids])
     writer.update_document(
         id=doc.pk,
         title=doc.title,
@@ -186,6 +241,17 @@ def update_document(writer: AsyncWriter, doc: Document):
     )
 
 
+def update_documents(writer: AsyncWriter, documents: list[Document]):
+    """
+    Indexes many documents at once.  Load the documents with
+    INDEX_SELECT_RELATED and INDEX_PREFETCH_RELATED, so they are read with a
+    few queries.
+    """
+    viewer_ids = get_viewer_ids([doc.pk for doc in documents])
+    for doc in documents:
+        update_document(writer, doc, viewer_ids.get(doc.pk, []))
+
+
 def remove_document(writer: AsyncWriter, doc: Document):
     remove_document_by_id(writer, doc.pk)
 
@@ -0,0 +1,76 @@
+"""
+File locks for changes to the files of documents, shared by all processes on
+the host.
+
+Instead of a single lock for the whole media directory, changes lock the
+documents whose files they touch and the paths they create files at, so
+workers handling unrelated documents don't wait for each other.  Locks are
+striped over a fixed number of lock files, and to avoid deadlocks they are
+always acquired in the same order: document locks before path locks, and
+within each kind by the number of the lock file.  Acquire all the document
+locks an operation needs at once, and don't lock further documents while
+holding path locks.
+"""
+
+import hashlib
+import os
+from collections.abc import Iterable
+from collections.abc import Iterator
+from contextlib import ExitStack
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Final
+from typing import Union
+
+from django.conf import settings
+from filelock import FileLock
+
+LOCK_STRIPES: Final[int] = 256
+
+
+def _lock_file(kind: str, stripe: int) -> Path:
+    return Path(settings.SCRATCH_DIR) / "media-locks" / f"{kind}-{stripe:03}.lock"
+
+
+def _path_stripe(path: Union[str, Path]) -> int:
+    key = os.path.normcase(os.path.abspath(path)).encode()
+    digest = hashlib.blake2b(key, digest_size=4).digest()
+    return int.from_bytes(digest, "big") % LOCK_STRIPES
+
+
+@contextmanager
+def _acquire(kind: str, stripes: Iterable[int]) -> Iterator[None]:
+    with ExitStack() as stack:
+        for stripe in sorted(set(stripes)):
+            # Singletons make the locks reentrant within a thread, while
+            # other threads still wait for them
+            stack.enter_context(FileLock(_lock_file(kind, stripe), is_singleton=True))
+        yield
+
+
+@contextmanager
+def lock_documents(*document_ids: int) -> Iterator[None]:
+    """
+    Locks the files of the given documents
+    """
+    with _acquire("document", (pk % LOCK_STRIPES for pk in document_ids)):
+        yield
+
+
+@contextmanager
+def lock_paths(*paths: Union[str, Path]) -> Iterator[None]:
+    """
+    Locks the given paths, for creating files at them
+    """
+    with _acquire("path", (_path_stripe(path) for path in paths if path)):
+        yield
+
+
+@contextmanager
+def lock_media() -> Iterator[None]:
+    """
+    Locks the files of all documents, to prevent any changes to the media
+    directory
+    """
+    with FileLock(settings.MEDIA_LOCK), _acquire("document", range(LOCK_STRIPES)):
+        yield
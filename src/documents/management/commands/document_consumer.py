@@ -1,27 +1,38 @@
+import heapq
+import itertools
 import logging
 import os
-from concurrent.futures import ThreadPoolExecutor
-from fnmatch import filter
+from collections.abc import Iterator
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from pathlib import PurePath
+from queue import Queue
+from threading import Condition
 from threading import Event
+from threading import Thread
 from time import monotonic
 from time import sleep
 from typing import Final
+from typing import Optional
 
 from django import db
 from django.conf import settings
+from django.core.cache import cache
 from django.core.management.base import BaseCommand
 from django.core.management.base import CommandError
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers.polling import PollingObserver
 
+from documents.caching import get_consumer_journal_key
+from documents.caching import set_consumer_metrics
 from documents.data_models import ConsumableDocument
 from documents.data_models import DocumentMetadataOverrides
 from documents.data_models import DocumentSource
 from documents.models import Tag
 from documents.parsers import is_file_ext_supported
 from documents.tasks import consume_file
+from documents.utils import PathPatternMatcher
 
 try:
     from inotifyrecursive import INotify
@@ -31,6 +42,20 @@ except ImportError:  # pragma: no cover
 
 logger = logging.getLogger("paperless.management.consumer")
 
+# The number of threads queueing consume tasks for files which are ready
+CONSUME_THREADS: Final[int] = 4
+# The number of ready files waiting for these threads, before the watcher
+# waits for them
+CONSUME_QUEUE_SIZE: Final[int] = 1000
+# How often the metrics of the consumer are published, in seconds
+METRICS_INTERVAL: Final[float] = 10.0
+# Files queued within this many seconds are not queued again when the
+# consumer starts, unless they changed or their task is done already
+JOURNAL_TIMEOUT: Final[int] = 24 * 60 * 60
+# The number of files found when the consumer starts which are checked
+# against the journal at once
+SCAN_BATCH_SIZE: Final[int] = 500
+
 
 def _tags_from_path(filepath) -> list[int]:
     """
@@ -50,6 +75,11 @@ def _tags_from_path(filepath) -> list[int]:
     return list(tag_ids)
 
 
+@lru_cache(maxsize=4)
+def _ignore_matcher(patterns: tuple[str, ...]) -> PathPatternMatcher:
+    return PathPatternMatcher(patterns)
+
+
 def _is_ignored(filepath: str) -> bool:
     """
     Checks if the given file should be ignored, based on configured
@@ -65,24 +95,73 @@ def _is_ignored(filepath: str) -> bool:
     # path relative to the consume directory
     filepath_relative = PurePath(filepath).relative_to(settings.CONSUMPTION_DIR)
 
-    # March through the components of the path, including directories and the filename
-    # looking for anything matching
-    # foo/bar/baz/file.pdf -> (foo, bar, baz, file.pdf)
-    parts = []
-    for part in filepath_relative.parts:
-        # If the part is not the name (ie, it's a dir)
-        # Need to append the trailing slash or fnmatch doesn't match
-        # fnmatch("dir", "dir/*") == False
-        # fnmatch("dir/", "dir/*") == True
-        if part != filepath_relative.name:
-            part = part + "/"
-        parts.append(part)
-
-    for pattern in settings.CONSUMER_IGNORE_PATTERNS:
-        if len(filter(parts, pattern)):
-            return True
+    return _ignore_matcher(tuple(settings.CONSUMER_IGNORE_PATTERNS)).matches(
+        filepath_relative,
+    )
+
 
-    return False
+def _journal_value(stat_data: os.stat_result) -> str:
+    return f"{stat_data.st_size}:{stat_data.st_mtime_ns}"
+
+
+def _scan(directory: str, recursive: bool) -> Iterator[os.DirEntry]:
+    """
+    Yields the files of the directory, and of its subdirectories if recursive.
+    Like os.walk, symbolic links to directories are not followed.
+    """
+    subdirectories = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_dir():
+                yield entry
+            elif recursive and not entry.is_symlink():
+                subdirectories.append(entry.path)
+
+    for subdirectory in subdirectories:
+        yield from _scan(subdirectory, recursive)
+
+
+def _not_queued(batch: dict[str, tuple[str, str]]) -> Iterator[str]:
+    """
+    Yields the files of the batch which were not queued before in the same
+    state, according to the journal
+    """
+    if not batch:
+        return
+    queued = cache.get_many(list(batch))
+    for key, (filepath, value) in batch.items():
+        if queued.get(key) == value:
+            logger.debug(f"Not consuming file {filepath}: Already queued.")
+        else:
+            yield filepath
+
+
+def _files_to_consume(directory: str, recursive: bool) -> Iterator[str]:
+    """
+    Yields the files found in the consumption directory which may be consumed.
+    Files which were queued before, such as when the consumer restarts on a
+    large backlog, are skipped, if they did not change since.
+    """
+    batch: dict[str, tuple[str, str]] = {}
+    for entry in _scan(directory, recursive):
+        if _is_ignored(entry.path):
+            continue
+        if not is_file_ext_supported(os.path.splitext(entry.name)[1]):
+            logger.warning(f"Not consuming file {entry.path}: Unknown file extension.")
+            continue
+        try:
+            batch[get_consumer_journal_key(entry.path)] = (
+                entry.path,
+                _journal_value(entry.stat()),
+            )
+        except FileNotFoundError:
+            continue
+
+        if len(batch) >= SCAN_BATCH_SIZE:
+            yield from _not_queued(batch)
+            batch = {}
+
+    yield from _not_queued(batch)
 
 
 def _consume(filepath: str) -> None:
@@ -118,6 +197,12 @@ def _consume(filepath: str) -> None:
         logger.warning(f"Not consuming file {filepath}: OS reports {os_error_str}")
         return
 
+    try:
+        stat_data = os.stat(filepath)
+    except FileNotFoundError:
+        logger.debug(f"Not consuming file {filepath}: File has moved.")
+        return
+
     tag_ids = None
     try:
         if settings.CONSUMER_SUBDIRS_AS_TAGS:
@@ -139,53 +224,248 @@ def _consume(filepath: str) -> None:
         # This is also what the test case is listening for to check for
         # errors.
         logger.exception("Error while consuming document")
+        return
+
+    try:
+        cache.set(
+            get_consumer_journal_key(filepath),
+            _journal_value(stat_data),
+            JOURNAL_TIMEOUT,
+        )
+    except Exception as e:  # pragma: no cover
+        logger.debug(f"Unable to record queued file {filepath}: {e}")
+
 
+@dataclass
+class _PendingFile:
+    # The heap entry of the file, others are outdated
+    sequence: int
+    # Size and modification time when the file was last checked
+    stat: Optional[tuple[int, float]] = None
+    checks: int = 0
 
-def _consume_wait_unmodified(file: str) -> None:
+
+class PendingFiles:
     """
-    Waits for the given file to appear unmodified based on file size
-    and modification time.  Will wait a configured number of seconds
-    and retry a configured number of times before either consuming or
-    giving up
+    The files waiting to remain unmodified before they are consumed.  All
+    files are kept in a single heap ordered by when they are checked next, so
+    waiting on thousands of files needs neither a thread per file nor checking
+    every file whenever one of them changes.
+
+    With a retry count, a file is ready once its size and modification time
+    stay the same between two checks, delay seconds apart.  Otherwise, a file
+    is ready delay seconds after its last event, if it still exists.
     """
-    if _is_ignored(file):
-        return
 
-    logger.debug(f"Waiting for file {file} to remain unmodified")
-    mtime = -1
-    size = -1
-    current_try = 0
-    while current_try < settings.CONSUMER_POLLING_RETRY_COUNT:
+    def __init__(self, delay: float, retry_count: Optional[int] = None) -> None:
+        self._delay = delay
+        self._retry_count = retry_count
+        self._heap: list[tuple[float, int, str]] = []
+        self._files: dict[str, _PendingFile] = {}
+        self._sequence = itertools.count()
+        self._condition = Condition()
+        # Total number of files which remained unmodified
+        self.debounced = 0
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def add(self, path: str) -> None:
+        """
+        Starts or restarts waiting for the file
+        """
+        with self._condition:
+            sequence = next(self._sequence)
+            self._files[path] = _PendingFile(sequence)
+            # Polled files are checked right away, to learn their size
+            delay = 0 if self._retry_count is not None else self._delay
+            self._schedule(path, sequence, monotonic() + delay)
+            self._condition.notify()
+
+    def discard(self, path: str) -> None:
+        with self._condition:
+            self._files.pop(path, None)
+
+    def _schedule(self, path: str, sequence: int, due: float) -> None:
+        heapq.heappush(self._heap, (due, sequence, path))
+        # Restarted files leave outdated entries behind, drop them before the
+        # heap grows much larger than the number of files
+        if len(self._heap) > 4 * len(self._files) + 64:
+            self._heap = [
+                entry
+                for entry in self._heap
+                if (file := self._files.get(entry[2])) is not None
+                and file.sequence == entry[1]
+            ]
+            heapq.heapify(self._heap)
+
+    def _check(self, path: str, file: _PendingFile) -> Optional[bool]:
+        """
+        Returns True if the file is ready, False if it is dropped, or None if
+        it has to be checked again
+        """
+        if self._retry_count is None:
+            # Some scanners write a temporary file first
+            return os.path.isfile(path)
+
         try:
-            stat_data = os.stat(file)
-            new_mtime = stat_data.st_mtime
-            new_size = stat_data.st_size
+            stat_data = os.stat(path)
         except FileNotFoundError:
             logger.debug(
-                f"File {file} moved while waiting for it to remain unmodified.",
+                f"File {path} moved while waiting for it to remain unmodified.",
             )
-            return
-        if new_mtime == mtime and new_size == size:
-            _consume(file)
-            return
-        mtime = new_mtime
-        size = new_size
-        sleep(settings.CONSUMER_POLLING_DELAY)
-        current_try += 1
+            return False
 
-    logger.error(f"Timeout while waiting on file {file} to remain unmodified.")
+        stat = (stat_data.st_size, stat_data.st_mtime)
+        if stat == file.stat:
+            return True
+
+        file.stat = stat
+        file.checks += 1
+        if file.checks >= self._retry_count:
+            logger.error(f"Timeout while waiting on file {path} to remain unmodified.")
+            return False
+        return None
+
+    def pop_ready(self) -> list[str]:
+        """
+        Checks the files which are due, and returns those which are ready
+        """
+        ready = []
+        with self._condition:
+            now = monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                _, sequence, path = heapq.heappop(self._heap)
+                file = self._files.get(path)
+                if file is None or file.sequence != sequence:
+                    continue
+
+                result = self._check(path, file)
+                if result is None:
+                    self._schedule(path, sequence, now + self._delay)
+                    continue
+
+                del self._files[path]
+                if result:
+                    ready.append(path)
+
+            self.debounced += len(ready)
+        return ready
+
+    def next_timeout(self) -> Optional[float]:
+        """
+        Seconds until the next file is due, or None if no file is waiting
+        """
+        with self._condition:
+            while self._heap:
+                _, sequence, path = self._heap[0]
+                file = self._files.get(path)
+                if file is not None and file.sequence == sequence:
+                    return max(self._heap[0][0] - monotonic(), 0)
+                heapq.heappop(self._heap)
+            return None
+
+    def wait(self, timeout: Optional[float]) -> None:
+        """
+        Waits for the next file to be due or added, at most timeout seconds
+        """
+        with self._condition:
+            next_timeout = self.next_timeout()
+            if next_timeout is not None and (timeout is None or next_timeout < timeout):
+                timeout = next_timeout
+            if timeout is None or timeout > 0:
+                self._condition.wait(timeout)
+
+
+class ConsumeQueue:
+    """
+    Hands files which are ready to a few threads, which queue their consume
+    tasks.  The queue is bounded, so a burst of files holds back the watcher
+    instead of piling up.
+    """
+
+    _STOP: Final = object()
+
+    def __init__(
+        self,
+        threads: int = CONSUME_THREADS,
+        maxsize: int = CONSUME_QUEUE_SIZE,
+    ) -> None:
+        self._queue: Queue = Queue(maxsize=maxsize)
+        self._threads = [
+            Thread(target=self._run, name=f"consumer-{i}", daemon=True)
+            for i in range(threads)
+        ]
+        # Total number of files handed to the threads
+        self.queued = 0
+        for thread in self._threads:
+            thread.start()
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    def put(self, path: str) -> None:
+        self._queue.put(path)
+        self.queued += 1
+
+    def _run(self) -> None:
+        while (path := self._queue.get()) is not self._STOP:
+            try:
+                _consume(path)
+            except Exception:  # pragma: no cover
+                # Catch all so that the thread won't stop
+                logger.exception(f"Error while consuming {path}")
+        db.connections.close_all()
+
+    def close(self) -> None:
+        """
+        Waits for the queued files to be handled, then stops the threads
+        """
+        for _ in self._threads:
+            self._queue.put(self._STOP)
+        for thread in self._threads:
+            thread.join()
+
+
+class _MetricsPublisher:
+    def __init__(self, pending: PendingFiles, queue: ConsumeQueue) -> None:
+        self._pending = pending
+        self._queue = queue
+        self._published: Optional[float] = None
+
+    def publish(self) -> None:
+        now = monotonic()
+        if self._published is not None and now - self._published < METRICS_INTERVAL:
+            return
+        self._published = now
+        try:
+            set_consumer_metrics(
+                {
+                    "pending": len(self._pending),
+                    "debounced": self._pending.debounced,
+                    "waiting": len(self._queue),
+                    "queued": self._queue.queued,
+                },
+            )
+        except Exception as e:  # pragma: no cover
+            logger.debug(f"Unable to publish consumer metrics: {e}")
 
 
 class Handler(FileSystemEventHandler):
-    def __init__(self, pool: ThreadPoolExecutor) -> None:
+    def __init__(self, pending: PendingFiles) -> None:
         super().__init__()
-        self._pool = pool
+        self._pending = pending
+
+    def _add(self, path: str) -> None:
+        if not _is_ignored(path):
+            logger.debug(f"Waiting for file {path} to remain unmodified")
+            self._pending.add(path)
 
     def on_created(self, event):
-        self._pool.submit(_consume_wait_unmodified, event.src_path)
+        self._add(event.src_path)
 
     def on_moved(self, event):
-        self._pool.submit(_consume_wait_unmodified, event.dest_path)
+        self._add(event.dest_path)
 
 
 class Command(BaseCommand):
@@ -235,28 +515,34 @@ class Command(BaseCommand):
         # Consumer will need this
         settings.SCRATCH_DIR.mkdir(parents=True, exist_ok=True)
 
-        if recursive:
-            for dirpath, _, filenames in os.walk(directory):
-                for filename in filenames:
-                    filepath = os.path.join(dirpath, filename)
-                    _consume(filepath)
-        else:
-            for entry in os.scandir(directory):
-                _consume(entry.path)
+        # Files already in the directory are handled by the same threads as
+        # new files, while the directory is still being scanned
+        queue = ConsumeQueue()
+        for filepath in _files_to_consume(directory, recursive):
+            queue.put(filepath)
+        logger.debug(f"Found {queue.queued} files to consume in {directory}")
 
         if options["oneshot"]:
+            queue.close()
             return
 
         if settings.CONSUMER_POLLING == 0 and INotify:
-            self.handle_inotify(directory, recursive, options["testing"])
+            self.handle_inotify(directory, recursive, options["testing"], queue)
         else:
             if INotify is None and settings.CONSUMER_POLLING == 0:  # pragma: no cover
                 logger.warn("Using polling as INotify import failed")
-            self.handle_polling(directory, recursive, options["testing"])
+            self.handle_polling(directory, recursive, options["testing"], queue)
 
+        queue.close()
         logger.debug("Consumer exiting.")
 
-    def handle_polling(self, directory, recursive, is_testing: bool):
+    def handle_polling(
+        self,
+        directory,
+        recursive,
+        is_testing: bool,
+        queue: ConsumeQueue,
+    ):
         logger.info(f"Polling directory for changes: {directory}")
 
         timeout = None
@@ -270,20 +556,34 @@ class Command(BaseCommand):
             logger.warn("Using polling of 10s, consider setting this")
             polling_interval = 10
 
-        with ThreadPoolExecutor(max_workers=4) as pool:
-            observer = PollingObserver(timeout=polling_interval)
-            observer.schedule(Handler(pool), directory, recursive=recursive)
-            observer.start()
-            try:
-                while observer.is_alive():
-                    observer.join(timeout)
-                    if self.stop_flag.is_set():
-                        observer.stop()
-            except KeyboardInterrupt:
-                observer.stop()
-            observer.join()
+        pending = PendingFiles(
+            settings.CONSUMER_POLLING_DELAY,
+            retry_count=settings.CONSUMER_POLLING_RETRY_COUNT,
+        )
+        metrics = _MetricsPublisher(pending, queue)
 
-    def handle_inotify(self, directory, recursive, is_testing: bool):
+        observer = PollingObserver(timeout=polling_interval)
+        observer.schedule(Handler(pending), directory, recursive=recursive)
+        observer.start()
+        try:
+            while observer.is_alive():
+                pending.wait(timeout if timeout is not None else METRICS_INTERVAL)
+                for filepath in pending.pop_ready():
+                    queue.put(filepath)
+                metrics.publish()
+                if self.stop_flag.is_set():
+                    observer.stop()
+        except KeyboardInterrupt:
+            observer.stop()
+        observer.join()
+
+    def handle_inotify(
+        self,
+        directory,
+        recursive,
+        is_testing: bool,
+        queue: ConsumeQueue,
+    ):
         logger.info(f"Using inotify to watch directory for changes: {directory}")
 
         timeout_ms = None
@@ -298,56 +598,38 @@ class Command(BaseCommand):
         else:
             descriptor = inotify.add_watch(directory, inotify_flags)
 
-        inotify_debounce_secs: Final[float] = settings.CONSUMER_INOTIFY_DELAY
-        inotify_debounce_ms: Final[int] = inotify_debounce_secs * 1000
+        pending = PendingFiles(settings.CONSUMER_INOTIFY_DELAY)
+        metrics = _MetricsPublisher(pending, queue)
 
         finished = False
 
-        notified_files = {}
-
         while not finished:
             try:
                 for event in inotify.read(timeout=timeout_ms):
                     path = inotify.get_path(event.wd) if recursive else directory
                     filepath = os.path.join(path, event.name)
                     if flags.MODIFY in flags.from_mask(event.mask):
-                        notified_files.pop(filepath, None)
-                    else:
-                        notified_files[filepath] = monotonic()
-
-                # Check the files against the timeout
-                still_waiting = {}
-                for filepath in notified_files:
-                    # Time of the last inotify event for this file
-                    last_event_time = notified_files[filepath]
-
-                    # Current time - last time over the configured timeout
-                    waited_long_enough = (
-                        monotonic() - last_event_time
-                    ) > inotify_debounce_secs
-
-                    # Also make sure the file exists still, some scanners might write a
-                    # temporary file first
-                    file_still_exists = os.path.exists(filepath) and os.path.isfile(
-                        filepath,
-                    )
-
-                    if waited_long_enough and file_still_exists:
-                        _consume(filepath)
-                    elif file_still_exists:
-                        still_waiting[filepath] = last_event_time
-
-                # These files are still waiting to hit the timeout
-                notified_files = still_waiting
-
-                # If files are waiting, need to exit read() to check them
-                # Otherwise, go back to infinite sleep time, but only if not testing
-                if len(notified_files) > 0:
-                    timeout_ms = inotify_debounce_ms
+                        # Wait for the file to be closed
+                        pending.discard(filepath)
+                    elif not _is_ignored(filepath):
+                        pending.add(filepath)
+
+                # Only the files which waited long enough are checked
+                for filepath in pending.pop_ready():
+                    queue.put(filepath)
+
+                metrics.publish()
+
+                # If files are waiting, need to exit read() when the next one
+                # is due.  Otherwise, go back to a long sleep, but only if not
+                # testing
+                next_timeout = pending.next_timeout()
+                if next_timeout is not None:
+                    timeout_ms = next_timeout * 1000
                 elif is_testing:
                     timeout_ms = self.testing_timeout_ms
                 else:
-                    timeout_ms = None
+                    timeout_ms = METRICS_INTERVAL * 1000
 
                 if self.stop_flag.is_set():
                     logger.debug("Finishing because event is set")
@@ -1,4 +1,3 @@
-import hashlib
 import json
 import os
 import shutil
@@ -19,7 +18,6 @@ from django.core.management.base import BaseCommand
 from django.core.management.base import CommandError
 from django.db import transaction
 from django.utils import timezone
-from filelock import FileLock
 from guardian.models import GroupObjectPermission
 from guardian.models import UserObjectPermission
 
@@ -31,6 +29,7 @@ if settings.AUDIT_LOG_ENABLED:
 
 from documents.file_handling import delete_empty_directories
 from documents.file_handling import generate_filename
+from documents.locks import lock_media
 from documents.management.commands.mixins import CryptMixin
 from documents.models import Correspondent
 from documents.models import CustomField
@@ -49,6 +48,7 @@ from documents.models import WorkflowTrigger
 from documents.settings import EXPORTER_ARCHIVE_NAME
 from documents.settings import EXPORTER_FILE_NAME
 from documents.settings import EXPORTER_THUMBNAIL_NAME
+from documents.utils import compute_checksum
 from documents.utils import copy_file_with_basic_stats
 from paperless import version
 from paperless.db import GnuPG
@@ -211,7 +211,7 @@ class Command(CryptMixin, BaseCommand):
 
         try:
             # Prevent any ongoing changes in the documents
-            with FileLock(settings.MEDIA_LOCK):
+            with lock_media():
                 self.dump()
 
                 # We've written everything to the temporary directory in this case,
@@ -530,7 +530,7 @@ class Command(CryptMixin, BaseCommand):
             source_stat = os.stat(source)
             target_stat = target.stat()
             if self.compare_checksums and source_checksum:
-                target_checksum = hashlib.md5(target.read_bytes()).hexdigest()
+                target_checksum = compute_checksum(target)
                 perform_copy = target_checksum != source_checksum
             elif (
                 source_stat.st_mtime != target_stat.st_mtime
@@ -2,6 +2,7 @@ import json
 import logging
 import os
 from contextlib import contextmanager
+from contextlib import nullcontext
 from pathlib import Path
 from typing import Optional
 
@@ -19,17 +20,12 @@ from django.db import IntegrityError
 from django.db import transaction
 from django.db.models.signals import m2m_changed
 from django.db.models.signals import post_save
-from filelock import FileLock
 
 from documents.file_handling import create_source_path_directory
+from documents.locks import lock_documents
+from documents.locks import lock_paths
 from documents.management.commands.mixins import CryptMixin
-from documents.models import Correspondent
-from documents.models import CustomField
-from documents.models import CustomFieldInstance
 from documents.models import Document
-from documents.models import DocumentType
-from documents.models import Note
-from documents.models import Tag
 from documents.parsers import run_convert
 from documents.settings import EXPORTER_ARCHIVE_NAME
 from documents.settings import EXPORTER_CRYPTO_SETTINGS_NAME
@@ -40,7 +36,7 @@ from documents.utils import copy_file_with_basic_stats
 from paperless import version
 
 if settings.AUDIT_LOG_ENABLED:
-    from auditlog.registry import auditlog
+    from auditlog.context import disable_auditlog
 
 
 @contextmanager
@@ -254,16 +250,8 @@ class Command(CryptMixin, BaseCommand):
                 receiver=update_filename_and_move_files,
                 sender=Document.tags.through,
             ),
+            disable_auditlog() if settings.AUDIT_LOG_ENABLED else nullcontext(),
         ):
-            if settings.AUDIT_LOG_ENABLED:
-                auditlog.unregister(Document)
-                auditlog.unregister(Correspondent)
-                auditlog.unregister(Tag)
-                auditlog.unregister(DocumentType)
-                auditlog.unregister(Note)
-                auditlog.unregister(CustomField)
-                auditlog.unregister(CustomFieldInstance)
-
             # Fill up the database with whatever is in the manifest
             self.load_data_to_database()
 
@@ -361,7 +349,10 @@ class Command(CryptMixin, BaseCommand):
 
             document.storage_type = Document.STORAGE_TYPE_UNENCRYPTED
 
-            with FileLock(settings.MEDIA_LOCK):
+            with (
+                lock_documents(document.pk),
+                lock_paths(document.source_path, document.archive_path),
+            ):
                 if os.path.isfile(document.source_path):
                     raise FileExistsError(document.source_path)
 
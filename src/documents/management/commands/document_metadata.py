@@ -0,0 +1,92 @@
+import logging
+import multiprocessing
+
+import tqdm
+from django import db
+from django.core.management.base import BaseCommand
+from django.db.models import Exists
+from django.db.models import OuterRef
+from django.db.models import Q
+
+from documents.management.commands.mixins import MultiProcessMixin
+from documents.management.commands.mixins import ProgressBarMixin
+from documents.metadata import update_document_metadata
+from documents.models import Document
+from documents.models import DocumentMetadata
+
+
+def _process_document(doc_id):
+    document: Document = Document.objects.get(id=doc_id)
+    update_document_metadata(document)
+
+
+class Command(MultiProcessMixin, ProgressBarMixin, BaseCommand):
+    help = (
+        "Extracts and stores the metadata and the language of documents, which "
+        "were consumed before these were stored or whose files changed since."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-d",
+            "--document",
+            default=None,
+            type=int,
+            required=False,
+            help=(
+                "Specify the ID of a document, and this command will only "
+                "run on this specific document."
+            ),
+        )
+        parser.add_argument(
+            "--overwrite",
+            default=False,
+            action="store_true",
+            help="Extract the metadata of all documents, even if it is stored already.",
+        )
+        self.add_argument_progress_bar_mixin(parser)
+        self.add_argument_processes_mixin(parser)
+
+    def handle(self, *args, **options):
+        logging.getLogger().handlers[0].level = logging.ERROR
+
+        self.handle_processes_mixin(**options)
+        self.handle_progress_bar_mixin(**options)
+
+        if options["document"]:
+            documents = Document.objects.filter(pk=options["document"])
+        else:
+            documents = Document.objects.all()
+
+        if not options["overwrite"]:
+            # Skip documents with metadata of their current files
+            stored = DocumentMetadata.objects.filter(
+                Q(archive_checksum=OuterRef("archive_checksum"))
+                | Q(
+                    archive_checksum__isnull=True,
+                    document__archive_checksum__isnull=True,
+                ),
+                document=OuterRef("pk"),
+                original_checksum=OuterRef("checksum"),
+            )
+            documents = documents.exclude(Exists(stored))
+
+        ids = list(documents.values_list("id", flat=True))
+
+        # Note to future self: this prevents django from reusing database
+        # connections between processes, which is bad and does not work
+        # with postgres.
+        db.connections.close_all()
+
+        if self.process_count == 1:
+            for doc_id in tqdm.tqdm(ids, disable=self.no_progress_bar):
+                _process_document(doc_id)
+        else:  # pragma: no cover
+            with multiprocessing.Pool(processes=self.process_count) as pool:
+                list(
+                    tqdm.tqdm(
+                        pool.imap_unordered(_process_document, ids),
+                        total=len(ids),
+                        disable=self.no_progress_bar,
+                    ),
+                )
@@ -1,6 +1,7 @@
 import logging
 import multiprocessing
 import shutil
+from functools import partial
 
 import tqdm
 from django import db
@@ -10,9 +11,35 @@ from documents.management.commands.mixins import MultiProcessMixin
 from documents.management.commands.mixins import ProgressBarMixin
 from documents.models import Document
 from documents.parsers import get_parser_class_for_mime_type
+from documents.previews import PAGE_PREVIEW_SIZES
+from documents.previews import THUMBNAIL_SIZES
+from documents.previews import PreviewUnavailableError
+from documents.previews import get_page_preview_path
+from documents.previews import get_thumbnail_path
 
 
-def _process_document(doc_id):
+def _create_previews(document: Document, pages: bool):
+    if document.storage_type == Document.STORAGE_TYPE_GPG:
+        return
+
+    for size in THUMBNAIL_SIZES:
+        get_thumbnail_path(document, size, refresh=True)
+
+    if not pages:
+        return
+
+    for size in PAGE_PREVIEW_SIZES:
+        page = 1
+        while True:
+            try:
+                get_page_preview_path(document, page, size)
+            except (IndexError, PreviewUnavailableError):
+                # End of the document, or no more pages can be rendered
+                break
+            page += 1
+
+
+def _process_document(doc_id, pages=False):
     document: Document = Document.objects.get(id=doc_id)
     parser_class = get_parser_class_for_mime_type(document.mime_type)
 
@@ -30,6 +57,8 @@ def _process_document(doc_id):
         )
 
         shutil.move(thumb, document.thumbnail_path)
+
+        _create_previews(document, pages)
     finally:
         parser.cleanup()
 
@@ -49,6 +78,15 @@ class Command(MultiProcessMixin, ProgressBarMixin, BaseCommand):
                 "run on this specific document."
             ),
         )
+        parser.add_argument(
+            "--pages",
+            default=False,
+            action="store_true",
+            help=(
+                "Also render the previews of all pages, instead of rendering "
+                "them when they are first requested."
+            ),
+        )
         self.add_argument_progress_bar_mixin(parser)
         self.add_argument_processes_mixin(parser)
 
@@ -70,14 +108,16 @@ class Command(MultiProcessMixin, ProgressBarMixin, BaseCommand):
         # with postgres.
         db.connections.close_all()
 
+        process_document = partial(_process_document, pages=options["pages"])
+
         if self.process_count == 1:
             for doc_id in ids:
-                _process_document(doc_id)
+                process_document(doc_id)
         else:  # pragma: no cover
             with multiprocessing.Pool(processes=self.process_count) as pool:
                 list(
                     tqdm.tqdm(
-                        pool.imap_unordered(_process_document, ids),
+                        pool.imap_unordered(process_document, ids),
                         total=len(ids),
                         disable=self.no_progress_bar,
                     ),
@@ -1,6 +1,8 @@
 import logging
 import re
+from collections.abc import Collection
 from fnmatch import fnmatch
+from typing import Optional
 from typing import Union
 
 from documents.classifier import DocumentClassifier
@@ -15,6 +17,9 @@ from documents.models import Tag
 from documents.models import Workflow
 from documents.models import WorkflowTrigger
 from documents.permissions import get_objects_for_user_owner_aware
+from documents.workflows import WorkflowPlan
+from documents.workflows import WorkflowTriggerPlan
+from documents.workflows import compile_workflow
 
 logger = logging.getLogger("paperless.matching")
 
@@ -128,102 +133,127 @@ def match_storage_paths(document: Document, classifier: DocumentClassifier, user
     )
 
 
-def matches(matching_model: MatchingModel, document: Document):
-    search_kwargs = {}
-
-    document_content = document.content
+class ContentMatcher:
+    """
+    The match of a matching model, compiled once so that it can be tested
+    against the content of many documents
+    """
 
-    # Check that match is not empty
-    if not matching_model.match.strip():
-        return False
+    def __init__(self, matching_model: Union[MatchingModel, WorkflowTrigger]):
+        self.matching_model = matching_model
+        self.algorithm = matching_model.matching_algorithm
+        self.patterns: tuple[tuple[str, re.Pattern], ...] = ()
+        self.fuzzy_match: Optional[str] = None
 
-    if matching_model.is_insensitive:
-        search_kwargs = {"flags": re.IGNORECASE}
+        # Check that match is not empty
+        if not matching_model.match.strip():
+            self.algorithm = MatchingModel.MATCH_NONE
+            return
 
-    if matching_model.matching_algorithm == MatchingModel.MATCH_NONE:
-        return False
+        flags = re.IGNORECASE if matching_model.is_insensitive else 0
 
-    elif matching_model.matching_algorithm == MatchingModel.MATCH_ALL:
-        for word in _split_match(matching_model):
-            search_result = re.search(rf"\b{word}\b", document_content, **search_kwargs)
-            if not search_result:
-                return False
-        log_reason(
-            matching_model,
-            document,
-            f"it contains all of these words: {matching_model.match}",
-        )
-        return True
-
-    elif matching_model.matching_algorithm == MatchingModel.MATCH_ANY:
-        for word in _split_match(matching_model):
-            if re.search(rf"\b{word}\b", document_content, **search_kwargs):
-                log_reason(matching_model, document, f"it contains this word: {word}")
-                return True
-        return False
-
-    elif matching_model.matching_algorithm == MatchingModel.MATCH_LITERAL:
-        result = bool(
-            re.search(
-                rf"\b{re.escape(matching_model.match)}\b",
-                document_content,
-                **search_kwargs,
-            ),
-        )
-        if result:
-            log_reason(
-                matching_model,
-                document,
-                f'it contains this string: "{matching_model.match}"',
-            )
-        return result
-
-    elif matching_model.matching_algorithm == MatchingModel.MATCH_REGEX:
-        try:
-            match = re.search(
-                re.compile(matching_model.match, **search_kwargs),
-                document_content,
+        if self.algorithm in {MatchingModel.MATCH_ALL, MatchingModel.MATCH_ANY}:
+            self.patterns = tuple(
+                (word, re.compile(rf"\b{word}\b", flags))
+                for word in _split_match(matching_model)
             )
-        except re.error:
-            logger.error(
-                f"Error while processing regular expression {matching_model.match}",
-            )
-            return False
-        if match:
-            log_reason(
-                matching_model,
-                document,
-                f"the string {match.group()} matches the regular expression "
-                f"{matching_model.match}",
+        elif self.algorithm == MatchingModel.MATCH_LITERAL:
+            self.patterns = (
+                (
+                    matching_model.match,
+                    re.compile(rf"\b{re.escape(matching_model.match)}\b", flags),
+                ),
             )
-        return bool(match)
-
-    elif matching_model.matching_algorithm == MatchingModel.MATCH_FUZZY:
-        from rapidfuzz import fuzz
-
-        match = re.sub(r"[^\w\s]", "", matching_model.match)
-        text = re.sub(r"[^\w\s]", "", document_content)
-        if matching_model.is_insensitive:
-            match = match.lower()
-            text = text.lower()
-        if fuzz.partial_ratio(match, text, score_cutoff=90):
-            # TODO: make this better
+        elif self.algorithm == MatchingModel.MATCH_REGEX:
+            try:
+                self.patterns = (
+                    (matching_model.match, re.compile(matching_model.match, flags)),
+                )
+            except re.error:
+                logger.error(
+                    f"Error while processing regular expression {matching_model.match}",
+                )
+                self.algorithm = MatchingModel.MATCH_NONE
+        elif self.algorithm == MatchingModel.MATCH_FUZZY:
+            self.fuzzy_match = re.sub(r"[^\w\s]", "", matching_model.match)
+            if matching_model.is_insensitive:
+                self.fuzzy_match = self.fuzzy_match.lower()
+        elif self.algorithm not in {MatchingModel.MATCH_NONE, MatchingModel.MATCH_AUTO}:
+            raise NotImplementedError("Unsupported matching algorithm")
+
+    def matches(self, document: Document) -> bool:
+        matching_model = self.matching_model
+        document_content = document.content
+
+        if self.algorithm == MatchingModel.MATCH_ALL:
+            for _, pattern in self.patterns:
+                if not pattern.search(document_content):
+                    return False
             log_reason(
                 matching_model,
                 document,
-                f"parts of the document content somehow match the string "
-                f"{matching_model.match}",
+                f"it contains all of these words: {matching_model.match}",
             )
             return True
-        else:
+
+        elif self.algorithm == MatchingModel.MATCH_ANY:
+            for word, pattern in self.patterns:
+                if pattern.search(document_content):
+                    log_reason(
+                        matching_model,
+                        document,
+                        f"it contains this word: {word}",
+                    )
+                    return True
             return False
 
-    elif matching_model.matching_algorithm == MatchingModel.MATCH_AUTO:
-        # this is done elsewhere.
+        elif self.algorithm == MatchingModel.MATCH_LITERAL:
+            _, pattern = self.patterns[0]
+            result = bool(pattern.search(document_content))
+            if result:
+                log_reason(
+                    matching_model,
+                    document,
+                    f'it contains this string: "{matching_model.match}"',
+                )
+            return result
+
+        elif self.algorithm == MatchingModel.MATCH_REGEX:
+            _, pattern = self.patterns[0]
+            match = pattern.search(document_content)
+            if match:
+                log_reason(
+                    matching_model,
+                    document,
+                    f"the string {match.group()} matches the regular expression "
+                    f"{matching_model.match}",
+                )
+            return bool(match)
+
+        elif self.algorithm == MatchingModel.MATCH_FUZZY:
+            from rapidfuzz import fuzz
+
+            text = re.sub(r"[^\w\s]", "", document_content)
+            if matching_model.is_insensitive:
+                text = text.lower()
+            if fuzz.partial_ratio(self.fuzzy_match, text, score_cutoff=90):
+                # TODO: make this better
+                log_reason(
+                    matching_model,
+                    document,
+                    f"parts of the document content somehow match the string "
+                    f"{matching_model.match}",
+                )
+                return True
+            else:
+                return False
+
+        # MATCH_NONE, or MATCH_AUTO which is done elsewhere.
         return False
 
-    else:
-        raise NotImplementedError("Unsupported matching algorithm")
+
+def matches(matching_model: MatchingModel, document: Document):
+    return ContentMatcher(matching_model).matches(document)
 
 
 def _split_match(matching_model):
@@ -247,7 +277,7 @@ def _split_match(matching_model):
 
 def consumable_document_matches_workflow(
     document: ConsumableDocument,
-    trigger: WorkflowTrigger,
+    trigger: WorkflowTriggerPlan,
 ) -> tuple[bool, str]:
     """
     Returns True if the ConsumableDocument matches all filters from the workflow trigger,
@@ -258,34 +288,28 @@ def consumable_document_matches_workflow(
     reason = ""
 
     # Document source vs trigger source
-    if len(trigger.sources) > 0 and document.source not in [
-        int(x) for x in list(trigger.sources)
-    ]:
+    if len(trigger.sources) > 0 and document.source not in trigger.sources:
         reason = (
             f"Document source {document.source.name} not in"
-            f" {[DocumentSource(int(x)).name for x in trigger.sources]}",
+            f" {[DocumentSource(x).name for x in sorted(trigger.sources)]}",
         )
         trigger_matched = False
 
     # Document mail rule vs trigger mail rule
     if (
-        trigger.filter_mailrule is not None
-        and document.mailrule_id != trigger.filter_mailrule.pk
+        trigger.filter_mailrule_id is not None
+        and document.mailrule_id != trigger.filter_mailrule_id
     ):
         reason = (
             f"Document mail rule {document.mailrule_id}"
-            f" != {trigger.filter_mailrule.pk}",
+            f" != {trigger.filter_mailrule_id}",
         )
         trigger_matched = False
 
     # Document filename vs trigger filename
-    if (
-        trigger.filter_filename is not None
-        and len(trigger.filter_filename) > 0
-        and not fnmatch(
-            document.original_file.name.lower(),
-            trigger.filter_filename.lower(),
-        )
+    if trigger.filter_filename is not None and not fnmatch(
+        document.original_file.name.lower(),
+        trigger.filter_filename.lower(),
     ):
         reason = (
             f"Document filename {document.original_file.name} does not match"
@@ -294,13 +318,9 @@ def consumable_document_matches_workflow(
         trigger_matched = False
 
     # Document path vs trigger path
-    if (
-        trigger.filter_path is not None
-        and len(trigger.filter_path) > 0
-        and not fnmatch(
-            document.original_file,
-            trigger.filter_path,
-        )
+    if trigger.filter_path is not None and not fnmatch(
+        document.original_file,
+        trigger.filter_path,
     ):
         reason = (
             f"Document path {document.original_file}"
@@ -313,63 +333,65 @@ def consumable_document_matches_workflow(
 
 def existing_document_matches_workflow(
     document: Document,
-    trigger: WorkflowTrigger,
+    trigger: WorkflowTriggerPlan,
+    document_tag_ids: Optional[Collection[int]] = None,
 ) -> tuple[bool, str]:
     """
     Returns True if the Document matches all filters from the workflow trigger,
     False otherwise. Includes a reason if doesn't match
+
+    Prefetch the document's tags to avoid a query for the tag filter, or pass
+    document_tag_ids when the tags have been changed but not yet saved
     """
 
     trigger_matched = True
     reason = ""
 
-    if trigger.matching_algorithm > MatchingModel.MATCH_NONE and not matches(
-        trigger,
+    if trigger.content_matcher is not None and not trigger.content_matcher.matches(
         document,
     ):
         reason = (
-            f"Document content matching settings for algorithm '{trigger.matching_algorithm}' did not match",
+            f"Document content matching settings for algorithm '{trigger.trigger.matching_algorithm}' did not match",
         )
         trigger_matched = False
 
     # Document tags vs trigger has_tags
-    if (
-        trigger.filter_has_tags.all().count() > 0
-        and document.tags.filter(
-            id__in=trigger.filter_has_tags.all().values_list("id"),
-        ).count()
-        == 0
-    ):
-        reason = (
-            f"Document tags {document.tags.all()} do not include"
-            f" {trigger.filter_has_tags.all()}",
-        )
-        trigger_matched = False
+    if trigger.filter_has_tag_ids:
+        if document_tag_ids is None:
+            document_tags = document.tags.all()
+            document_tag_ids = [tag.pk for tag in document_tags]
+        else:
+            document_tags = sorted(document_tag_ids)
+        if trigger.filter_has_tag_ids.isdisjoint(document_tag_ids):
+            reason = (
+                f"Document tags {document_tags} do not include"
+                f" {trigger.trigger.filter_has_tags.all()}",
+            )
+            trigger_matched = False
 
     # Document correspondent vs trigger has_correspondent
     if (
-        trigger.filter_has_correspondent is not None
-        and document.correspondent != trigger.filter_has_correspondent
+        trigger.filter_has_correspondent_id is not None
+        and document.correspondent_id != trigger.filter_has_correspondent_id
     ):
         reason = (
-            f"Document correspondent {document.correspondent} does not match {trigger.filter_has_correspondent}",
+            f"Document correspondent {document.correspondent} does not match {trigger.trigger.filter_has_correspondent}",
         )
         trigger_matched = False
 
     # Document document_type vs trigger has_document_type
     if (
-        trigger.filter_has_document_type is not None
-        and document.document_type != trigger.filter_has_document_type
+        trigger.filter_has_document_type_id is not None
+        and document.document_type_id != trigger.filter_has_document_type_id
     ):
         reason = (
-            f"Document doc type {document.document_type} does not match {trigger.filter_has_document_type}",
+            f"Document doc type {document.document_type} does not match {trigger.trigger.filter_has_document_type}",
         )
         trigger_matched = False
 
     # Document original_filename vs trigger filename
     if (
         trigger.filter_filename is not None
-        and len(trigger.filter_filename) > 0
         and document.original_filename is not None
         and not fnmatch(
             document.original_filename.lower(),
@@ -387,21 +409,25 @@ def existing_document_matches_workflow(
 
 def document_matches_workflow(
     document: Union[ConsumableDocument, Document],
-    workflow: Workflow,
+    workflow: Union[Workflow, WorkflowPlan],
     trigger_type: WorkflowTrigger.WorkflowTriggerType,
+    document_tag_ids: Optional[Collection[int]] = None,
 ) -> bool:
     """
     Returns True if the ConsumableDocument or Document matches all filters and
     settings from the workflow trigger, False otherwise
     """
+    if isinstance(workflow, Workflow):
+        workflow = compile_workflow(workflow)
 
     trigger_matched = True
-    if workflow.triggers.filter(type=trigger_type).count() == 0:
+    triggers = workflow.triggers_of_type(trigger_type)
+    if len(triggers) == 0:
         trigger_matched = False
         logger.info(f"Document did not match {workflow}")
         logger.debug(f"No matching triggers with type {trigger_type} found")
     else:
-        for trigger in workflow.triggers.filter(type=trigger_type):
+        for trigger in triggers:
             if trigger_type == WorkflowTrigger.WorkflowTriggerType.CONSUMPTION:
                 trigger_matched, reason = consumable_document_matches_workflow(
                     document,
@@ -414,6 +440,7 @@ def document_matches_workflow(
                 trigger_matched, reason = existing_document_matches_workflow(
                     document,
                     trigger,
+                    document_tag_ids,
                 )
             else:
                 # New trigger types need to be explicitly checked above
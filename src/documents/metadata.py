@@ -0,0 +1,131 @@
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional
+
+from documents.models import Document
+from documents.models import DocumentMetadata
+from documents.parsers import DocumentParser
+from documents.parsers import get_parser_class_for_mime_type
+
+logger = logging.getLogger("paperless.metadata")
+
+
+def extract_metadata(
+    path: Path,
+    mime_type: str,
+    parser: Optional[DocumentParser] = None,
+) -> Optional[list]:
+    """
+    Extracts the metadata of the given file, using the given parser or a new
+    one for the mime type.  Returns None if the file does not exist.
+    """
+    if not Path(path).is_file():
+        return None
+
+    if parser is None:
+        parser_class = get_parser_class_for_mime_type(mime_type)
+        if not parser_class:  # pragma: no cover
+            logger.warning(f"No parser for {mime_type}")
+            return []
+        parser = parser_class(progress_callback=None, logging_group=None)
+
+    try:
+        return parser.extract_metadata(path, mime_type)
+    except Exception:  # pragma: no cover
+        logger.exception(f"Issue getting metadata for {path}")
+        # TODO: cover GPG errors, remove later.
+        return []
+
+
+def detect_language(content: Optional[str]) -> str:
+    """
+    Detects the language of the content, falling back to English
+    """
+    from langdetect import detect
+
+    try:
+        return detect(content)
+    except Exception:
+        return "en"
+
+
+def content_checksum(content: Optional[str]) -> str:
+    return hashlib.md5((content or "").encode("utf-8", errors="replace")).hexdigest()
+
+
+def _file_size(path: Optional[Path]) -> Optional[int]:
+    if path is not None and Path(path).is_file():
+        return Path(path).stat().st_size
+    return None
+
+
+def build_document_metadata(
+    document: Document,
+    parser: Optional[DocumentParser] = None,
+) -> DocumentMetadata:
+    """
+    Extracts the metadata of the document, without saving it.  The parser of the
+    document may be given to read the original file with it.
+    """
+    original_path = document.source_path
+    archive_path = document.archive_path if document.has_archive_version else None
+
+    return DocumentMetadata(
+        document=document,
+        original_checksum=document.checksum,
+        original_size=_file_size(original_path),
+        original_metadata=extract_metadata(original_path, document.mime_type, parser),
+        archive_checksum=document.archive_checksum,
+        archive_size=_file_size(archive_path),
+        archive_metadata=(
+            extract_metadata(archive_path, "application/pdf")
+            if archive_path is not None
+            else None
+        ),
+        content_checksum=content_checksum(document.content),
+        language=detect_language(document.content),
+    )
+
+
+def update_document_metadata(
+    document: Document,
+    parser: Optional[DocumentParser] = None,
+) -> DocumentMetadata:
+    """
+    Extracts and stores the metadata of the document
+    """
+    metadata = build_document_metadata(document, parser)
+    metadata.save()
+    return metadata
+
+
+def get_document_metadata(document: Document) -> DocumentMetadata:
+    """
+    Returns the stored metadata of the document.  If the files or the content
+    changed since, the outdated parts are extracted and stored again.
+    """
+    try:
+        metadata = DocumentMetadata.objects.get(document=document)
+    except DocumentMetadata.DoesNotExist:
+        metadata = None
+
+    if (
+        metadata is None
+        or metadata.original_checksum != document.checksum
+        or metadata.archive_checksum != document.archive_checksum
+    ):
+        metadata = build_document_metadata(document)
+        if metadata.original_metadata is None or (
+            document.has_archive_version and metadata.archive_metadata is None
+        ):
+            # Files are missing, don't keep this around
+            return metadata
+        metadata.save()
+    elif metadata.content_checksum != content_checksum(document.content):
+        # The content was edited, only the language might have changed
+        metadata.content_checksum = content_checksum(document.content)
+        metadata.language = detect_language(document.content)
+        metadata.save(update_fields=["content_checksum", "language"])
+
+    return metadata
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.30 on 2026-10-19 15:31
+
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "1052_document_transaction_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentMetadata",
+            fields=[
+                (
+                    "document",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="file_metadata",
+                        serialize=False,
+                        to="documents.document",
+                        verbose_name="document",
+                    ),
+                ),
+                (
+                    "original_checksum",
+                    models.CharField(max_length=32, verbose_name="original checksum"),
+                ),
+                (
+                    "original_size",
+                    models.PositiveBigIntegerField(
+                        null=True,
+                        verbose_name="original size",
+                    ),
+                ),
+                (
+                    "original_metadata",
+                    models.JSONField(null=True, verbose_name="original metadata"),
+                ),
+                (
+                    "archive_checksum",
+                    models.CharField(
+                        blank=True,
+                        max_length=32,
+                        null=True,
+                        verbose_name="archive checksum",
+                    ),
+                ),
+                (
+                    "archive_size",
+                    models.PositiveBigIntegerField(
+                        null=True,
+                        verbose_name="archive size",
+                    ),
+                ),
+                (
+                    "archive_metadata",
+                    models.JSONField(null=True, verbose_name="archive metadata"),
+                ),
+                (
+                    "content_checksum",
+                    models.CharField(max_length=32, verbose_name="content checksum"),
+                ),
+                ("language", models.CharField(max_length=16, verbose_name="language")),
+            ],
+            options={
+                "verbose_name": "document metadata",
+                "verbose_name_plural": "document metadata",
+            },
+        ),
+    ]
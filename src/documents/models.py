@@ -366,6 +366,50 @@ class Document(SoftDeleteModel, ModelWithOwner):
         return timezone.localdate(self.created)
 
 
+class DocumentMetadata(models.Model):
+    """
+    The metadata of the files of a document and the language of its content.
+    These are extracted once, instead of reading the files whenever they are
+    requested.  The checksums tell whether the files changed since.
+    """
+
+    document = models.OneToOneField(
+        Document,
+        primary_key=True,
+        related_name="file_metadata",
+        on_delete=models.CASCADE,
+        verbose_name=_("document"),
+    )
+
+    original_checksum = models.CharField(_("original checksum"), max_length=32)
+
+    original_size = models.PositiveBigIntegerField(_("original size"), null=True)
+
+    original_metadata = models.JSONField(_("original metadata"), null=True)
+
+    archive_checksum = models.CharField(
+        _("archive checksum"),
+        max_length=32,
+        null=True,
+        blank=True,
+    )
+
+    archive_size = models.PositiveBigIntegerField(_("archive size"), null=True)
+
+    archive_metadata = models.JSONField(_("archive metadata"), null=True)
+
+    content_checksum = models.CharField(_("content checksum"), max_length=32)
+
+    language = models.CharField(_("language"), max_length=16)
+
+    class Meta:
+        verbose_name = _("document metadata")
+        verbose_name_plural = _("document metadata")
+
+    def __str__(self):
+        return f"Metadata of {self.document_id}"
+
+
 class Log(models.Model):
     LEVELS = (
         (logging.DEBUG, _("debug")),
@@ -0,0 +1,95 @@
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+from typing import Union
+
+from PIL import Image
+
+from documents.utils import compute_checksum
+
+logger = logging.getLogger("paperless.page_images")
+
+
+class PageImageCache:
+    """
+    Keeps pages rendered by one step of a consume task, so later steps don't
+    have to render them again.  Images are keyed by the content of the
+    document they were rendered from, so a document changed in between, or a
+    different file such as the archive version, never finds the images of
+    another one.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = Path(directory)
+        # The keys of files known already, by path, size and modification time
+        self._keys: dict[tuple[str, int, int], str] = {}
+
+    @staticmethod
+    def _file_id(path: Union[Path, str]) -> tuple[str, int, int]:
+        stat = os.stat(path)
+        return os.fspath(path), stat.st_size, stat.st_mtime_ns
+
+    def remember_key(self, path: Union[Path, str], checksum: str) -> None:
+        """
+        Records the MD5 checksum of the file as its key, when the caller
+        computed it anyway, so it is not computed again
+        """
+        self._keys[self._file_id(path)] = checksum
+
+    def document_key(self, path: Union[Path, str]) -> str:
+        """
+        Returns the key of the file, computing its checksum only once while
+        the file is unchanged
+        """
+        file_id = self._file_id(path)
+        key = self._keys.get(file_id)
+        if key is None:
+            key = self._keys[file_id] = compute_checksum(path)
+        return key
+
+    def _path(self, key: str, page: int, dpi: int, mode: str) -> Path:
+        return self.directory / f"{key}-{page}-{dpi}-{mode}.png"
+
+    def put(self, key: str, page: int, dpi: int, image: Image.Image) -> None:
+        """
+        Stores the image of the page, rendered at the given DPI
+        """
+        path = self._path(key, page, dpi, image.mode)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                # Quick to write, as the image is only kept for a short time
+                image.save(f, format="PNG", compress_level=1)
+            os.replace(temp_name, path)
+        except Exception:
+            Path(temp_name).unlink(missing_ok=True)
+            raise
+
+    def get(
+        self,
+        key: str,
+        page: int,
+        *,
+        min_dpi: int,
+        mode: str = "RGB",
+    ) -> Optional[tuple[int, Image.Image]]:
+        """
+        Returns the image of the page with the lowest DPI of at least min_dpi,
+        together with its DPI, or None if there is none
+        """
+        candidates = []
+        for path in self.directory.glob(f"{key}-{page}-*-{mode}.png"):
+            dpi = int(path.stem.split("-")[2])
+            if dpi >= min_dpi:
+                candidates.append((dpi, path))
+        if not candidates:
+            return None
+
+        dpi, path = min(candidates)
+        logger.debug(f"Using page {page + 1} rendered at {dpi} DPI before")
+        with Image.open(path) as image:
+            image.load()
+            return dpi, image
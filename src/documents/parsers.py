@@ -1,4 +1,5 @@
 import datetime
+import itertools
 import logging
 import mimetypes
 import os
@@ -6,10 +7,16 @@ import re
 import shutil
 import subprocess
 import tempfile
+import threading
+import zoneinfo
+from collections.abc import Iterable
 from collections.abc import Iterator
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 from pathlib import Path
 from re import Match
+from typing import TYPE_CHECKING
 from typing import Optional
 
 from django.conf import settings
@@ -20,6 +27,11 @@ from documents.signals import document_consumer_declaration
 from documents.utils import copy_file_with_basic_stats
 from documents.utils import run_subprocess
 
+if TYPE_CHECKING:
+    from PIL import Image
+
+    from documents.page_images import PageImageCache
+
 # This regular expression will try to find dates in the document at
 # hand and will match the following formats:
 # - XX.YY.ZZZZ with XX + YY being 1 or 2 and ZZZZ being 2 or 4 digits
@@ -47,6 +59,13 @@ DATE_REGEX = re.compile(
     re.IGNORECASE,
 )
 
+# Numeric dates with a 4 digit year, like 24.12.2023 or 2023-12-24, are by far
+# the most common and are parsed without dateparser
+NUMERIC_DATE_REGEX = re.compile(
+    r"(?:(\d{4})[\.\/-](\d{1,2})[\.\/-](\d{1,2}))|"
+    r"(?:(\d{1,2})[\.\/-](\d{1,2})[\.\/-](\d{4}))",
+)
+
 
 logger = logging.getLogger("paperless.parsing")
 
@@ -146,11 +165,15 @@ def run_convert(
     extra=None,
     logging_group=None,
 ) -> None:
-    environment = os.environ.copy()
-    if settings.CONVERT_MEMORY_LIMIT:
-        environment["MAGICK_MEMORY_LIMIT"] = settings.CONVERT_MEMORY_LIMIT
-    if settings.CONVERT_TMPDIR:
-        environment["MAGICK_TMPDIR"] = settings.CONVERT_TMPDIR
+    # Only copy the environment if something must be changed, otherwise the
+    # process simply inherits it
+    environment = None
+    if settings.CONVERT_MEMORY_LIMIT or settings.CONVERT_TMPDIR:
+        environment = os.environ.copy()
+        if settings.CONVERT_MEMORY_LIMIT:
+            environment["MAGICK_MEMORY_LIMIT"] = settings.CONVERT_MEMORY_LIMIT
+        if settings.CONVERT_TMPDIR:
+            environment["MAGICK_TMPDIR"] = settings.CONVERT_TMPDIR
 
     args = [settings.CONVERT_BINARY]
     args += ["-density", str(density)] if density else []
@@ -225,10 +248,150 @@ def make_thumbnail_from_pdf_gs_fallback(in_path, temp_dir, logging_group=None) -
         return default_thumbnail_path
 
 
+# pdfium must not be used by several threads at the same time
+_pdfium_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def pdfium_available() -> bool:
+    try:
+        import pypdfium2  # noqa: F401
+    except ImportError:
+        logger.warning(
+            "Thumbnail engine pdfium is configured, but pypdfium2 is not "
+            "installed. Using convert instead.",
+        )
+        return False
+    return True
+
+
+def render_pdf_page_pdfium(
+    in_path,
+    page_index: int,
+    max_width: int,
+    max_height: int,
+    dpi: int = 300,
+):
+    """
+    Renders a single page of the PDF in process, directly at the requested size
+    instead of rendering it at full resolution and scaling it down afterwards.
+    The page is rendered at the given DPI at most, shrunk to fit into the box.
+
+    Raises an IndexError if the document does not have the requested page.
+    """
+    import pypdfium2 as pdfium
+
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(in_path)
+        try:
+            if not 0 <= page_index < len(pdf):
+                raise IndexError(f"{in_path} has no page {page_index + 1}")
+            page = pdf[page_index]
+            width, height = page.get_size()
+            scale = min(dpi / 72, max_width / width, max_height / height)
+            image = page.render(scale=scale).to_pil()
+        finally:
+            pdf.close()
+
+    return image.convert("RGB")
+
+
+def render_pdf_pages_pdfium(
+    in_path,
+    page_indices: Iterable[int],
+    dpi: int,
+    *,
+    grayscale: bool = False,
+) -> list[tuple[int, "Image.Image"]]:
+    """
+    Renders the given pages of the PDF in process at the given DPI, opening the
+    document only once.  Returns each page index together with its image.
+
+    Raises an IndexError if the document does not have a requested page.
+    """
+    import pypdfium2 as pdfium
+
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(in_path)
+        try:
+            images = []
+            for page_index in page_indices:
+                if not 0 <= page_index < len(pdf):
+                    raise IndexError(f"{in_path} has no page {page_index + 1}")
+                bitmap = pdf[page_index].render(scale=dpi / 72, grayscale=grayscale)
+                images.append((page_index, bitmap.to_pil()))
+        finally:
+            pdf.close()
+
+    return images
+
+
+def make_thumbnail_from_pdf_pdfium(in_path, temp_dir) -> Path:
+    """
+    Renders the first page of the PDF in process, directly at the size of the
+    thumbnail instead of rendering it at 300 DPI and scaling it down afterwards
+    """
+    out_path = Path(temp_dir) / "pdfium.webp"
+
+    # The same size as convert: 300 DPI, shrunk to fit into 500x5000
+    image = render_pdf_page_pdfium(in_path, 0, max_width=500, max_height=5000)
+    image.save(out_path, format="WEBP")
+
+    return out_path
+
+
+def make_thumbnail_from_page_image(
+    page_images: "PageImageCache",
+    in_path,
+    temp_dir,
+) -> Optional[Path]:
+    """
+    Makes the thumbnail from the first page of the PDF, if the page was
+    rendered before at a resolution good enough for the thumbnail.  Returns
+    None if it was not.
+    """
+    key = page_images.document_key(in_path)
+    found = page_images.get(key, 0, min_dpi=300) or page_images.get(
+        key,
+        0,
+        min_dpi=1,
+    )
+    if found is None:
+        return None
+    dpi, image = found
+
+    # The same size as convert: 300 DPI, shrunk to fit into 500x5000
+    if dpi > 300:
+        image = image.resize(
+            (
+                max(1, round(image.width * 300 / dpi)),
+                max(1, round(image.height * 300 / dpi)),
+            ),
+        )
+    elif dpi < 300 and image.width < 500 and image.height < 5000:
+        # It would have to be scaled up
+        return None
+    image.thumbnail((500, 5000))
+
+    out_path = Path(temp_dir) / "page-image.webp"
+    image.save(out_path, format="WEBP")
+
+    return out_path
+
+
 def make_thumbnail_from_pdf(in_path, temp_dir, logging_group=None) -> Path:
     """
     The thumbnail of a PDF is just a 500px wide image of the first page.
     """
+    if settings.THUMBNAIL_ENGINE == "PDFIUM" and pdfium_available():
+        try:
+            return make_thumbnail_from_pdf_pdfium(in_path, temp_dir)
+        except Exception as e:
+            logger.warning(
+                f"Unable to make thumbnail with pdfium, falling back to convert: {e}",
+                extra={"group": logging_group},
+            )
+
     out_path = temp_dir / "convert.webp"
 
     # Run convert to get a decent thumbnail
@@ -256,15 +419,56 @@ def parse_date(filename, text) -> Optional[datetime.datetime]:
     return next(parse_date_generator(filename, text), None)
 
 
+def parse_numeric_date(
+    date_string: str,
+    date_order: str,
+    tz: datetime.tzinfo,
+) -> Optional[datetime.datetime]:
+    """
+    Parses numeric dates with a 4 digit year the way dateparser would, without
+    the overhead of dateparser.  Returns None for anything else, including dates
+    which are ambiguous or invalid, these are left to dateparser.
+    """
+    match = NUMERIC_DATE_REGEX.fullmatch(date_string)
+    if match is None:
+        return None
+
+    if match.group(1) is not None:
+        # A leading year is always followed by the remaining parts in the
+        # configured order
+        year, first, second = match.group(1, 2, 3)
+    elif date_order.startswith("Y"):
+        # dateparser does not apply the order consistently to trailing years
+        return None
+    else:
+        first, second, year = match.group(4, 5, 6)
+
+    if date_order.index("D") < date_order.index("M"):
+        day, month = first, second
+    else:
+        month, day = first, second
+
+    try:
+        return datetime.datetime(int(year), int(month), int(day), tzinfo=tz)
+    except ValueError:
+        return None
+
+
 def parse_date_generator(filename, text) -> Iterator[datetime.datetime]:
     """
     Returns the date of the document.
     """
 
+    tz = zoneinfo.ZoneInfo(settings.TIME_ZONE)
+
     def __parser(ds: str, date_order: str) -> datetime.datetime:
         """
         Call dateparser.parse with a particular date ordering
         """
+        date = parse_numeric_date(ds, date_order, tz)
+        if date is not None:
+            return date
+
         import dateparser
 
         return dateparser.parse(
@@ -302,7 +506,14 @@ def parse_date_generator(filename, text) -> Iterator[datetime.datetime]:
         return __filter(date)
 
     def __process_content(content: str, date_order: str) -> Iterator[datetime.datetime]:
-        for m in re.finditer(DATE_REGEX, content):
+        if settings.DATE_PARSER_MAX_CHARACTERS > 0:
+            content = content[: settings.DATE_PARSER_MAX_CHARACTERS]
+
+        matches = DATE_REGEX.finditer(content)
+        if settings.DATE_PARSER_MAX_MATCHES > 0:
+            matches = itertools.islice(matches, settings.DATE_PARSER_MAX_MATCHES)
+
+        for m in matches:
             date = __process_match(m, date_order)
             if date is not None:
                 yield date
@@ -341,6 +552,11 @@ class DocumentParser(LoggingMixin):
         self.text = None
         self.date: Optional[datetime.datetime] = None
         self.progress_callback = progress_callback
+        # Pages rendered before by the consume task, if any
+        self.page_images: Optional[PageImageCache] = None
+
+        self._thumbnail_executor: Optional[ThreadPoolExecutor] = None
+        self._thumbnail_future: Optional[Future] = None
 
     def progress(self, current_progress, max_progress):
         if self.progress_callback:
@@ -379,6 +595,68 @@ class DocumentParser(LoggingMixin):
         """
         raise NotImplementedError
 
+    def reuse_archive_pages(self, document_path: Path, archive_path: Path) -> bool:
+        """
+        Keeps the pages of an existing archive file of the document, so that
+        parse can reuse them instead of creating them again.  Returns True if
+        the pages are reused.
+        """
+        return False
+
+    def caches_pages(self) -> bool:
+        """
+        Returns True if parse keeps its results for single pages, so that a
+        document made of pages parsed before is parsed without redoing them
+        """
+        return False
+
+    def supports_concurrent_thumbnail(self, mime_type) -> bool:
+        """
+        Returns True if get_thumbnail only needs the original document, and not
+        the results of parse, so the thumbnail can be created while parsing
+        """
+        return False
+
+    def start_thumbnail(self, document_path, mime_type, file_name=None) -> bool:
+        """
+        Starts creating the thumbnail on a thread, if the parser supports it.
+        Returns True if the thumbnail is being created, collect it with
+        finish_thumbnail.
+        """
+        if not self.supports_concurrent_thumbnail(mime_type):
+            return False
+
+        self.log.debug("Generating thumbnail concurrently to parsing")
+        self._thumbnail_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="thumbnail",
+        )
+        self._thumbnail_future = self._thumbnail_executor.submit(
+            self.get_thumbnail,
+            document_path,
+            mime_type,
+            file_name,
+        )
+        return True
+
+    def finish_thumbnail(self, document_path, mime_type, file_name=None) -> Path:
+        """
+        Returns the thumbnail started by start_thumbnail, waiting for it if
+        required, or creates it now if it was not started
+        """
+        if self._thumbnail_future is None:
+            return self.get_thumbnail(document_path, mime_type, file_name)
+        try:
+            return self._thumbnail_future.result()
+        finally:
+            self._stop_thumbnail()
+
+    def _stop_thumbnail(self):
+        if self._thumbnail_executor is not None:
+            self._thumbnail_executor.shutdown(wait=True)
+        self._thumbnail_executor = None
+        self._thumbnail_future = None
+
     def get_text(self):
         return self.text
 
@@ -386,5 +664,7 @@ class DocumentParser(LoggingMixin):
         return self.date
 
     def cleanup(self):
+        # A thumbnail might still be written to the directory
+        self._stop_thumbnail()
         self.log.debug(f"Deleting directory {self.tempdir}")
         shutil.rmtree(self.tempdir)
@@ -1,14 +1,17 @@
+from collections import defaultdict
+from collections.abc import Iterable
+
 from django.contrib.auth.models import Group
 from django.contrib.auth.models import Permission
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Model
 from django.db.models import QuerySet
 from guardian.core import ObjectPermissionChecker
 from guardian.models import GroupObjectPermission
-from guardian.shortcuts import assign_perm
+from guardian.models import UserObjectPermission
 from guardian.shortcuts import get_objects_for_user
-from guardian.shortcuts import get_users_with_perms
-from guardian.shortcuts import remove_perm
 from rest_framework.permissions import BasePermission
 from rest_framework.permissions import DjangoObjectPermissions
 
@@ -67,60 +70,99 @@ def set_permissions_for_object(permissions: list[str], object, merge: bool = Fal
     no users or groups are removed. If False, the permissions are set to exactly
     the given list of users and groups.
     """
+    set_permissions_for_objects(permissions, [object], merge=merge)
+
+
+def set_permissions_for_objects(
+    permissions: dict,
+    objects: Iterable[Model],
+    merge: bool = False,
+) -> None:
+    """
+    Sets permissions for many objects of the same model, like
+    set_permissions_for_object does for each of them.  The object permissions
+    the objects should have are computed from the existing ones, and only the
+    difference is written, with bulk inserts and deletes in one transaction.
+    """
+    objects = list(objects)
+    if not objects:
+        return
+
+    model_name = objects[0].__class__.__name__.lower()
+    ctype = ContentType.objects.get_for_model(objects[0])
+    object_pks = [str(obj.pk) for obj in objects]
+    codenames = {f"{action}_{model_name}" for action in permissions}
+    codenames.add(f"view_{model_name}")
+    permission_ids = dict(
+        Permission.objects.filter(
+            content_type=ctype,
+            codename__in=codenames,
+        ).values_list("codename", "id"),
+    )
 
-    for action in permissions:
-        permission = f"{action}_{object.__class__.__name__.lower()}"
-        # users
-        users_to_add = User.objects.filter(id__in=permissions[action]["users"])
-        users_to_remove = (
-            get_users_with_perms(
-                object,
-                only_with_perms_in=[permission],
-                with_group_users=False,
+    with transaction.atomic():
+        for perm_model, principal_model, principal_field, key in (
+            (UserObjectPermission, User, "user_id", "users"),
+            (GroupObjectPermission, Group, "group_id", "groups"),
+        ):
+            existing = set(
+                perm_model.objects.filter(
+                    content_type=ctype,
+                    object_pk__in=object_pks,
+                    permission_id__in=permission_ids.values(),
+                ).values_list("object_pk", "permission_id", principal_field),
             )
-            if not merge
-            else User.objects.none()
-        )
-        if len(users_to_add) > 0 and len(users_to_remove) > 0:
-            users_to_remove = users_to_remove.exclude(id__in=users_to_add)
-        if len(users_to_remove) > 0:
-            for user in users_to_remove:
-                remove_perm(permission, user, object)
-        if len(users_to_add) > 0:
-            for user in users_to_add:
-                assign_perm(permission, user, object)
+
+            # Apply the actions in order to the rows, as the change action also
+            # gives view, which a later view action may remove again
+            wanted = set(existing)
+            for action in permissions:
+                permission_id = permission_ids[f"{action}_{model_name}"]
+                to_add = set(
+                    principal_model.objects.filter(
+                        id__in=permissions[action][key],
+                    ).values_list("id", flat=True),
+                )
+                if not merge:
+                    wanted = {
+                        row
+                        for row in wanted
+                        if row[1] != permission_id or row[2] in to_add
+                    }
+                added_permission_ids = [permission_id]
                 if action == "change":
                     # change gives view too
-                    assign_perm(
-                        f"view_{object.__class__.__name__.lower()}",
-                        user,
-                        object,
+                    added_permission_ids.append(permission_ids[f"view_{model_name}"])
+                wanted.update(
+                    (object_pk, added_permission_id, principal_id)
+                    for object_pk in object_pks
+                    for added_permission_id in added_permission_ids
+                    for principal_id in to_add
+                )
+
+            removed = defaultdict(list)
+            for object_pk, permission_id, principal_id in existing - wanted:
+                removed[(permission_id, principal_id)].append(object_pk)
+            for (permission_id, principal_id), pks in removed.items():
+                perm_model.objects.filter(
+                    content_type=ctype,
+                    permission_id=permission_id,
+                    object_pk__in=pks,
+                    **{principal_field: principal_id},
+                ).delete()
+
+            perm_model.objects.bulk_create(
+                [
+                    perm_model(
+                        content_type=ctype,
+                        object_pk=object_pk,
+                        permission_id=permission_id,
+                        **{principal_field: principal_id},
                     )
-        # groups
-        groups_to_add = Group.objects.filter(id__in=permissions[action]["groups"])
-        groups_to_remove = (
-            get_groups_with_only_permission(
-                object,
-                permission,
+                    for object_pk, permission_id, principal_id in wanted - existing
+                ],
+                ignore_conflicts=True,
             )
-            if not merge
-            else Group.objects.none()
-        )
-        if len(groups_to_add) > 0 and len(groups_to_remove) > 0:
-            groups_to_remove = groups_to_remove.exclude(id__in=groups_to_add)
-        if len(groups_to_remove) > 0:
-            for group in groups_to_remove:
-                remove_perm(permission, group, object)
-        if len(groups_to_add) > 0:
-            for group in groups_to_add:
-                assign_perm(permission, group, object)
-                if action == "change":
-                    # change gives view too
-                    assign_perm(
-                        f"view_{object.__class__.__name__.lower()}",
-                        group,
-                        object,
-                    )
 
 
 def get_objects_for_user_owner_aware(user, perms, Model) -> QuerySet:
@@ -1,10 +1,12 @@
 import abc
+from functools import cached_property
 from pathlib import Path
 from typing import Final
 from typing import Optional
 
 from documents.data_models import ConsumableDocument
 from documents.data_models import DocumentMetadataOverrides
+from documents.page_images import PageImageCache
 from documents.plugins.helpers import ProgressManager
 
 
@@ -67,6 +69,14 @@ class ConsumeTaskPlugin(abc.ABC):
         self.status_mgr = status_mgr
         self.task_id: Final = task_id
 
+    @cached_property
+    def page_images(self) -> PageImageCache:
+        """
+        Pages rendered by the plugins of this consume task, so that a page
+        rendered by one plugin does not have to be rendered again by another
+        """
+        return PageImageCache(self.base_tmp_dir / "page-images")
+
     @property
     @abc.abstractmethod
     def able_to_run(self) -> bool:
@@ -0,0 +1,273 @@
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional
+
+import pikepdf
+from django.conf import settings
+from PIL import Image
+from PIL import ImageOps
+
+from documents.models import Document
+from documents.parsers import ParseError
+from documents.parsers import pdfium_available
+from documents.parsers import render_pdf_page_pdfium
+from documents.parsers import run_convert
+from documents.utils import prune_least_recently_used
+
+logger = logging.getLogger("paperless.previews")
+
+# The medium thumbnail is the one created during consumption, stored next to the
+# document.  All other sizes are derived from it or rendered from the document
+# itself, and kept in the preview cache.
+THUMBNAIL_SIZE_MEDIUM = "medium"
+THUMBNAIL_SIZES: dict[str, tuple[int, int]] = {
+    "small": (200, 2000),
+}
+
+PAGE_PREVIEW_SIZE_DEFAULT = "medium"
+PAGE_PREVIEW_SIZES: dict[str, tuple[int, int]] = {
+    "medium": (1000, 10000),
+    "large": (2000, 20000),
+}
+
+
+class PreviewUnavailableError(Exception):
+    """
+    The requested preview cannot be created for this document, for example
+    because it is encrypted or its type has no pages to render
+    """
+
+
+def preview_key(document: Document) -> str:
+    """
+    Previews are keyed by the content they are rendered from, so they never
+    have to be invalidated.  A changed document simply gets new previews,
+    while old ones age out of the cache.
+    """
+    return document.archive_checksum or document.checksum
+
+
+def page_preview_tag(document: Document, page, size: str) -> str:
+    """
+    Identifies the content of a page preview, for use as its ETag
+    """
+    return f"{preview_key(document)}-{page}-{size}"
+
+
+def _cache_path(key: str, variant: str) -> Path:
+    return Path(settings.PREVIEW_CACHE_DIR) / key[:2] / f"{key}-{variant}.webp"
+
+
+def _get_cached(path: Path) -> Optional[Path]:
+    try:
+        # Updating the modified time marks the image as recently used
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+# Approximate size of the cache as seen by this process.  Other processes add
+# images as well, so the cache is rescanned whenever this exceeds the limit.
+_cache_size: Optional[int] = None
+_cache_size_lock = threading.Lock()
+
+
+def _cache_limit() -> int:
+    return settings.PREVIEW_CACHE_SIZE * 1024 * 1024
+
+
+def prune_preview_cache(limit: Optional[int] = None) -> int:
+    """
+    Removes the least recently used images until the cache is no larger than
+    the limit in bytes.  Returns the remaining size of the cache.
+    """
+    if limit is None:
+        limit = _cache_limit()
+
+    total = prune_least_recently_used(
+        Path(settings.PREVIEW_CACHE_DIR),
+        "*/*.webp",
+        limit,
+    )
+
+    logger.debug(f"Pruned the preview cache to {total} bytes")
+
+    return total
+
+
+def _account(size: int) -> None:
+    global _cache_size
+
+    with _cache_size_lock:
+        if _cache_size is None or _cache_size + size > _cache_limit():
+            _cache_size = prune_preview_cache()
+        else:
+            _cache_size += size
+
+
+def _store(image: Image.Image, path: Path) -> Path:
+    """
+    Writes the image atomically, so concurrent requests never serve a partial
+    file, and keeps the cache within its limit
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            image.save(f, format="WEBP")
+        os.replace(temp_name, path)
+    except Exception:
+        Path(temp_name).unlink(missing_ok=True)
+        raise
+
+    _account(path.stat().st_size)
+
+    return path
+
+
+def get_thumbnail_path(
+    document: Document,
+    size: str = THUMBNAIL_SIZE_MEDIUM,
+    *,
+    refresh: bool = False,
+) -> Path:
+    """
+    Returns the path to the thumbnail of the document in the given size,
+    creating it from the stored thumbnail if required.  Set refresh after the
+    stored thumbnail was recreated, to derive the other sizes again.
+    """
+    if size == THUMBNAIL_SIZE_MEDIUM:
+        return document.thumbnail_path
+    if size not in THUMBNAIL_SIZES:
+        raise ValueError(f"Unknown thumbnail size {size}")
+    if document.storage_type == Document.STORAGE_TYPE_GPG:
+        raise PreviewUnavailableError("Encrypted documents have no cached thumbnails")
+
+    path = _cache_path(preview_key(document), f"thumb-{size}")
+    cached = None if refresh else _get_cached(path)
+    if cached is not None:
+        return cached
+
+    with Image.open(document.thumbnail_path) as image:
+        image.thumbnail(THUMBNAIL_SIZES[size])
+        return _store(image, path)
+
+
+def _render_pdf_page(
+    path: Path,
+    page_index: int,
+    max_width: int,
+    max_height: int,
+) -> Image.Image:
+    if settings.THUMBNAIL_ENGINE == "PDFIUM" and pdfium_available():
+        try:
+            return render_pdf_page_pdfium(path, page_index, max_width, max_height)
+        except IndexError:
+            raise
+        except Exception as e:
+            logger.warning(
+                f"Unable to render page with pdfium, falling back to convert: {e}",
+            )
+
+    # convert fails the same way for pages past the end as for broken files
+    try:
+        with pikepdf.open(path) as pdf:
+            page_count = len(pdf.pages)
+    except pikepdf.PdfError as e:
+        raise PreviewUnavailableError(str(e)) from e
+    if not 0 <= page_index < page_count:
+        raise IndexError(f"{path} has no page {page_index + 1}")
+
+    settings.SCRATCH_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=settings.SCRATCH_DIR) as temp_dir:
+        out_path = Path(temp_dir) / "page.webp"
+        try:
+            run_convert(
+                density=300,
+                scale=f"{max_width}x{max_height}>",
+                alpha="remove",
+                strip=True,
+                auto_orient=True,
+                use_cropbox=True,
+                input_file=f"{path}[{page_index}]",
+                output_file=str(out_path),
+            )
+        except ParseError as e:
+            raise PreviewUnavailableError(str(e)) from e
+        with Image.open(out_path) as image:
+            return image.copy()
+
+
+def _render_image_page(
+    path: Path,
+    page_index: int,
+    max_width: int,
+    max_height: int,
+) -> Image.Image:
+    with Image.open(path) as image:
+        try:
+            image.seek(page_index)
+        except EOFError as e:
+            raise IndexError(f"{path} has no page {page_index + 1}") from e
+        page = ImageOps.exif_transpose(image).convert("RGB")
+
+    page.thumbnail((max_width, max_height))
+    return page
+
+
+def render_page(
+    document: Document,
+    page_index: int,
+    max_width: int,
+    max_height: int,
+) -> Image.Image:
+    """
+    Renders a single page of the document, preferring the archived version.
+
+    Raises an IndexError if the document has no such page.
+    """
+    if document.storage_type == Document.STORAGE_TYPE_GPG:
+        raise PreviewUnavailableError("Pages of encrypted documents are not rendered")
+
+    if document.has_archive_version:
+        path, mime_type = document.archive_path, "application/pdf"
+    else:
+        path, mime_type = document.source_path, document.mime_type
+
+    if mime_type == "application/pdf":
+        return _render_pdf_page(path, page_index, max_width, max_height)
+    elif mime_type.startswith("image/"):
+        return _render_image_page(path, page_index, max_width, max_height)
+
+    raise PreviewUnavailableError(f"Pages of {mime_type} documents are not rendered")
+
+
+def get_page_preview_path(
+    document: Document,
+    page: int,
+    size: str = PAGE_PREVIEW_SIZE_DEFAULT,
+) -> Path:
+    """
+    Returns the path to the preview of the given page, counted from 1, rendering
+    it if it is not cached yet.
+
+    Raises an IndexError if the document has no such page, and a
+    PreviewUnavailableError if its pages cannot be rendered at all.
+    """
+    if size not in PAGE_PREVIEW_SIZES:
+        raise ValueError(f"Unknown page preview size {size}")
+    if page < 1:
+        raise IndexError(f"There is no page {page}")
+
+    path = _cache_path(preview_key(document), f"page{page}-{size}")
+    cached = _get_cached(path)
+    if cached is not None:
+        return cached
+
+    max_width, max_height = PAGE_PREVIEW_SIZES[size]
+    image = render_page(document, page - 1, max_width, max_height)
+    return _store(image, path)
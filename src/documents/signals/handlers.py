@@ -1,6 +1,11 @@
+import copy
 import logging
 import os
 import shutil
+from collections.abc import Iterable
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
 from typing import Optional
 
 from celery import states
@@ -11,34 +16,45 @@ from celery.signals import task_prerun
 from django.conf import settings
 from django.contrib.admin.models import ADDITION
 from django.contrib.admin.models import LogEntry
+from django.contrib.auth.models import Group
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.db import DatabaseError
 from django.db import close_old_connections
 from django.db import models
+from django.db import transaction
 from django.db.models import Q
+from django.db.models import prefetch_related_objects
 from django.dispatch import receiver
 from django.utils import timezone
-from filelock import FileLock
 from guardian.shortcuts import remove_perm
 
 from documents import matching
+from documents import workflows
+from documents.audit import audit_logged
+from documents.audit import log_created_custom_fields
+from documents.caching import clear_consumer_journal
 from documents.caching import clear_document_caches
 from documents.classifier import DocumentClassifier
 from documents.consumer import parse_doc_title_w_placeholders
-from documents.file_handling import create_source_path_directory
+from documents.file_handling import claim_unique_filename
 from documents.file_handling import delete_empty_directories
-from documents.file_handling import generate_unique_filename
+from documents.file_handling import move_file
+from documents.locks import lock_documents
+from documents.locks import lock_paths
 from documents.models import CustomFieldInstance
 from documents.models import Document
 from documents.models import MatchingModel
 from documents.models import PaperlessTask
 from documents.models import Tag
-from documents.models import Workflow
 from documents.models import WorkflowAction
 from documents.models import WorkflowTrigger
 from documents.permissions import get_objects_for_user_owner_aware
 from documents.permissions import set_permissions_for_object
+from documents.permissions import set_permissions_for_objects
+from documents.workflows import WorkflowActionPlan
+from documents.workflows import WorkflowPlan
+from documents.workflows import get_workflow_plans
 
 logger = logging.getLogger("paperless.handlers")
 
@@ -303,7 +319,7 @@ def set_storage_path(
 
 # see empty_trash in documents/tasks.py for signal handling
 def cleanup_document_deletion(sender, instance, **kwargs):
-    with FileLock(settings.MEDIA_LOCK):
+    with lock_documents(instance.pk):
         if settings.EMPTY_TRASH_DIR:
             # Find a non-conflicting filename in case a document with the same
             # name was moved to trash earlier
@@ -311,26 +327,31 @@ def cleanup_document_deletion(sender, instance, **kwargs):
             old_filename = os.path.split(instance.source_path)[1]
             (old_filebase, old_fileext) = os.path.splitext(old_filename)
 
-            while True:
-                new_file_path = os.path.join(
-                    settings.EMPTY_TRASH_DIR,
-                    old_filebase + (f"_{counter:02}" if counter else "") + old_fileext,
-                )
+            with lock_paths(os.path.join(settings.EMPTY_TRASH_DIR, old_filename)):
+                while True:
+                    new_file_path = os.path.join(
+                        settings.EMPTY_TRASH_DIR,
+                        old_filebase
+                        + (f"_{counter:02}" if counter else "")
+                        + old_fileext,
+                    )
 
-                if os.path.exists(new_file_path):
-                    counter += 1
-                else:
-                    break
+                    if os.path.exists(new_file_path):
+                        counter += 1
+                    else:
+                        break
 
-            logger.debug(f"Moving {instance.source_path} to trash at {new_file_path}")
-            try:
-                shutil.move(instance.source_path, new_file_path)
-            except OSError as e:
-                logger.error(
-                    f"Failed to move {instance.source_path} to trash at "
-                    f"{new_file_path}: {e}. Skipping cleanup!",
+                logger.debug(
+                    f"Moving {instance.source_path} to trash at {new_file_path}",
                 )
-                return
+                try:
+                    shutil.move(instance.source_path, new_file_path)
+                except OSError as e:
+                    logger.error(
+                        f"Failed to move {instance.source_path} to trash at "
+                        f"{new_file_path}: {e}. Skipping cleanup!",
+                    )
+                    return
 
         for filename in (
             instance.source_path,
@@ -363,21 +384,158 @@ class CannotMoveFilesException(Exception):
     pass
 
 
+def _validate_move(instance, old_path):
+    if not os.path.isfile(old_path):
+        # Can't do anything if the old file does not exist anymore.
+        msg = f"Document {instance!s}: File {old_path} doesn't exist."
+        logger.fatal(msg)
+        raise CannotMoveFilesException(msg)
+
+
+def _move_document_files(instance: Document) -> bool:
+    """
+    Moves the files of the document to the filenames generated from its
+    metadata, and stores the new filenames.  Must be called holding the lock of
+    the document, with the filenames of the instance up to date.
+
+    Returns False if the files are where they belong already.
+    """
+    old_filename = instance.filename
+    old_source_path = instance.source_path
+
+    # Concurrent changes to other documents may generate the same filenames,
+    # so new filenames are claimed with an empty file until moved to
+    instance.filename = claim_unique_filename(instance)
+    move_original = old_filename != instance.filename
+
+    old_archive_filename = instance.archive_filename
+    old_archive_path = instance.archive_path
+
+    if instance.has_archive_version:
+        instance.archive_filename = claim_unique_filename(
+            instance,
+            archive_filename=True,
+        )
+
+        move_archive = old_archive_filename != instance.archive_filename
+    else:
+        move_archive = False
+
+    if not move_original and not move_archive:
+        return False
+
+    moved_original = False
+    moved_archive = False
+
+    try:
+        if move_original:
+            _validate_move(instance, old_source_path)
+            move_file(old_source_path, instance.source_path)
+            moved_original = True
+
+        if move_archive:
+            _validate_move(instance, old_archive_path)
+            move_file(old_archive_path, instance.archive_path)
+            moved_archive = True
+
+        # Don't save() here to prevent infinite recursion.
+        instance.modified = timezone.now()
+        Document.objects.filter(pk=instance.pk).update(
+            filename=instance.filename,
+            archive_filename=instance.archive_filename,
+            modified=instance.modified,
+        )
+
+    except (OSError, DatabaseError, CannotMoveFilesException) as e:
+        logger.warning(f"Exception during file handling: {e}")
+        # This happens when either:
+        #  - moving the files failed due to file system errors
+        #  - saving to the database failed due to database errors
+        # In both cases, we need to revert to the original state.
+
+        # Try to move files to their original location, and release the
+        # claimed filenames which weren't moved to.
+        try:
+            if moved_original:
+                logger.info("Restoring previous original path")
+                move_file(instance.source_path, old_source_path)
+            elif move_original:
+                os.unlink(instance.source_path)
+
+            if moved_archive:
+                logger.info("Restoring previous archive path")
+                move_file(instance.archive_path, old_archive_path)
+            elif move_archive:
+                os.unlink(instance.archive_path)
+
+        except Exception:
+            # This is fine, since:
+            # A: if we managed to move source from A to B, we will also
+            #  manage to move it from B to A. If not, we have a serious
+            #  issue that's going to get caught by the santiy checker.
+            #  All files remain in place and will never be overwritten,
+            #  so this is not the end of the world.
+            # B: if moving the original file failed, nothing has changed
+            #  anyway.
+            pass
+
+        # restore old values on the instance
+        instance.filename = old_filename
+        instance.archive_filename = old_archive_filename
+
+    # finally, remove any empty sub folders. This will do nothing if
+    # something has failed above.
+    if not os.path.isfile(old_source_path):
+        delete_empty_directories(
+            os.path.dirname(old_source_path),
+            root=settings.ORIGINALS_DIR,
+        )
+
+    if instance.has_archive_version and not os.path.isfile(
+        old_archive_path,
+    ):
+        delete_empty_directories(
+            os.path.dirname(old_archive_path),
+            root=settings.ARCHIVE_DIR,
+        )
+
+    return True
+
+
+# The documents to update the filenames of later, see defer_filename_updates()
+_deferred_filename_updates: ContextVar[Optional[set[int]]] = ContextVar(
+    "deferred_filename_updates",
+    default=None,
+)
+
+
+@contextmanager
+def defer_filename_updates() -> Iterator[None]:
+    """
+    Collects the documents saved in this context instead of moving their files
+    right away.  Afterwards, a background task moves the files of all of them
+    once the transaction is committed, so documents saved or tagged several
+    times are only renamed once.
+    """
+    document_ids: set[int] = set()
+    token = _deferred_filename_updates.set(document_ids)
+    try:
+        yield
+    finally:
+        _deferred_filename_updates.reset(token)
+        if document_ids:
+            from documents.tasks import update_document_filenames
+
+            ids = sorted(document_ids)
+            transaction.on_commit(lambda: update_document_filenames.delay(ids))
+
+
 @receiver(models.signals.m2m_changed, sender=Document.tags.through)
 @receiver(models.signals.post_save, sender=Document)
 def update_filename_and_move_files(sender, instance: Document, **kwargs):
-    def validate_move(instance, old_path, new_path):
-        if not os.path.isfile(old_path):
-            # Can't do anything if the old file does not exist anymore.
-            msg = f"Document {instance!s}: File {old_path} doesn't exist."
-            logger.fatal(msg)
-            raise CannotMoveFilesException(msg)
-
-        if os.path.isfile(new_path):
-            # Can't do anything if the new file already exists. Skip updating file.
-            msg = f"Document {instance!s}: Cannot rename file since target path {new_path} already exists."
-            logger.warning(msg)
-            raise CannotMoveFilesException(msg)
+    if kwargs.get("action", "").startswith("pre_"):
+        # Tags are only changed after this
+        return
 
     if not instance.filename:
         # Can't update the filename if there is no filename to begin with
@@ -390,106 +548,62 @@ def update_filename_and_move_files(sender, instance: Document, **kwargs):
         # This will in turn cause this logic to move the file where it belongs.
         return
 
-    with FileLock(settings.MEDIA_LOCK):
-        try:
-            # If this was waiting for the lock, the filename or archive_filename
-            # of this document may have been updated.  This happens if multiple updates
-            # get queued from the UI for the same document
-            # So freshen up the data before doing anything
-            instance.refresh_from_db()
-
-            old_filename = instance.filename
-            old_source_path = instance.source_path
-
-            instance.filename = generate_unique_filename(instance)
-            move_original = old_filename != instance.filename
-
-            old_archive_filename = instance.archive_filename
-            old_archive_path = instance.archive_path
-
-            if instance.has_archive_version:
-                instance.archive_filename = generate_unique_filename(
-                    instance,
-                    archive_filename=True,
-                )
-
-                move_archive = old_archive_filename != instance.archive_filename
-            else:
-                move_archive = False
-
-            if not move_original and not move_archive:
-                # Just update modified. Also, don't save() here to prevent infinite recursion.
-                Document.objects.filter(pk=instance.pk).update(
-                    modified=timezone.now(),
-                )
-                return
-
-            if move_original:
-                validate_move(instance, old_source_path, instance.source_path)
-                create_source_path_directory(instance.source_path)
-                shutil.move(old_source_path, instance.source_path)
+    deferred = _deferred_filename_updates.get()
+    if deferred is not None:
+        deferred.add(instance.pk)
+        return
 
-            if move_archive:
-                validate_move(instance, old_archive_path, instance.archive_path)
-                create_source_path_directory(instance.archive_path)
-                shutil.move(old_archive_path, instance.archive_path)
+    with lock_documents(instance.pk):
+        # If this was waiting for the lock, the filename or archive_filename
+        # of this document may have been updated.  This happens if multiple updates
+        # get queued from the UI for the same document
+        # So freshen up the data before doing anything
+        instance.refresh_from_db()
 
-            # Don't save() here to prevent infinite recursion.
+        if not _move_document_files(instance):
+            # Just update modified. Also, don't save() here to prevent infinite recursion.
             Document.objects.filter(pk=instance.pk).update(
-                filename=instance.filename,
-                archive_filename=instance.archive_filename,
                 modified=timezone.now(),
             )
-            # Clear any caching for this document.  Slightly overkill, but not terrible
-            clear_document_caches(instance.pk)
-
-        except (OSError, DatabaseError, CannotMoveFilesException) as e:
-            logger.warning(f"Exception during file handling: {e}")
-            # This happens when either:
-            #  - moving the files failed due to file system errors
-            #  - saving to the database failed due to database errors
-            # In both cases, we need to revert to the original state.
-
-            # Try to move files to their original location.
-            try:
-                if move_original and os.path.isfile(instance.source_path):
-                    logger.info("Restoring previous original path")
-                    shutil.move(instance.source_path, old_source_path)
+            return
 
-                if move_archive and os.path.isfile(instance.archive_path):
-                    logger.info("Restoring previous archive path")
-                    shutil.move(instance.archive_path, old_archive_path)
+    # Clear any caching for this document.  Slightly overkill, but not terrible
+    clear_document_caches(instance.pk)
 
-            except Exception:
-                # This is fine, since:
-                # A: if we managed to move source from A to B, we will also
-                #  manage to move it from B to A. If not, we have a serious
-                #  issue that's going to get caught by the santiy checker.
-                #  All files remain in place and will never be overwritten,
-                #  so this is not the end of the world.
-                # B: if moving the original file failed, nothing has changed
-                #  anyway.
-                pass
-
-            # restore old values on the instance
-            instance.filename = old_filename
-            instance.archive_filename = old_archive_filename
-
-        # finally, remove any empty sub folders. This will do nothing if
-        # something has failed above.
-        if not os.path.isfile(old_source_path):
-            delete_empty_directories(
-                os.path.dirname(old_source_path),
-                root=settings.ORIGINALS_DIR,
-            )
 
-        if instance.has_archive_version and not os.path.isfile(
-            old_archive_path,
-        ):
-            delete_empty_directories(
-                os.path.dirname(old_archive_path),
-                root=settings.ARCHIVE_DIR,
+def bulk_update_filenames_and_move_files(documents: Iterable[Document]) -> None:
+    """
+    Does what update_filename_and_move_files does for each of the documents,
+    locking one document at a time so other changes don't wait for all of
+    them.  The modified time of all documents whose files stay in place is
+    updated with a single query.  Callers clear the caches of the documents.
+    """
+    unmoved = []
+    for document in documents:
+        if not document.filename:
+            continue
+
+        with lock_documents(document.pk):
+            # Other updates may have moved files while this was waiting for the lock
+            filenames = (
+                Document.objects.filter(pk=document.pk)
+                .values_list("filename", "archive_filename")
+                .first()
             )
+            if filenames is None:
+                # Deleted in the meantime
+                continue
+            document.filename, document.archive_filename = filenames
+            if not _move_document_files(document):
+                unmoved.append(document)
+
+    if unmoved:
+        modified = timezone.now()
+        Document.objects.filter(
+            pk__in=[document.pk for document in unmoved],
+        ).update(modified=modified)
+        for document in unmoved:
+            document.modified = modified
 
 
 def set_log_entry(sender, document: Document, logging_group=None, **kwargs):
@@ -534,22 +648,20 @@ def run_workflow(
     logging_group=None,
 ):
     def assignment_action():
-        if action.assign_tags.all().count() > 0:
-            doc_tag_ids.extend(
-                list(action.assign_tags.all().values_list("pk", flat=True)),
-            )
+        if action.assign_tag_ids:
+            doc_tag_ids.extend(action.assign_tag_ids)
 
-        if action.assign_correspondent is not None:
-            document.correspondent = action.assign_correspondent
+        if action.assign_correspondent_id is not None:
+            document.correspondent_id = action.assign_correspondent_id
 
-        if action.assign_document_type is not None:
-            document.document_type = action.assign_document_type
+        if action.assign_document_type_id is not None:
+            document.document_type_id = action.assign_document_type_id
 
-        if action.assign_storage_path is not None:
-            document.storage_path = action.assign_storage_path
+        if action.assign_storage_path_id is not None:
+            document.storage_path_id = action.assign_storage_path_id
 
-        if action.assign_owner is not None:
-            document.owner = action.assign_owner
+        if action.assign_owner_id is not None:
+            document.owner_id = action.assign_owner_id
 
         if action.assign_title is not None:
             try:
@@ -580,44 +692,15 @@ def run_workflow(
                     extra={"group": logging_group},
                 )
 
-        if (
-            (
-                action.assign_view_users is not None
-                and action.assign_view_users.count() > 0
-            )
-            or (
-                action.assign_view_groups is not None
-                and action.assign_view_groups.count() > 0
-            )
-            or (
-                action.assign_change_users is not None
-                and action.assign_change_users.count() > 0
-            )
-            or (
-                action.assign_change_groups is not None
-                and action.assign_change_groups.count() > 0
-            )
-        ):
+        if action.assigns_permissions:
             permissions = {
                 "view": {
-                    "users": action.assign_view_users.all().values_list(
-                        "id",
-                    )
-                    or [],
-                    "groups": action.assign_view_groups.all().values_list(
-                        "id",
-                    )
-                    or [],
+                    "users": action.assign_view_user_ids,
+                    "groups": action.assign_view_group_ids,
                 },
                 "change": {
-                    "users": action.assign_change_users.all().values_list(
-                        "id",
-                    )
-                    or [],
-                    "groups": action.assign_change_groups.all().values_list(
-                        "id",
-                    )
-                    or [],
+                    "users": action.assign_change_user_ids,
+                    "groups": action.assign_change_group_ids,
                 },
             }
             set_permissions_for_object(
@@ -626,64 +709,45 @@ def run_workflow(
                 merge=True,
             )
 
-        if action.assign_custom_fields is not None:
-            for field in action.assign_custom_fields.all():
-                if (
-                    CustomFieldInstance.objects.filter(
-                        field=field,
-                        document=document,
-                    ).count()
-                    == 0
-                ):
-                    # can be triggered on existing docs, so only add the field if it doesn't already exist
+        if action.assign_custom_field_ids:
+            existing_field_ids = set(
+                CustomFieldInstance.objects.filter(document=document).values_list(
+                    "field_id",
+                    flat=True,
+                ),
+            )
+            for field_id in action.assign_custom_field_ids:
+                # can be triggered on existing docs, so only add the field if it doesn't already exist
+                if field_id not in existing_field_ids:
                     CustomFieldInstance.objects.create(
-                        field=field,
+                        field_id=field_id,
                         document=document,
                     )
 
     def removal_action():
         if action.remove_all_tags:
             doc_tag_ids.clear()
-        else:
-            for tag in action.remove_tags.filter(
-                pk__in=list(document.tags.values_list("pk", flat=True)),
-            ).all():
-                doc_tag_ids.remove(tag.pk)
+        elif action.remove_tag_ids:
+            doc_tag_ids[:] = [
+                tag_id for tag_id in doc_tag_ids if tag_id not in action.remove_tag_ids
+            ]
 
         if action.remove_all_correspondents or (
-            document.correspondent
-            and (
-                action.remove_correspondents.filter(
-                    pk=document.correspondent.pk,
-                ).exists()
-            )
+            document.correspondent_id in action.remove_correspondent_ids
         ):
             document.correspondent = None
 
         if action.remove_all_document_types or (
-            document.document_type
-            and (
-                action.remove_document_types.filter(
-                    pk=document.document_type.pk,
-                ).exists()
-            )
+            document.document_type_id in action.remove_document_type_ids
         ):
             document.document_type = None
 
         if action.remove_all_storage_paths or (
-            document.storage_path
-            and (
-                action.remove_storage_paths.filter(
-                    pk=document.storage_path.pk,
-                ).exists()
-            )
+            document.storage_path_id in action.remove_storage_path_ids
         ):
             document.storage_path = None
 
-        if action.remove_all_owners or (
-            document.owner
-            and (action.remove_owners.filter(pk=document.owner.pk).exists())
-        ):
+        if action.remove_all_owners or (document.owner_id in action.remove_owner_ids):
             document.owner = None
 
         if action.remove_all_permissions:
@@ -702,61 +766,47 @@ def run_workflow(
                 object=document,
                 merge=False,
             )
-        elif (
-            (action.remove_view_users.all().count() > 0)
-            or (action.remove_view_groups.all().count() > 0)
-            or (action.remove_change_users.all().count() > 0)
-            or (action.remove_change_groups.all().count() > 0)
-        ):
-            for user in action.remove_view_users.all():
+        elif action.removes_permissions:
+            for user in User.objects.filter(pk__in=action.remove_view_user_ids):
                 remove_perm("view_document", user, document)
-            for user in action.remove_change_users.all():
+            for user in User.objects.filter(pk__in=action.remove_change_user_ids):
                 remove_perm("change_document", user, document)
-            for group in action.remove_view_groups.all():
+            for group in Group.objects.filter(pk__in=action.remove_view_group_ids):
                 remove_perm("view_document", group, document)
-            for group in action.remove_change_groups.all():
+            for group in Group.objects.filter(pk__in=action.remove_change_group_ids):
                 remove_perm("change_document", group, document)
 
         if action.remove_all_custom_fields:
             CustomFieldInstance.objects.filter(document=document).delete()
-        elif action.remove_custom_fields.all().count() > 0:
+        elif action.remove_custom_field_ids:
             CustomFieldInstance.objects.filter(
-                field__in=action.remove_custom_fields.all(),
+                field_id__in=action.remove_custom_field_ids,
                 document=document,
             ).delete()
 
-    for workflow in (
-        Workflow.objects.filter(
-            enabled=True,
-            triggers__type=trigger_type,
-        )
-        .prefetch_related("actions")
-        .prefetch_related("actions__assign_view_users")
-        .prefetch_related("actions__assign_view_groups")
-        .prefetch_related("actions__assign_change_users")
-        .prefetch_related("actions__assign_change_groups")
-        .prefetch_related("actions__assign_custom_fields")
-        .prefetch_related("actions__remove_tags")
-        .prefetch_related("actions__remove_correspondents")
-        .prefetch_related("actions__remove_document_types")
-        .prefetch_related("actions__remove_storage_paths")
-        .prefetch_related("actions__remove_custom_fields")
-        .prefetch_related("actions__remove_owners")
-        .prefetch_related("triggers")
-        .order_by("order")
-    ):
-        # This can be called from bulk_update_documents, which may be running multiple times
-        # Refresh this so the matching data is fresh and instance fields are re-freshed
-        # Otherwise, this instance might be behind and overwrite the work another process did
-        document.refresh_from_db()
-        doc_tag_ids = list(document.tags.all().values_list("pk", flat=True))
+    workflow_plans = [
+        workflow
+        for workflow in get_workflow_plans()
+        if workflow.triggers_of_type(trigger_type)
+    ]
+    if not workflow_plans:
+        return
+
+    # This can be called from bulk_update_documents, which may be running multiple times
+    # Refresh this so the matching data is fresh and instance fields are re-freshed
+    # Otherwise, this instance might be behind and overwrite the work another process did
+    document.refresh_from_db()
+    prefetch_related_objects([document], "tags")
+
+    for workflow in workflow_plans:
         if matching.document_matches_workflow(
             document,
             workflow,
             trigger_type,
         ):
-            action: WorkflowAction
-            for action in workflow.actions.all():
+            doc_tag_ids = [tag.pk for tag in document.tags.all()]
+            action: WorkflowActionPlan
+            for action in workflow.actions:
                 logger.info(
                     f"Applying {action} from {workflow}",
                     extra={"group": logging_group},
@@ -771,6 +821,395 @@ def run_workflow(
             # save first before setting tags
             document.save()
             document.tags.set(doc_tag_ids)
+            # Saving refreshes the instance, keep the tags available for the
+            # remaining workflows
+            prefetch_related_objects([document], "tags")
+
+
+WORKFLOW_BATCH_SIZE = 500
+
+
+def run_workflow_bulk(
+    trigger_type: WorkflowTrigger.WorkflowTriggerType,
+    document_ids: Iterable[int],
+    logging_group=None,
+):
+    """
+    Runs the workflows of the given trigger type for many documents at once.
+
+    Documents are loaded in batches, matched against each workflow in memory and
+    the changes of a whole batch are written with a few bulk queries.  As with
+    run_workflow, workflows run in order and see the changes of the workflows
+    before them, and an audit log entry is still written per document.
+    """
+    workflow_plans = [
+        workflow
+        for workflow in get_workflow_plans()
+        if workflow.triggers_of_type(trigger_type)
+    ]
+    if not workflow_plans:
+        return
+
+    document_ids = list(document_ids)
+    for offset in range(0, len(document_ids), WORKFLOW_BATCH_SIZE):
+        _run_workflow_batch(
+            trigger_type,
+            workflow_plans,
+            document_ids[offset : offset + WORKFLOW_BATCH_SIZE],
+            logging_group,
+        )
+
+
+def _run_workflow_batch(
+    trigger_type: WorkflowTrigger.WorkflowTriggerType,
+    workflow_plans: list[WorkflowPlan],
+    document_ids: list[int],
+    logging_group=None,
+):
+    def assign_related(document: Document, field: str, pk: Optional[int]):
+        # Keep the related object cached, the title placeholders need it
+        related = assignable[field].get(pk)
+        if related is not None:
+            setattr(document, field, related)
+        else:
+            setattr(document, f"{field}_id", pk)
+
+    def assignment_action():
+        for document in matched:
+            if action.assign_tag_ids:
+                doc_tag_ids[document.pk].extend(action.assign_tag_ids)
+
+            if action.assign_correspondent_id is not None:
+                assign_related(
+                    document,
+                    "correspondent",
+                    action.assign_correspondent_id,
+                )
+
+            if action.assign_document_type_id is not None:
+                assign_related(
+                    document,
+                    "document_type",
+                    action.assign_document_type_id,
+                )
+
+            if action.assign_storage_path_id is not None:
+                assign_related(
+                    document,
+                    "storage_path",
+                    action.assign_storage_path_id,
+                )
+
+            if action.assign_owner_id is not None:
+                assign_related(document, "owner", action.assign_owner_id)
+
+            if action.assign_title is not None:
+                try:
+                    document.title = parse_doc_title_w_placeholders(
+                        action.assign_title,
+                        (
+                            document.correspondent.name
+                            if document.correspondent is not None
+                            else ""
+                        ),
+                        (
+                            document.document_type.name
+                            if document.document_type is not None
+                            else ""
+                        ),
+                        (document.owner.username if document.owner is not None else ""),
+                        timezone.localtime(document.added),
+                        (
+                            document.original_filename
+                            if document.original_filename is not None
+                            else ""
+                        ),
+                        timezone.localtime(document.created),
+                    )
+                except Exception:
+                    logger.exception(
+                        f"Error occurred parsing title assignment '{action.assign_title}', falling back to original",
+                        extra={"group": logging_group},
+                    )
+
+        if action.assigns_permissions:
+            permissions = {
+                "view": {
+                    "users": action.assign_view_user_ids,
+                    "groups": action.assign_view_group_ids,
+                },
+                "change": {
+                    "users": action.assign_change_user_ids,
+                    "groups": action.assign_change_group_ids,
+                },
+            }
+            set_permissions_for_objects(
+                permissions=permissions,
+                objects=matched,
+                merge=True,
+            )
+
+        if action.assign_custom_field_ids:
+            existing = set(
+                CustomFieldInstance.objects.filter(
+                    document__in=matched,
+                    field_id__in=action.assign_custom_field_ids,
+                ).values_list("document_id", "field_id"),
+            )
+            # can be triggered on existing docs, so only add the fields which don't already exist
+            missing = [
+                CustomFieldInstance(document=document, field_id=field_id)
+                for document in matched
+                for field_id in action.assign_custom_field_ids
+                if (document.pk, field_id) not in existing
+            ]
+            if missing:
+                created = CustomFieldInstance.objects.bulk_create(missing)
+                if settings.AUDIT_LOG_ENABLED:
+                    log_created_custom_fields(created)
+
+    def removal_action():
+        matched_ids = [document.pk for document in matched]
+
+        for document in matched:
+            if action.remove_all_tags:
+                doc_tag_ids[document.pk].clear()
+            elif action.remove_tag_ids:
+                doc_tag_ids[document.pk] = [
+                    tag_id
+                    for tag_id in doc_tag_ids[document.pk]
+                    if tag_id not in action.remove_tag_ids
+                ]
+
+            if action.remove_all_correspondents or (
+                document.correspondent_id in action.remove_correspondent_ids
+            ):
+                document.correspondent = None
+
+            if action.remove_all_document_types or (
+                document.document_type_id in action.remove_document_type_ids
+            ):
+                document.document_type = None
+
+            if action.remove_all_storage_paths or (
+                document.storage_path_id in action.remove_storage_path_ids
+            ):
+                document.storage_path = None
+
+            if action.remove_all_owners or (
+                document.owner_id in action.remove_owner_ids
+            ):
+                document.owner = None
+
+        if action.remove_all_permissions:
+            permissions = {
+                "view": {
+                    "users": [],
+                    "groups": [],
+                },
+                "change": {
+                    "users": [],
+                    "groups": [],
+                },
+            }
+            set_permissions_for_objects(
+                permissions=permissions,
+                objects=matched,
+                merge=False,
+            )
+        elif action.removes_permissions:
+            matched_documents = Document.objects.filter(pk__in=matched_ids)
+            for user in User.objects.filter(pk__in=action.remove_view_user_ids):
+                remove_perm("view_document", user, matched_documents)
+            for user in User.objects.filter(pk__in=action.remove_change_user_ids):
+                remove_perm("change_document", user, matched_documents)
+            for group in Group.objects.filter(pk__in=action.remove_view_group_ids):
+                remove_perm("view_document", group, matched_documents)
+            for group in Group.objects.filter(pk__in=action.remove_change_group_ids):
+                remove_perm("change_document", group, matched_documents)
+
+        if action.remove_all_custom_fields:
+            CustomFieldInstance.objects.filter(document_id__in=matched_ids).delete()
+        elif action.remove_custom_field_ids:
+            CustomFieldInstance.objects.filter(
+                field_id__in=action.remove_custom_field_ids,
+                document_id__in=matched_ids,
+            ).delete()
+
+    documents = list(
+        Document.objects.filter(pk__in=document_ids)
+        .select_related("correspondent", "document_type", "storage_path", "owner")
+        .prefetch_related("tags")
+        .order_by("pk"),
+    )
+    if not documents:
+        return
+
+    assignable = _load_assignable_objects(workflow_plans)
+    originals = {document.pk: copy.copy(document) for document in documents}
+    original_tag_ids = {
+        document.pk: [tag.pk for tag in document.tags.all()] for document in documents
+    }
+    doc_tag_ids = {pk: list(tag_ids) for pk, tag_ids in original_tag_ids.items()}
+    updated: dict[int, Document] = {}
+
+    for workflow in workflow_plans:
+        matched = [
+            document
+            for document in documents
+            if matching.document_matches_workflow(
+                document,
+                workflow,
+                trigger_type,
+                doc_tag_ids[document.pk],
+            )
+        ]
+        if not matched:
+            continue
+
+        action: WorkflowActionPlan
+        for action in workflow.actions:
+            logger.info(
+                f"Applying {action} from {workflow} to {len(matched)} document(s)",
+                extra={"group": logging_group},
+            )
+
+            if action.type == WorkflowAction.WorkflowActionType.ASSIGNMENT:
+                assignment_action()
+
+            elif action.type == WorkflowAction.WorkflowActionType.REMOVAL:
+                removal_action()
+
+        updated.update((document.pk, document) for document in matched)
+
+    if updated:
+        _save_workflow_batch(
+            list(updated.values()),
+            originals,
+            original_tag_ids,
+            doc_tag_ids,
+        )
+
+
+def _load_assignable_objects(
+    workflow_plans: list[WorkflowPlan],
+) -> dict[str, dict[int, models.Model]]:
+    """
+    Loads every object the given workflows may assign, keyed by the document field
+    """
+    ids = {
+        "correspondent": set(),
+        "document_type": set(),
+        "storage_path": set(),
+        "owner": set(),
+    }
+    for workflow in workflow_plans:
+        for action in workflow.actions:
+            for field, field_ids in ids.items():
+                pk = getattr(action, f"assign_{field}_id")
+                if pk is not None:
+                    field_ids.add(pk)
+
+    return {
+        field: (
+            Document._meta.get_field(field).related_model.objects.in_bulk(field_ids)
+            if field_ids
+            else {}
+        )
+        for field, field_ids in ids.items()
+    }
+
+
+def _save_workflow_batch(
+    documents: list[Document],
+    originals: dict[int, Document],
+    original_tag_ids: dict[int, list[int]],
+    doc_tag_ids: dict[int, list[int]],
+):
+    """
+    Writes the fields and tags changed by the workflows of a batch using bulk
+    queries and logs the changes of each document
+    """
+    now = timezone.now()
+    for document in documents:
+        # Document.modified is not set by bulk_update
+        document.modified = now
+
+    Document.objects.bulk_update(
+        documents,
+        [
+            "title",
+            "correspondent",
+            "document_type",
+            "storage_path",
+            "owner",
+            "modified",
+        ],
+    )
+
+    Through = Document.tags.through
+    removed_tags = Q()
+    added_tags = []
+    tag_changes = {}
+    for document in documents:
+        old_ids = set(original_tag_ids[document.pk])
+        new_ids = set(doc_tag_ids[document.pk])
+        if old_ids == new_ids:
+            continue
+        tag_changes[document.pk] = (new_ids - old_ids, old_ids - new_ids)
+        if old_ids - new_ids:
+            removed_tags |= Q(document_id=document.pk, tag_id__in=old_ids - new_ids)
+        added_tags.extend(
+            Through(document_id=document.pk, tag_id=tag_id)
+            for tag_id in new_ids - old_ids
+        )
+
+    if removed_tags:
+        Through.objects.filter(removed_tags).delete()
+    if added_tags:
+        Through.objects.bulk_create(added_tags, ignore_conflicts=True)
+
+    if settings.AUDIT_LOG_ENABLED and audit_logged(Document):
+        from auditlog.diff import model_instance_diff
+        from auditlog.models import LogEntry as AuditLogEntry
+
+        changed_tag_ids = set()
+        for added, removed in tag_changes.values():
+            changed_tag_ids.update(added, removed)
+        tags = Tag.objects.in_bulk(changed_tag_ids) if changed_tag_ids else {}
+
+        for document in documents:
+            changes = model_instance_diff(originals[document.pk], document)
+            if changes:
+                AuditLogEntry.objects.log_create(
+                    instance=document,
+                    changes=changes,
+                    action=AuditLogEntry.Action.UPDATE,
+                )
+            if document.pk in tag_changes:
+                added, removed = tag_changes[document.pk]
+                if removed:
+                    AuditLogEntry.objects.log_m2m_changes(
+                        [tags[pk] for pk in removed if pk in tags],
+                        document,
+                        "delete",
+                        "tags",
+                    )
+                if added:
+                    AuditLogEntry.objects.log_m2m_changes(
+                        [tags[pk] for pk in added if pk in tags],
+                        document,
+                        "add",
+                        "tags",
+                    )
+
+
+def invalidate_workflow_plans(sender, **kwargs):
+    """
+    Marks the compiled workflows outdated whenever a workflow, trigger or action
+    changes or an object referenced by one is deleted
+    """
+    workflows.invalidate_workflow_plans()
 
 
 @before_task_publish.connect
@@ -784,7 +1223,10 @@ def before_task_publish_handler(sender=None, headers=None, body=None, **kwargs):
     https://docs.celeryq.dev/en/stable/internals/protocol.html#version-2
 
     """
-    if "task" not in headers or headers["task"] != "documents.tasks.consume_file":
+    if "task" not in headers or headers["task"] not in {
+        "documents.tasks.consume_file",
+        "documents.bulk_edit.bulk_edit_job",
+    }:
         # Assumption: this is only ever a v2 message
         return
 
@@ -792,9 +1234,12 @@ def before_task_publish_handler(sender=None, headers=None, body=None, **kwargs):
         close_old_connections()
 
         task_args = body[0]
-        input_doc, _ = task_args
-
-        task_file_name = input_doc.original_file.name
+        if headers["task"] == "documents.tasks.consume_file":
+            input_doc, _ = task_args
+            task_file_name = input_doc.original_file.name
+        else:
+            # Bulk edit jobs don't run for a file
+            task_file_name = None
 
         PaperlessTask.objects.create(
             task_id=headers["id"],
@@ -863,6 +1308,15 @@ def task_postrun_handler(
         # a document from being consumed.
         logger.exception("Updating PaperlessTask failed")
 
+    try:
+        if task is not None and task.name == "documents.tasks.consume_file":
+            input_doc = kwargs["args"][0]
+            # Whether it succeeded or failed, the consumer may queue the file
+            # again if it's still there
+            clear_consumer_journal(input_doc.original_file)
+    except Exception:  # pragma: no cover
+        logger.exception("Clearing the consumer journal failed")
+
 
 @task_failure.connect
 def task_failure_handler(
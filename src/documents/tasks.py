@@ -1,10 +1,11 @@
-import hashlib
 import logging
 import shutil
 import uuid
+from collections.abc import Callable
 from datetime import timedelta
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from typing import TYPE_CHECKING
 from typing import Optional
 
 import tqdm
@@ -13,15 +14,16 @@ from celery import shared_task
 from django.conf import settings
 from django.db import models
 from django.db import transaction
-from django.db.models.signals import post_save
 from django.utils import timezone
-from filelock import FileLock
 from whoosh.writing import AsyncWriter
 
 from documents import index
 from documents import sanity_checker
 from documents.barcodes import BarcodePlugin
+from documents.caching import bulk_clear_document_caches
 from documents.caching import clear_document_caches
+from documents.caching import get_archive_source_checksum
+from documents.caching import set_archive_source_checksum
 from documents.classifier import DocumentClassifier
 from documents.classifier import load_classifier
 from documents.consumer import ConsumerPlugin
@@ -29,13 +31,16 @@ from documents.consumer import WorkflowTriggerPlugin
 from documents.data_models import ConsumableDocument
 from documents.data_models import DocumentMetadataOverrides
 from documents.double_sided import CollatePlugin
-from documents.file_handling import create_source_path_directory
-from documents.file_handling import generate_unique_filename
+from documents.file_handling import claim_unique_filename
+from documents.file_handling import move_file
+from documents.locks import lock_documents
+from documents.metadata import update_document_metadata
 from documents.models import Correspondent
 from documents.models import Document
 from documents.models import DocumentType
 from documents.models import StoragePath
 from documents.models import Tag
+from documents.models import WorkflowTrigger
 from documents.parsers import DocumentParser
 from documents.parsers import get_parser_class_for_mime_type
 from documents.plugins.base import ConsumeTaskPlugin
@@ -43,11 +48,19 @@ from documents.plugins.base import ProgressManager
 from documents.plugins.base import StopConsumeTaskError
 from documents.plugins.helpers import ProgressStatusOptions
 from documents.sanity_checker import SanityCheckFailedException
-from documents.signals import document_updated
+from documents.signals.handlers import bulk_update_filenames_and_move_files
 from documents.signals.handlers import cleanup_document_deletion
+from documents.signals.handlers import run_workflow_bulk
+from documents.utils import compute_checksum
+from documents.utils import remove_pdf_pages
+from documents.utils import rotate_pdf_pages
 
 if settings.AUDIT_LOG_ENABLED:
     from auditlog.models import LogEntry
+
+if TYPE_CHECKING:
+    import pikepdf
+
 logger = logging.getLogger("paperless.tasks")
 
 
@@ -186,30 +199,148 @@ def sanity_check():
         return "No issues detected."
 
 
+# How many documents bulk_update_documents loads, moves and indexes at once
+BULK_UPDATE_CHUNK_SIZE = 500
+
+
 @shared_task
 def bulk_update_documents(document_ids):
-    documents = Document.objects.filter(id__in=document_ids)
+    # Workflows are run for all documents at once, before loading the documents,
+    # so the instances below include their changes
+    run_workflow_bulk(
+        WorkflowTrigger.WorkflowTriggerType.DOCUMENT_UPDATED,
+        document_ids,
+        logging_group=uuid.uuid4(),
+    )
+
+    document_ids = list(document_ids)
 
     ix = index.open_index()
 
-    for doc in documents:
-        clear_document_caches(doc.pk)
-        document_updated.send(
-            sender=None,
-            document=doc,
-            logging_group=uuid.uuid4(),
+    for start in range(0, len(document_ids), BULK_UPDATE_CHUNK_SIZE):
+        chunk = document_ids[start : start + BULK_UPDATE_CHUNK_SIZE]
+        documents = list(
+            Document.objects.filter(id__in=chunk)
+            .select_related(*index.INDEX_SELECT_RELATED)
+            .prefetch_related(*index.INDEX_PREFETCH_RELATED),
         )
-        post_save.send(Document, instance=doc, created=False)
 
-    with AsyncWriter(ix) as writer:
-        for doc in documents:
-            index.update_document(writer, doc)
+        bulk_update_filenames_and_move_files(documents)
+        bulk_clear_document_caches(chunk)
+
+        with AsyncWriter(ix) as writer:
+            index.update_documents(writer, documents)
+
+
+@shared_task
+def update_document_filenames(document_ids):
+    """
+    Moves the files of documents to their current filenames, for the
+    documents collected by defer_filename_updates()
+    """
+    document_ids = list(document_ids)
+
+    for start in range(0, len(document_ids), BULK_UPDATE_CHUNK_SIZE):
+        chunk = document_ids[start : start + BULK_UPDATE_CHUNK_SIZE]
+        documents = list(
+            Document.objects.filter(id__in=chunk)
+            .select_related(*index.INDEX_SELECT_RELATED)
+            .prefetch_related(*index.INDEX_PREFETCH_RELATED),
+        )
+
+        bulk_update_filenames_and_move_files(documents)
+        bulk_clear_document_caches(chunk)
+
+
+def reuse_document_archive_pages(
+    document: Document,
+    parser: DocumentParser,
+    edit: Optional[Callable[["pikepdf.Pdf"], None]] = None,
+) -> bool:
+    """
+    Lets the parser reuse the pages of the current archive file of the
+    document, instead of creating them again.  If the pages of the original
+    were edited, edit applies the same changes to the archive file.
+    """
+    if not document.has_archive_version:
+        return False
+
+    archive_path = document.archive_path
+    try:
+        if edit is not None:
+            import pikepdf
+
+            archive_path = Path(parser.tempdir) / "edited-archive.pdf"
+            with pikepdf.open(document.archive_path) as pdf:
+                edit(pdf)
+                pdf.save(archive_path)
+        return parser.reuse_archive_pages(document.source_path, archive_path)
+    except Exception as e:
+        logger.warning(
+            f"Unable to reuse the archive file of document {document} "
+            f"(ID: {document.pk}): {e}",
+        )
+        return False
 
 
 @shared_task
-def update_document_archive_file(document_id):
+def reuse_archive_pages(document_ids: list[int]):
+    """
+    Keeps the pages of the archive files of the documents, so that documents
+    made from their pages, such as by merging or splitting them, don't have
+    to be OCRed again
+    """
+    for document in Document.objects.filter(id__in=document_ids):
+        parser_class = get_parser_class_for_mime_type(document.mime_type)
+        if not parser_class:
+            continue
+        parser: DocumentParser = parser_class(logging_group=uuid.uuid4())
+        try:
+            reuse_document_archive_pages(document, parser)
+        finally:
+            parser.cleanup()
+
+
+def archive_matches_edit(
+    document: Document,
+    archive_checksum: Optional[str],
+    source_checksum: Optional[str],
+    checksum: Optional[str],
+) -> bool:
+    """
+    Checks that the archive file of the document is the one an edit of its
+    original saw, that it was created from the original before the edit, and
+    that the original was not edited again since.  Otherwise, applying the
+    edit to the archive file would not result in the pages of the original.
+    """
+    return (
+        archive_checksum is not None
+        and document.archive_checksum == archive_checksum
+        and checksum is not None
+        and document.checksum == checksum
+        and source_checksum is not None
+        and get_archive_source_checksum(document.pk) == source_checksum
+    )
+
+
+@shared_task
+def update_document_archive_file(
+    document_id,
+    rotated_by: int = 0,
+    deleted_pages: Optional[list[int]] = None,
+    archive_checksum: Optional[str] = None,
+    source_checksum: Optional[str] = None,
+    checksum: Optional[str] = None,
+):
     """
     Re-creates the archive file of a document, including new OCR content and thumbnail
+
+    If the pages of the original were only rotated or deleted, the pages of
+    the current archive file are changed the same way and reused.  The edit
+    passes the checksums of the archive file and the original it saw before
+    editing, and the checksum of the edited original.  The pages are only
+    reused if the archive file was created from the original before the edit,
+    and neither file changed since.
     """
     document = Document.objects.get(id=document_id)
 
@@ -227,23 +358,55 @@ def update_document_archive_file(document_id):
     parser: DocumentParser = parser_class(logging_group=uuid.uuid4())
 
     try:
+        if (rotated_by or deleted_pages) and not archive_matches_edit(
+            document,
+            archive_checksum,
+            source_checksum,
+            checksum,
+        ):
+            # Another edit or a failed update came in between, the pages of
+            # the archive file would end up edited wrong
+            logger.debug(
+                f"The archive file of document {document_id} is not the one "
+                f"the edit saw, creating it again",
+            )
+        elif rotated_by or deleted_pages:
+
+            def edit(pdf) -> None:
+                if deleted_pages:
+                    remove_pdf_pages(pdf, deleted_pages)
+                if rotated_by:
+                    rotate_pdf_pages(pdf, rotated_by)
+
+            if reuse_document_archive_pages(document, parser, edit):
+                logger.debug(f"Reusing the archive pages of document {document_id}")
+
+        parser.start_thumbnail(
+            document.source_path,
+            mime_type,
+            document.get_public_filename(),
+        )
+
         parser.parse(document.source_path, mime_type, document.get_public_filename())
 
-        thumbnail = parser.get_thumbnail(
+        thumbnail = parser.finish_thumbnail(
             document.source_path,
             mime_type,
             document.get_public_filename(),
         )
 
         if parser.get_archive_path():
-            with transaction.atomic():
-                with open(parser.get_archive_path(), "rb") as f:
-                    checksum = hashlib.md5(f.read()).hexdigest()
+            parsed_checksum = document.checksum
+            with (
+                lock_documents(document.pk),
+                transaction.atomic(),
+            ):
+                checksum = compute_checksum(parser.get_archive_path())
                 # I'm going to save first so that in case the file move
                 # fails, the database is rolled back.
                 # We also don't use save() since that triggers the filehandling
                 # logic, and we don't want that yet (file not yet in place)
-                document.archive_filename = generate_unique_filename(
+                document.archive_filename = claim_unique_filename(
                     document,
                     archive_filename=True,
                 )
@@ -274,10 +437,10 @@ def update_document_archive_file(document_id):
                         action=LogEntry.Action.UPDATE,
                     )
 
-                with FileLock(settings.MEDIA_LOCK):
-                    create_source_path_directory(document.archive_path)
-                    shutil.move(parser.get_archive_path(), document.archive_path)
-                    shutil.move(thumbnail, document.thumbnail_path)
+                move_file(parser.get_archive_path(), document.archive_path)
+                shutil.move(thumbnail, document.thumbnail_path)
+
+            set_archive_source_checksum(document.pk, parsed_checksum)
 
             document.refresh_from_db()
             logger.info(
@@ -286,6 +449,8 @@ def update_document_archive_file(document_id):
             with index.open_index_writer() as writer:
                 index.update_document(writer, document)
 
+            update_document_metadata(document, parser=parser)
+
             clear_document_caches(document.pk)
 
     except Exception:
@@ -7,3 +7,14 @@ from pytest_django.fixtures import SettingsWrapper
 @pytest.fixture()
 def settings_timezone(settings: SettingsWrapper) -> zoneinfo.ZoneInfo:
     return zoneinfo.ZoneInfo(settings.TIME_ZONE)
+
+
+@pytest.fixture(autouse=True)
+def reset_workflow_plans():
+    """
+    Compiled workflows are cached per process, but database changes are rolled
+    back between tests without any signal
+    """
+    from documents.caching import bump_workflow_generation
+
+    bump_workflow_generation()
@@ -2,10 +2,12 @@ import json
 from unittest import mock
 
 from django.contrib.auth.models import User
+from django.test import override_settings
 from guardian.shortcuts import assign_perm
 from rest_framework import status
 from rest_framework.test import APITestCase
 
+from documents import bulk_edit
 from documents.models import Correspondent
 from documents.models import CustomField
 from documents.models import Document
@@ -495,6 +497,42 @@ class TestBulkEditAPI(DirectoriesMixin, APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(Document.objects.count(), 5)
 
+    @override_settings(BULK_EDIT_CHUNK_SIZE=2)
+    @mock.patch("documents.bulk_edit.bulk_edit_job.delay")
+    def test_api_bulk_edit_job(self, bulk_edit_job_mock):
+        """
+        GIVEN:
+            - API data to add a tag to more documents than fit into a chunk
+        WHEN:
+            - API is called
+        THEN:
+            - The documents are edited by a background job
+            - The ID of the job is returned
+        """
+        bulk_edit_job_mock.return_value = mock.Mock(id="job")
+        doc_ids = [self.doc1.id, self.doc2.id, self.doc3.id]
+
+        response = self.client.post(
+            "/api/documents/bulk_edit/",
+            json.dumps(
+                {
+                    "documents": doc_ids,
+                    "method": "add_tag",
+                    "parameters": {"tag": self.t1.id},
+                },
+            ),
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"result": "OK", "task_id": "job"})
+        bulk_edit_job_mock.assert_called_once_with(
+            bulk_edit.add_tag,
+            doc_ids,
+            {"tag": self.t1.id},
+        )
+        self.async_task.assert_not_called()
+
     def test_api_invalid_method(self):
         self.assertEqual(Document.objects.count(), 5)
         response = self.client.post(
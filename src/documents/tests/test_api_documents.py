@@ -36,6 +36,7 @@ from documents.models import SavedView
 from documents.models import ShareLink
 from documents.models import StoragePath
 from documents.models import Tag
+from documents.parsers import parse_date_generator
 from documents.tests.utils import DirectoriesMixin
 from documents.tests.utils import DocumentConsumeDelayMixin
 
@@ -316,6 +317,41 @@ class TestDocumentApi(DirectoriesMixin, DocumentConsumeDelayMixin, APITestCase):
         response = self.client.get(f"/api/documents/{doc.pk}/thumb/")
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    @override_settings(FILENAME_FORMAT="{correspondent}/{title}")
+    @mock.patch("documents.tasks.update_document_filenames.delay")
+    def test_update_document_defers_renaming(self, m):
+        """
+        GIVEN:
+            - Document with a file
+        WHEN:
+            - The title and tags of the document are updated
+        THEN:
+            - The file is not moved during the request
+            - One task moving the file is started after the request
+        """
+        doc = Document.objects.create(
+            title="First title",
+            checksum="123",
+            mime_type="application/pdf",
+            filename="none/First title.pdf",
+        )
+        Path(doc.source_path).parent.mkdir(parents=True)
+        Path(doc.source_path).touch()
+        tag = Tag.objects.create(name="t")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/documents/{doc.pk}/",
+                {"title": "New title", "tags": [tag.pk]},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        doc.refresh_from_db()
+        self.assertEqual(doc.filename, "none/First title.pdf")
+        self.assertTrue(Path(doc.source_path).is_file())
+        m.assert_called_once_with([doc.pk])
+
     def test_document_history_action(self):
         """
         GIVEN:
@@ -1658,6 +1694,41 @@ class TestDocumentApi(DirectoriesMixin, DocumentConsumeDelayMixin, APITestCase):
         self.client.get(f"/api/documents/{doc.pk}/suggestions/")
         self.assertFalse(parse_date_generator.called)
 
+    @override_settings(NUMBER_OF_SUGGESTED_DATES=10)
+    def test_get_suggestions_dates_cached(self):
+        """
+        GIVEN:
+            - Two documents with the same content
+        WHEN:
+            - API request for the suggestions of both documents
+        THEN:
+            - Dates are only parsed once and suggested for both
+        """
+        doc1 = Document.objects.create(
+            title="test",
+            checksum="1",
+            mime_type="application/pdf",
+            content="this is an invoice from 12.04.2022!",
+        )
+        doc2 = Document.objects.create(
+            title="test",
+            checksum="2",
+            mime_type="application/pdf",
+            content="this is an invoice from 12.04.2022!",
+        )
+
+        with mock.patch(
+            "documents.views.parse_date_generator",
+            wraps=parse_date_generator,
+        ) as mocked_generator:
+            response = self.client.get(f"/api/documents/{doc1.pk}/suggestions/")
+            self.assertEqual(response.data["dates"], ["2022-04-12"])
+
+            response = self.client.get(f"/api/documents/{doc2.pk}/suggestions/")
+            self.assertEqual(response.data["dates"], ["2022-04-12"])
+
+            mocked_generator.assert_called_once()
+
     def test_saved_views(self):
         u1 = User.objects.create_superuser("user1")
         u2 = User.objects.create_superuser("user2")
@@ -4,10 +4,13 @@ from pathlib import Path
 from unittest import mock
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import override_settings
 from rest_framework import status
 from rest_framework.test import APITestCase
 
+from documents.caching import CONSUMER_METRICS_KEY
+from documents.caching import set_consumer_metrics
 from documents.classifier import ClassifierModelCorruptError
 from documents.classifier import DocumentClassifier
 from documents.classifier import load_classifier
@@ -49,6 +52,25 @@ class TestSystemStatus(APITestCase):
         self.assertEqual(response.data["tasks"]["redis_url"], "redis://localhost:6379")
         self.assertEqual(response.data["tasks"]["redis_status"], "ERROR")
         self.assertIsNotNone(response.data["tasks"]["redis_error"])
+        self.assertIsNone(response.data["ocr_scheduler"])
+
+    def test_system_status_consumer(self):
+        """
+        GIVEN:
+            - The consumer published its metrics
+        WHEN:
+            - The user requests the system status
+        THEN:
+            - The response contains the metrics of the consumer
+        """
+        metrics = {"pending": 3, "debounced": 10, "waiting": 0, "queued": 10}
+        set_consumer_metrics(metrics)
+        self.addCleanup(cache.delete, CONSUMER_METRICS_KEY)
+
+        self.client.force_login(self.user)
+        response = self.client.get(self.ENDPOINT)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["consumer"], metrics)
 
     def test_system_status_insufficient_permissions(self):
         """
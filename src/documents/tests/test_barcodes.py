@@ -8,6 +8,8 @@ import pytest
 from django.conf import settings
 from django.test import TestCase
 from django.test import override_settings
+from pikepdf import Pdf
+from PIL import Image
 
 from documents import tasks
 from documents.barcodes import BarcodePlugin
@@ -22,6 +24,7 @@ from documents.tests.utils import DocumentConsumeDelayMixin
 from documents.tests.utils import DummyProgressManager
 from documents.tests.utils import FileSystemAssertsMixin
 from documents.tests.utils import SampleDirMixin
+from paperless_tesseract.parsers import RasterisedDocumentParser
 
 try:
     import zxingcpp  # noqa: F401
@@ -166,6 +169,91 @@ class TestBarcode(
             self.assertEqual(reader.pdf_file, test_file)
             self.assertDictEqual(separator_page_numbers, {2: False, 5: False})
 
+    @override_settings(CONSUMER_BARCODE_PREVIEW_DPI=150)
+    def test_scan_file_for_separating_barcodes_preview_dpi(self):
+        """
+        GIVEN:
+            - PDF file containing a separator on pages 2 and 5 (zero indexed)
+            - A lower DPI for a first scan
+        WHEN:
+            - File is scanned for barcodes
+        THEN:
+            - Only pages 2 and 5 are scanned again at the configured DPI
+            - Barcode is detected on pages 2 and 5 (zero indexed)
+        """
+        test_file = self.BARCODE_SAMPLE_DIR / "several-patcht-codes.pdf"
+
+        with self.get_reader(test_file) as reader:
+            with mock.patch.object(
+                reader,
+                "scan_pages",
+                wraps=reader.scan_pages,
+            ) as scan_pages:
+                reader.detect()
+
+            self.assertEqual(scan_pages.call_count, 2)
+            self.assertEqual(scan_pages.call_args_list[0].args[1], 150)
+            self.assertEqual(scan_pages.call_args_list[1].args[:2], ([2, 5], 300))
+            self.assertDictEqual(reader.get_separation_pages(), {2: False, 5: False})
+
+    @mock.patch("documents.barcodes.pdfium_available", return_value=False)
+    @mock.patch("documents.barcodes.convert_from_path")
+    def test_render_pages_batched(self, convert_from_path, _):
+        """
+        GIVEN:
+            - Pages cannot be rendered in process
+        WHEN:
+            - Pages are rendered for barcode scanning
+        THEN:
+            - The first page is converted by itself, in color
+            - Other consecutive pages are converted by a single call, in grayscale
+        """
+        convert_from_path.side_effect = lambda *args, first_page, last_page, **kwargs: [
+            Image.new("L", (10, 10)) for _ in range(first_page, last_page + 1)
+        ]
+        test_file = self.BARCODE_SAMPLE_DIR / "several-patcht-codes.pdf"
+
+        with self.get_reader(test_file) as reader:
+            pages = [page for page, _ in reader.render_pages([0, 1, 2, 5], 300)]
+
+        self.assertEqual(pages, [0, 1, 2, 5])
+        self.assertEqual(
+            [
+                (call.kwargs["first_page"], call.kwargs["last_page"])
+                for call in convert_from_path.call_args_list
+            ],
+            [(1, 1), (2, 3), (6, 6)],
+        )
+        self.assertNotIn("grayscale", convert_from_path.call_args_list[0].kwargs)
+        self.assertTrue(convert_from_path.call_args.kwargs["grayscale"])
+
+    def test_first_page_kept(self):
+        """
+        GIVEN:
+            - PDF file containing barcodes
+        WHEN:
+            - File is scanned for barcodes
+        THEN:
+            - The first page is kept for the consume task, in color
+            - Barcodes are still detected
+        """
+        test_file = self.BARCODE_SAMPLE_DIR / "patch-code-t-middle.pdf"
+
+        with self.get_reader(test_file) as reader:
+            reader.detect()
+
+            self.assertDictEqual(reader.get_separation_pages(), {1: False})
+            found = reader.page_images.get(
+                reader.page_images.document_key(test_file),
+                0,
+                min_dpi=settings.CONSUMER_BARCODE_DPI,
+            )
+
+        self.assertIsNotNone(found)
+        dpi, image = found
+        self.assertEqual(dpi, settings.CONSUMER_BARCODE_DPI)
+        self.assertEqual(image.mode, "RGB")
+
     def test_scan_file_for_separating_barcodes_hard_to_detect(self):
         """
         GIVEN:
@@ -566,6 +654,89 @@ class TestBarcodeNewConsume(
                 self.assertIsFile(new_input_doc.original_file)
                 self.assertEqual(overrides, new_doc_overrides)
 
+    @override_settings(
+        CONSUMER_ENABLE_BARCODES=True,
+        CONSUMER_BARCODE_SCANNER="ZXING",
+        CONSUMER_BARCODE_OCR_BEFORE_SPLIT=True,
+        OCR_CACHE_SIZE=1000,
+    )
+    @mock.patch("ocrmypdf.ocr")
+    def test_consume_barcode_file_ocr_before_split(self, ocr):
+        """
+        GIVEN:
+            - Incoming file with at 1 barcode producing 2 documents
+            - OCR before splitting is enabled
+        WHEN:
+            - The document is split and the split documents are parsed
+        THEN:
+            - All pages are OCRed once, before splitting
+            - The split documents are not OCRed again
+        """
+
+        def fake_ocr(input_file, output_file, sidecar, **kwargs):
+            shutil.copy(input_file, output_file)
+            with Pdf.open(input_file) as pdf:
+                Path(sidecar).write_text("\f".join("Page" for _ in pdf.pages))
+
+        ocr.side_effect = fake_ocr
+
+        test_file = self.BARCODE_SAMPLE_DIR / "patch-code-t-middle.pdf"
+        temp_copy = self.dirs.scratch_dir / test_file.name
+        shutil.copy(test_file, temp_copy)
+
+        with mock.patch("documents.tasks.ProgressManager", DummyProgressManager):
+            tasks.consume_file(
+                ConsumableDocument(
+                    source=DocumentSource.ConsumeFolder,
+                    original_file=temp_copy,
+                ),
+                DocumentMetadataOverrides(),
+            )
+
+        self.assertEqual(ocr.call_count, 1)
+        self.assertEqual(self.consume_file_mock.call_count, 2)
+
+        for new_input_doc, _ in self.get_all_consume_delay_call_args():
+            parser = RasterisedDocumentParser(None)
+            parser.parse(new_input_doc.original_file, "application/pdf")
+            self.assertIsFile(parser.get_archive_path())
+            parser.cleanup()
+
+        self.assertEqual(ocr.call_count, 1)
+
+    @override_settings(
+        CONSUMER_ENABLE_BARCODES=True,
+        CONSUMER_BARCODE_SCANNER="ZXING",
+        CONSUMER_BARCODE_OCR_BEFORE_SPLIT=True,
+        OCR_CACHE_SIZE=0,
+    )
+    @mock.patch("ocrmypdf.ocr")
+    def test_consume_barcode_file_ocr_before_split_no_cache(self, ocr):
+        """
+        GIVEN:
+            - Incoming file with at 1 barcode producing 2 documents
+            - OCR before splitting is enabled, but the OCR cache is not
+        WHEN:
+            - The document is split
+        THEN:
+            - The pages are not OCRed before splitting
+        """
+        test_file = self.BARCODE_SAMPLE_DIR / "patch-code-t-middle.pdf"
+        temp_copy = self.dirs.scratch_dir / test_file.name
+        shutil.copy(test_file, temp_copy)
+
+        with mock.patch("documents.tasks.ProgressManager", DummyProgressManager):
+            tasks.consume_file(
+                ConsumableDocument(
+                    source=DocumentSource.ConsumeFolder,
+                    original_file=temp_copy,
+                ),
+                DocumentMetadataOverrides(),
+            )
+
+        ocr.assert_not_called()
+        self.assertEqual(self.consume_file_mock.call_count, 2)
+
 
 class TestAsnBarcode(DirectoriesMixin, SampleDirMixin, GetReaderPluginMixin, TestCase):
     @contextmanager
@@ -2,19 +2,25 @@ import shutil
 from pathlib import Path
 from unittest import mock
 
+from auditlog.context import set_actor
+from auditlog.models import LogEntry
 from django.contrib.auth.models import Group
 from django.contrib.auth.models import User
 from django.test import TestCase
+from django.test import override_settings
 from guardian.shortcuts import assign_perm
 from guardian.shortcuts import get_groups_with_perms
 from guardian.shortcuts import get_users_with_perms
 
 from documents import bulk_edit
+from documents.caching import get_bulk_edit_job_progress
+from documents.caching import set_bulk_edit_job_progress
 from documents.models import Correspondent
 from documents.models import CustomField
 from documents.models import CustomFieldInstance
 from documents.models import Document
 from documents.models import DocumentType
+from documents.models import PaperlessTask
 from documents.models import StoragePath
 from documents.models import Tag
 from documents.tests.utils import DirectoriesMixin
@@ -235,6 +241,55 @@ class TestBulkEdit(DirectoriesMixin, TestCase):
         args, kwargs = self.async_task.call_args
         self.assertCountEqual(kwargs["document_ids"], [self.doc1.id, self.doc2.id])
 
+    def test_modify_custom_fields_audit_log(self):
+        """
+        GIVEN:
+            - Documents with and without a custom field, one with a value
+        WHEN:
+            - Custom fields are added and removed in bulk by a user
+        THEN:
+            - Existing fields keep their values
+            - Every added and removed field is logged, with the user as actor
+        """
+        cf = CustomField.objects.create(
+            name="cf1",
+            data_type=CustomField.FieldDataType.STRING,
+        )
+        cf2 = CustomField.objects.create(
+            name="cf2",
+            data_type=CustomField.FieldDataType.STRING,
+        )
+        CustomFieldInstance.objects.create(
+            document=self.doc1,
+            field=cf,
+            value_text="kept",
+        )
+        CustomFieldInstance.objects.create(document=self.doc2, field=cf2)
+        LogEntry.objects.all().delete()
+
+        with set_actor(self.owner):
+            bulk_edit.modify_custom_fields(
+                [self.doc1.id, self.doc2.id, self.doc3.id],
+                add_custom_fields=[cf.id],
+                remove_custom_fields=[cf2.id],
+            )
+
+        self.assertEqual(
+            CustomFieldInstance.objects.get(document=self.doc1, field=cf).value,
+            "kept",
+        )
+        self.assertEqual(CustomFieldInstance.objects.filter(field=cf).count(), 3)
+        self.assertEqual(CustomFieldInstance.objects.filter(field=cf2).count(), 0)
+
+        created = LogEntry.objects.filter(action=LogEntry.Action.CREATE)
+        self.assertCountEqual(
+            created.values_list("object_repr", flat=True),
+            ["cf1 : None", "cf1 : None"],
+        )
+        deleted = LogEntry.objects.get(action=LogEntry.Action.DELETE)
+        self.assertEqual(deleted.object_repr, "cf2 : None")
+        self.assertEqual(LogEntry.objects.filter(actor=self.owner).count(), 3)
+
     def test_delete(self):
         self.assertEqual(Document.objects.count(), 5)
         bulk_edit.delete([self.doc1.id, self.doc2.id])
@@ -283,6 +338,61 @@ class TestBulkEdit(DirectoriesMixin, TestCase):
         )
         self.assertEqual(groups_with_perms.count(), 1)
 
+    @mock.patch("documents.tasks.bulk_update_documents.delay")
+    def test_set_permissions_bulk(self, m):
+        """
+        GIVEN:
+            - Documents with different existing permissions
+        WHEN:
+            - Permissions are set for all documents at once
+        THEN:
+            - Permissions not given anymore are removed from all documents
+            - Change permissions also give view permissions
+            - The number of queries does not depend on the number of documents
+        """
+        doc_ids = [self.doc1.id, self.doc2.id, self.doc3.id, self.doc4.id]
+        assign_perm("view_document", self.user2, self.doc1)
+        assign_perm("change_document", self.user2, self.doc2)
+        assign_perm("view_document", self.group1, self.doc3)
+        assign_perm("view_document", self.user1, self.doc4)
+
+        permissions = {
+            "view": {
+                "users": [self.user1.id],
+                "groups": [],
+            },
+            "change": {
+                "users": [],
+                "groups": [self.group2.id],
+            },
+        }
+
+        with self.assertNumQueries(15):
+            bulk_edit.set_permissions(doc_ids, set_permissions=permissions)
+
+        for doc in Document.objects.filter(id__in=doc_ids):
+            self.assertDictEqual(
+                {
+                    user.username: sorted(perms)
+                    for user, perms in get_users_with_perms(
+                        doc,
+                        attach_perms=True,
+                        with_group_users=False,
+                    ).items()
+                },
+                {"user1": ["view_document"]},
+            )
+            self.assertDictEqual(
+                {
+                    group.name: sorted(perms)
+                    for group, perms in get_groups_with_perms(
+                        doc,
+                        attach_perms=True,
+                    ).items()
+                },
+                {"group2": ["change_document", "view_document"]},
+            )
+
     @mock.patch("documents.tasks.bulk_update_documents.delay")
     def test_set_permissions_merge(self, m):
         doc_ids = [self.doc1.id, self.doc2.id, self.doc3.id]
@@ -328,6 +438,105 @@ class TestBulkEdit(DirectoriesMixin, TestCase):
         self.assertEqual(groups_with_perms.count(), 2)
 
 
+@override_settings(BULK_EDIT_CHUNK_SIZE=2)
+class TestBulkEditJob(DirectoriesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        patcher = mock.patch("documents.bulk_edit.bulk_update_documents.delay")
+        self.async_task = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tag = Tag.objects.create(name="t")
+        self.docs = [
+            Document.objects.create(checksum=str(i), title=str(i)) for i in range(5)
+        ]
+        self.doc_ids = [doc.id for doc in self.docs]
+
+    def _run_job(self, job_id: str, method=bulk_edit.add_tag):
+        return bulk_edit.bulk_edit_job.apply(
+            args=(method, self.doc_ids, {"tag": self.tag.id}),
+            task_id=job_id,
+        )
+
+    def test_bulk_edit_job(self):
+        """
+        GIVEN:
+            - More documents than fit into a chunk
+        WHEN:
+            - The documents are edited as a job
+        THEN:
+            - The documents are edited a chunk at a time
+            - The progress is reported as the result of the task
+        """
+        PaperlessTask.objects.create(
+            task_id="job",
+            task_name="documents.bulk_edit.bulk_edit_job",
+        )
+        progress = []
+
+        def add_tag(doc_ids, tag):
+            progress.append(PaperlessTask.objects.get(task_id="job").result)
+            bulk_edit.add_tag(doc_ids, tag)
+
+        result = self._run_job("job", method=add_tag)
+
+        self.assertEqual(result.get(), "Edited 5 documents")
+        self.assertEqual(Document.objects.filter(tags__id=self.tag.id).count(), 5)
+        self.assertEqual(self.async_task.call_count, 3)
+        self.assertListEqual(
+            progress,
+            [None, "Edited 2 of 5 documents", "Edited 4 of 5 documents"],
+        )
+        self.assertEqual(get_bulk_edit_job_progress("job"), 0)
+
+    def test_bulk_edit_job_resumed(self):
+        """
+        GIVEN:
+            - A job which edited the first chunk before its worker was lost
+        WHEN:
+            - The job is delivered again
+        THEN:
+            - Only the documents after the first chunk are edited
+        """
+        set_bulk_edit_job_progress("resumed", 2)
+
+        self._run_job("resumed")
+
+        self.assertListEqual(
+            list(
+                Document.objects.filter(tags__id=self.tag.id)
+                .order_by("id")
+                .values_list("id", flat=True),
+            ),
+            self.doc_ids[2:],
+        )
+
+    def test_bulk_edit_job_failed(self):
+        """
+        GIVEN:
+            - A bulk edit method which fails for the second chunk
+        WHEN:
+            - The documents are edited as a job
+        THEN:
+            - The first chunk stays edited
+            - The job fails
+        """
+        calls = []
+
+        def fail_second(doc_ids, tag):
+            calls.append(doc_ids)
+            if len(calls) == 2:
+                raise ValueError("Broken")
+            bulk_edit.add_tag(doc_ids, tag)
+
+        result = self._run_job("failed", method=fail_second)
+
+        with self.assertRaises(ValueError):
+            result.get()
+        self.assertEqual(Document.objects.filter(tags__id=self.tag.id).count(), 2)
+        self.assertEqual(get_bulk_edit_job_progress("failed"), 0)
+
+
 class TestPDFActions(DirectoriesMixin, TestCase):
     def setUp(self):
         super().setUp()
@@ -611,6 +820,13 @@ class TestPDFActions(DirectoriesMixin, TestCase):
         doc_ids = [self.doc1.id, self.doc2.id]
         result = bulk_edit.rotate(doc_ids, 90)
         self.assertEqual(mock_update_document.call_count, 2)
+        mock_update_document.assert_any_call(
+            document_id=self.doc2.id,
+            rotated_by=90,
+            archive_checksum=self.doc2.archive_checksum,
+            source_checksum="B",
+            checksum=mock.ANY,
+        )
         mock_update_documents.assert_called_once()
         mock_chord.assert_called_once()
         self.assertEqual(result, "OK")
@@ -686,7 +902,13 @@ class TestPDFActions(DirectoriesMixin, TestCase):
         pages = [1, 3]
         result = bulk_edit.delete_pages(doc_ids, pages)
         mock_pdf_save.assert_called_once()
-        mock_update_archive_file.assert_called_once()
+        mock_update_archive_file.assert_called_once_with(
+            document_id=self.doc2.id,
+            deleted_pages=[1, 3],
+            archive_checksum=self.doc2.archive_checksum,
+            source_checksum="B",
+            checksum=mock.ANY,
+        )
         self.assertEqual(result, "OK")
 
     @mock.patch("documents.tasks.update_document_archive_file.delay")
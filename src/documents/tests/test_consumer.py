@@ -4,6 +4,7 @@ import re
 import shutil
 import stat
 import tempfile
+import threading
 import zoneinfo
 from pathlib import Path
 from unittest import TestCase as UnittestTestCase
@@ -14,6 +15,7 @@ from dateutil import tz
 from django.conf import settings
 from django.contrib.auth.models import Group
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
 from django.test import override_settings
 from django.utils import timezone
@@ -195,6 +197,31 @@ class DummyParser(_BaseTestParser):
         self.text = "The Text"
 
 
+class PageImageKeyParser(DummyParser):
+    def parse(self, document_path, mime_type, file_name=None):
+        self.page_image_key = self.page_images.document_key(document_path)
+        super().parse(document_path, mime_type, file_name)
+
+
+class ConcurrentThumbnailParser(DummyParser):
+    def __init__(self, logging_group, scratch_dir, archive_path):
+        super().__init__(logging_group, scratch_dir, archive_path)
+        self.thumbnail_started = threading.Event()
+
+    def supports_concurrent_thumbnail(self, mime_type) -> bool:
+        return True
+
+    def get_thumbnail(self, document_path, mime_type, file_name=None):
+        self.thumbnail_started.set()
+        return super().get_thumbnail(document_path, mime_type, file_name)
+
+    def parse(self, document_path, mime_type, file_name=None):
+        # Only finishes if the thumbnail is created at the same time
+        if not self.thumbnail_started.wait(timeout=10):
+            raise ParseError("Thumbnail was not started")
+        super().parse(document_path, mime_type, file_name)
+
+
 class CopyParser(_BaseTestParser):
     def get_thumbnail(self, document_path, mime_type, file_name=None):
         return self.fake_thumb
@@ -342,6 +369,78 @@ class TestConsumer(
         shutil.copy(src, dst)
         return dst
 
+    @mock.patch("documents.page_images.compute_checksum")
+    @mock.patch("documents.parsers.document_consumer_declaration.send")
+    def testPageImageKeyFromChecksum(self, m, compute_checksum):
+        """
+        GIVEN:
+            - A parser looking up the pages rendered before consuming
+        WHEN:
+            - A document is consumed
+        THEN:
+            - The checksum computed while copying the document is the key of
+              its page images
+            - The document is not read again to compute the key
+        """
+        parser = PageImageKeyParser(
+            None,
+            self.dirs.scratch_dir,
+            self.get_test_archive_file(),
+        )
+        m.return_value = [
+            (
+                None,
+                {
+                    "parser": lambda logging_group, progress_callback=None: parser,
+                    "mime_types": {"application/pdf": ".pdf"},
+                    "weight": 0,
+                },
+            ),
+        ]
+
+        with self.get_consumer(self.get_test_file()) as consumer:
+            consumer.run()
+
+        document = Document.objects.first()
+        self.assertEqual(parser.page_image_key, document.checksum)
+        compute_checksum.assert_not_called()
+
+    @mock.patch("documents.parsers.document_consumer_declaration.send")
+    def testConcurrentThumbnail(self, m):
+        """
+        GIVEN:
+            - A parser which can create the thumbnail without the parse results
+        WHEN:
+            - A document is consumed
+        THEN:
+            - The thumbnail is created while the document is parsed
+        """
+        m.return_value = [
+            (
+                None,
+                {
+                    "parser": lambda logging_group, progress_callback=None: (
+                        ConcurrentThumbnailParser(
+                            logging_group,
+                            self.dirs.scratch_dir,
+                            self.get_test_archive_file(),
+                        )
+                    ),
+                    "mime_types": {"application/pdf": ".pdf"},
+                    "weight": 0,
+                },
+            ),
+        ]
+
+        with self.get_consumer(self.get_test_file()) as consumer:
+            consumer.run()
+
+        document = Document.objects.first()
+        self.assertEqual(document.content, "The Text")
+        self.assertIsFile(document.thumbnail_path)
+
+        self._assert_first_last_send_progress()
+
     @override_settings(FILENAME_FORMAT=None, TIME_ZONE="America/Chicago")
     def testNormalOperation(self):
         filename = self.get_test_file()
@@ -376,6 +475,12 @@ class TestConsumer(
         self.assertEqual(document.checksum, "42995833e01aea9b3edee44bbfdd7ce1")
         self.assertEqual(document.archive_checksum, "62acb0bcbfbcaa62ca6ad3668e4e404b")
 
+        self.assertEqual(document.file_metadata.original_checksum, document.checksum)
+        self.assertEqual(
+            document.file_metadata.archive_checksum,
+            document.archive_checksum,
+        )
+
         self.assertIsNotFile(filename)
 
         self._assert_first_last_send_progress()
@@ -395,6 +500,38 @@ class TestConsumer(
         self.assertEqual(document_date_local.minute, rough_create_date_local.minute)
         # Skipping seconds and more precise
 
+    def testMetadataAfterTransaction(self):
+        """
+        GIVEN:
+            - A document to consume
+            - Storing its metadata fails
+        WHEN:
+            - The document is consumed
+        THEN:
+            - The metadata is stored after the transaction storing the
+              document ended
+            - The document is consumed anyway
+        """
+        filename = self.get_test_file()
+        atomic_depth = len(connection.atomic_blocks)
+        depths = []
+
+        def update_document_metadata(document, parser):
+            depths.append(len(connection.atomic_blocks))
+            raise OSError("Broken")
+
+        with mock.patch(
+            "documents.consumer.update_document_metadata",
+            side_effect=update_document_metadata,
+        ):
+            with self.get_consumer(filename) as consumer:
+                consumer.run()
+
+        self.assertEqual(depths, [atomic_depth])
+        document = Document.objects.get()
+        self.assertIsFile(document.source_path)
+        self.assertIsNotFile(filename)
+
     @override_settings(FILENAME_FORMAT=None)
     def testDeleteMacFiles(self):
         # https://github.com/jonaswinkler/paperless-ng/discussions/1037
@@ -789,7 +926,7 @@ class TestConsumer(
         self._assert_first_last_send_progress()
 
     @override_settings(FILENAME_FORMAT="{correspondent}/{title}")
-    @mock.patch("documents.signals.handlers.generate_unique_filename")
+    @mock.patch("documents.signals.handlers.claim_unique_filename")
     def testFilenameHandlingUnstableFormat(self, m):
         filenames = ["this", "that", "now this", "i cannot decide"]
 
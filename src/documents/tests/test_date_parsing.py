@@ -1,10 +1,12 @@
 import datetime
 from zoneinfo import ZoneInfo
 
+import pytest
 from pytest_django.fixtures import SettingsWrapper
 
 from documents.parsers import parse_date
 from documents.parsers import parse_date_generator
+from documents.parsers import parse_numeric_date
 
 
 class TestDate:
@@ -514,3 +516,124 @@ class TestDate:
             0,
             tzinfo=settings_timezone,
         )
+
+    @pytest.mark.parametrize(
+        ("date_string", "date_order", "expected"),
+        [
+            ("24.12.2019", "DMY", datetime.date(2019, 12, 24)),
+            ("12/24/2019", "MDY", datetime.date(2019, 12, 24)),
+            ("3-4-2019", "DYM", datetime.date(2019, 4, 3)),
+            ("3-4-2019", "MYD", datetime.date(2019, 3, 4)),
+            ("2019-24-12", "DMY", datetime.date(2019, 12, 24)),
+            ("2019.24.12", "YDM", datetime.date(2019, 12, 24)),
+            ("2019/4/3", "YMD", datetime.date(2019, 4, 3)),
+        ],
+    )
+    def test_numeric_date(
+        self,
+        date_string: str,
+        date_order: str,
+        expected: datetime.date,
+        settings_timezone: ZoneInfo,
+    ):
+        """
+        GIVEN:
+            - A numeric date with a 4 digit year
+        WHEN:
+            - The date is parsed without dateparser
+        THEN:
+            - The date is parsed the same as by dateparser
+        """
+        date = parse_numeric_date(date_string, date_order, settings_timezone)
+
+        assert date == datetime.datetime.combine(
+            expected,
+            datetime.time(),
+            tzinfo=settings_timezone,
+        )
+        assert date == dateparser_parse(date_string, date_order)
+
+    @pytest.mark.parametrize(
+        ("date_string", "date_order"),
+        [
+            # Invalid in this order, dateparser might still find a date
+            ("12/24/2019", "DMY"),
+            ("2019-12-24", "DMY"),
+            # Two digit years are left to dateparser
+            ("24.12.19", "DMY"),
+            # dateparser does not apply the order to trailing years
+            ("03.04.2019", "YMD"),
+            # Textual months are left to dateparser
+            ("24 Dec 2019", "DMY"),
+        ],
+    )
+    def test_numeric_date_fallback(
+        self,
+        date_string: str,
+        date_order: str,
+        settings_timezone: ZoneInfo,
+    ):
+        """
+        GIVEN:
+            - A date which is not simply numeric or not valid in the order
+        WHEN:
+            - The date is parsed without dateparser
+        THEN:
+            - No date is returned, so dateparser is used
+        """
+        assert parse_numeric_date(date_string, date_order, settings_timezone) is None
+
+    def test_max_characters(self, settings: SettingsWrapper):
+        """
+        GIVEN:
+            - A limit of characters to search for dates
+            - Content with a date after the limit
+        WHEN:
+            - The date is parsed
+        THEN:
+            - No date is found
+        """
+        settings.DATE_PARSER_MAX_CHARACTERS = 20
+
+        text = "lorem ipsum lorem ipsum 13.02.2018"
+
+        assert parse_date("", text) is None
+
+        settings.DATE_PARSER_MAX_CHARACTERS = 0
+
+        assert parse_date("", text) is not None
+
+    def test_max_matches(self, settings: SettingsWrapper):
+        """
+        GIVEN:
+            - A limit of possible dates to parse
+            - Content with more invalid dates than the limit before a valid date
+        WHEN:
+            - The date is parsed
+        THEN:
+            - No date is found
+        """
+        settings.DATE_PARSER_MAX_MATCHES = 2
+
+        text = "99.99.2018 lorem 88.88.2018 lorem 13.02.2018"
+
+        assert parse_date("", text) is None
+
+        settings.DATE_PARSER_MAX_MATCHES = 3
+
+        assert parse_date("", text) is not None
+
+
+def dateparser_parse(date_string: str, date_order: str):
+    import dateparser
+    from django.conf import settings
+
+    return dateparser.parse(
+        date_string,
+        settings={
+            "DATE_ORDER": date_order,
+            "PREFER_DAY_OF_MONTH": "first",
+            "RETURN_AS_TIMEZONE_AWARE": True,
+            "TIMEZONE": settings.TIME_ZONE,
+        },
+    )
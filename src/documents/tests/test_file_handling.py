@@ -12,6 +12,7 @@ from django.test import TestCase
 from django.test import override_settings
 from django.utils import timezone
 
+from documents.file_handling import claim_unique_filename
 from documents.file_handling import create_source_path_directory
 from documents.file_handling import delete_empty_directories
 from documents.file_handling import generate_filename
@@ -19,7 +20,10 @@ from documents.models import Correspondent
 from documents.models import Document
 from documents.models import DocumentType
 from documents.models import StoragePath
+from documents.models import Tag
+from documents.signals.handlers import defer_filename_updates
 from documents.tasks import empty_trash
+from documents.tasks import update_document_filenames
 from documents.tests.utils import DirectoriesMixin
 from documents.tests.utils import FileSystemAssertsMixin
 
@@ -571,6 +575,39 @@ class TestFileHandling(DirectoriesMixin, FileSystemAssertsMixin, TestCase):
         self.assertIsFile(document.source_path)
         self.assertEqual(document2.filename, "qwe.pdf")
 
+    @override_settings(FILENAME_FORMAT="{title}")
+    def test_claim_unique_filename(self):
+        """
+        GIVEN:
+            - Two new documents with the same title
+        WHEN:
+            - Unique filenames are claimed for both before any file is written
+        THEN:
+            - The second document gets another filename
+            - Empty files are created at both filenames
+        """
+        document = Document.objects.create(
+            mime_type="application/pdf",
+            title="qwe",
+            checksum="A",
+        )
+        document2 = Document.objects.create(
+            mime_type="application/pdf",
+            title="qwe",
+            checksum="B",
+        )
+
+        self.assertEqual(claim_unique_filename(document), "qwe.pdf")
+        self.assertEqual(claim_unique_filename(document2), "qwe_01.pdf")
+        self.assertEqual(
+            claim_unique_filename(document, archive_filename=True),
+            "qwe.pdf",
+        )
+
+        self.assertEqual((settings.ORIGINALS_DIR / "qwe.pdf").stat().st_size, 0)
+        self.assertIsFile(settings.ORIGINALS_DIR / "qwe_01.pdf")
+        self.assertIsFile(settings.ARCHIVE_DIR / "qwe.pdf")
+
     @override_settings(FILENAME_FORMAT="{title}")
     @mock.patch("documents.signals.handlers.Document.objects.filter")
     @mock.patch("documents.signals.handlers.shutil.move")
@@ -606,6 +643,52 @@ class TestFileHandling(DirectoriesMixin, FileSystemAssertsMixin, TestCase):
             self.assertNotEqual(original_modified, doc.modified)
             mock_move.assert_not_called()
 
+    @override_settings(FILENAME_FORMAT="{correspondent}/{title}")
+    @mock.patch("documents.tasks.update_document_filenames.delay")
+    def test_defer_filename_updates(self, mock_delay):
+        """
+        GIVEN:
+            - A document with a file
+        WHEN:
+            - The document is saved and tagged several times while filename
+              updates are deferred
+        THEN:
+            - The file is not moved right away
+            - One task for the document is started once the transaction commits
+            - The task moves the file
+        """
+        doc = Document.objects.create(
+            title="document",
+            filename="none/document.pdf",
+            checksum="A",
+            mime_type="application/pdf",
+        )
+        create_source_path_directory(doc.source_path)
+        Path(doc.source_path).touch()
+        tag = Tag.objects.create(name="tag")
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with defer_filename_updates():
+                doc.correspondent = Correspondent.objects.create(name="test")
+                doc.save()
+                doc.title = "renamed"
+                doc.save()
+                doc.tags.add(tag)
+
+            doc.refresh_from_db()
+            self.assertEqual(doc.filename, "none/document.pdf")
+            self.assertIsFile(doc.source_path)
+
+        self.assertEqual(len(callbacks), 1)
+        mock_delay.assert_called_once_with([doc.pk])
+
+        update_document_filenames(*mock_delay.call_args.args)
+
+        doc.refresh_from_db()
+        self.assertEqual(doc.filename, "test/renamed.pdf")
+        self.assertIsFile(doc.source_path)
+        self.assertIsNotDir(settings.ORIGINALS_DIR / "none")
+
 
 class TestFileHandlingWithArchive(DirectoriesMixin, FileSystemAssertsMixin, TestCase):
     @override_settings(FILENAME_FORMAT=None)
@@ -773,6 +856,9 @@ class TestFileHandlingWithArchive(DirectoriesMixin, FileSystemAssertsMixin, Test
         self.assertIsFile(archive)
         self.assertIsFile(doc.source_path)
         self.assertIsFile(doc.archive_path)
+        # The claimed filenames are released again
+        self.assertIsNotFile(settings.ORIGINALS_DIR / "none" / "my_doc.pdf")
+        self.assertIsNotFile(settings.ARCHIVE_DIR / "none" / "my_doc.pdf")
 
     @override_settings(FILENAME_FORMAT="{correspondent}/{title}")
     def test_move_file_gone(self):
@@ -1,6 +1,10 @@
 from unittest import mock
 
+from django.contrib.auth.models import Group
+from django.contrib.auth.models import User
 from django.test import TestCase
+from guardian.shortcuts import assign_perm
+from guardian.shortcuts import get_users_with_perms
 
 from documents import index
 from documents.models import Document
@@ -90,3 +94,45 @@ class TestAutoComplete(DirectoriesMixin, TestCase):
             _, kwargs = mocked_update_doc.call_args
 
             self.assertIsNone(kwargs["asn"])
+
+
+class TestViewerIds(DirectoriesMixin, TestCase):
+    def test_get_viewer_ids(self):
+        """
+        GIVEN:
+            - Documents viewable by users directly and through groups
+        WHEN:
+            - The viewers of all documents are looked up at once
+        THEN:
+            - The viewers are the same as those looked up per document
+        """
+        user1 = User.objects.create_user(username="user1")
+        user2 = User.objects.create_user(username="user2")
+        user3 = User.objects.create_user(username="user3")
+        group = Group.objects.create(name="group")
+        user2.groups.add(group)
+        user3.groups.add(group)
+
+        doc1 = Document.objects.create(title="doc1", checksum="A")
+        doc2 = Document.objects.create(title="doc2", checksum="B")
+        doc3 = Document.objects.create(title="doc3", checksum="C")
+        assign_perm("view_document", user1, doc1)
+        assign_perm("change_document", user2, doc1)
+        assign_perm("view_document", group, doc2)
+        assign_perm("view_document", user2, doc2)
+
+        with self.assertNumQueries(4):
+            viewer_ids = index.get_viewer_ids([doc1.pk, doc2.pk, doc3.pk])
+
+        for doc in (doc1, doc2, doc3):
+            self.assertListEqual(
+                viewer_ids.get(doc.pk, []),
+                sorted(
+                    user.id
+                    for user in get_users_with_perms(
+                        doc,
+                        only_with_perms_in=["view_document"],
+                    )
+                ),
+            )
+        self.assertListEqual(viewer_ids[doc2.pk], [user2.id, user3.id])
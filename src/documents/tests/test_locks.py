@@ -0,0 +1,83 @@
+import threading
+from contextlib import AbstractContextManager
+
+from django.test import SimpleTestCase
+
+from documents.locks import LOCK_STRIPES
+from documents.locks import lock_documents
+from documents.locks import lock_media
+from documents.locks import lock_paths
+from documents.tests.utils import DirectoriesMixin
+
+
+class TestLocks(DirectoriesMixin, SimpleTestCase):
+    def _acquired_by_other_thread(self, lock: AbstractContextManager) -> bool:
+        """
+        Whether another thread acquires the lock while this one holds its
+        locks.  The other thread keeps waiting until the locks are released.
+        """
+        acquired = threading.Event()
+
+        def acquire():
+            with lock:
+                acquired.set()
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        self.addCleanup(thread.join)
+        return acquired.wait(timeout=0.5)
+
+    def test_lock_documents(self):
+        """
+        GIVEN:
+            - The files of a document are locked
+        WHEN:
+            - Other threads lock the same document or another one
+        THEN:
+            - The same document waits, the other one does not
+        """
+        with lock_documents(1):
+            self.assertTrue(self._acquired_by_other_thread(lock_documents(2)))
+            self.assertFalse(self._acquired_by_other_thread(lock_documents(1)))
+            self.assertFalse(
+                self._acquired_by_other_thread(lock_documents(1 + LOCK_STRIPES)),
+            )
+
+    def test_lock_documents_reentrant(self):
+        """
+        GIVEN:
+            - The files of a document are locked
+        WHEN:
+            - The same thread locks the document again
+        THEN:
+            - The lock is acquired without waiting
+        """
+        with lock_documents(1, 2):
+            with lock_documents(2):
+                pass
+
+    def test_lock_paths(self):
+        """
+        GIVEN:
+            - A path is locked
+        WHEN:
+            - Another thread locks the same path
+        THEN:
+            - It waits until the path is unlocked
+        """
+        path = self.dirs.originals_dir / "a" / "b.pdf"
+
+        with lock_paths(path):
+            self.assertFalse(self._acquired_by_other_thread(lock_paths(str(path))))
+
+    def test_lock_media(self):
+        """
+        GIVEN:
+            - The media directory is locked
+        WHEN:
+            - Another thread locks the files of any document
+        THEN:
+            - It waits until the media directory is unlocked
+        """
+        with lock_media():
+            self.assertFalse(self._acquired_by_other_thread(lock_documents(42)))
@@ -6,15 +6,19 @@ import tempfile
 from pathlib import Path
 from unittest import mock
 
+import pikepdf
 from django.core.management import call_command
 from django.test import TestCase
 from django.test import override_settings
 
+from documents import bulk_edit
+from documents.caching import set_archive_source_checksum
 from documents.file_handling import generate_filename
 from documents.models import Document
 from documents.tasks import update_document_archive_file
 from documents.tests.utils import DirectoriesMixin
 from documents.tests.utils import FileSystemAssertsMixin
+from documents.utils import compute_checksum
 
 sample_file = os.path.join(os.path.dirname(__file__), "samples", "simple.pdf")
 
@@ -56,6 +60,150 @@ class TestArchiver(DirectoriesMixin, FileSystemAssertsMixin, TestCase):
         self.assertTrue(filecmp.cmp(sample_file, doc.source_path))
         self.assertEqual(doc.archive_filename, "none/A.pdf")
 
+    @override_settings(OCR_CACHE_SIZE=1000)
+    @mock.patch("ocrmypdf.ocr")
+    def test_handle_document_rotated(self, ocr):
+        """
+        GIVEN:
+            - A document with an archive file
+            - The pages of the original were rotated
+            - The OCR cache is enabled
+        WHEN:
+            - The archive file is re-created
+        THEN:
+            - The pages of the archive file are rotated and reused
+            - The document is not OCRed again
+        """
+        doc = self.make_models()
+        doc.archive_filename = "A.pdf"
+        doc.archive_checksum = "B"
+        doc.save()
+        with pikepdf.open(sample_file) as pdf:
+            pdf.pages[0].rotate(90, relative=True)
+            pdf.save(doc.source_path)
+        shutil.copy(sample_file, doc.archive_path)
+
+        set_archive_source_checksum(doc.pk, "A")
+        Document.objects.filter(pk=doc.pk).update(checksum="C")
+
+        with mock.patch(
+            "paperless_tesseract.parsers.RasterisedDocumentParser.extract_raw_text",
+            return_value="Rotated text",
+        ):
+            update_document_archive_file(
+                doc.pk,
+                rotated_by=90,
+                archive_checksum="B",
+                source_checksum="A",
+                checksum="C",
+            )
+
+        ocr.assert_not_called()
+        doc = Document.objects.get(id=doc.id)
+        self.assertEqual(doc.content, "Rotated text")
+        self.assertIsFile(doc.archive_path)
+        with pikepdf.open(doc.archive_path) as pdf:
+            self.assertEqual(pdf.pages[0].Rotate, 90)
+
+    def rotate_queued(self, doc: Document, times: int) -> list[dict]:
+        """
+        Rotates the document by 90 degrees the given number of times, and
+        returns the arguments of the archive updates queued
+        """
+        with (
+            mock.patch("documents.tasks.update_document_archive_file.s") as update,
+            mock.patch("documents.tasks.bulk_update_documents.si"),
+            mock.patch("celery.chord.delay"),
+        ):
+            for _ in range(times):
+                bulk_edit.rotate([doc.pk], 90)
+        return [call.kwargs for call in update.call_args_list]
+
+    def make_rotatable(self) -> Document:
+        doc = self.make_models()
+        shutil.copy(sample_file, doc.source_path)
+        doc.checksum = compute_checksum(doc.source_path)
+        doc.archive_filename = "A.pdf"
+        doc.archive_checksum = "B"
+        doc.save()
+        shutil.copy(sample_file, doc.archive_path)
+        return doc
+
+    @override_settings(OCR_CACHE_SIZE=1000)
+    @mock.patch("ocrmypdf.ocr")
+    def test_handle_document_rotated_twice(self, ocr):
+        """
+        GIVEN:
+            - A document with an archive file
+            - The OCR cache is enabled
+        WHEN:
+            - The document is rotated twice, before the archive file is
+              re-created
+        THEN:
+            - The pages of the archive file are not reused, since the
+              original changed again or the archive file was replaced
+            - The first update OCRs the original, the second one finds its
+              pages in the OCR cache
+            - The archive file is rotated like the original
+        """
+        ocr.side_effect = lambda **args: shutil.copy(
+            args["input_file"],
+            args["output_file"],
+        )
+        doc = self.make_rotatable()
+
+        with (
+            mock.patch(
+                "paperless_tesseract.parsers.RasterisedDocumentParser.extract_raw_text",
+                return_value="Rotated text",
+            ),
+            mock.patch("documents.tasks.reuse_document_archive_pages") as reuse,
+        ):
+            for kwargs in self.rotate_queued(doc, 2):
+                update_document_archive_file(**kwargs)
+
+        reuse.assert_not_called()
+        ocr.assert_called_once()
+        doc = Document.objects.get(id=doc.id)
+        with pikepdf.open(doc.archive_path) as pdf:
+            self.assertEqual(pdf.pages[0].Rotate, 180)
+
+    @override_settings(OCR_CACHE_SIZE=1000)
+    @mock.patch("ocrmypdf.ocr")
+    def test_handle_document_rotated_after_failed_update(self, ocr):
+        """
+        GIVEN:
+            - A document with an archive file
+            - The OCR cache is enabled
+            - The document was rotated, but its archive file was not updated
+        WHEN:
+            - The document is rotated again and the archive file re-created
+        THEN:
+            - The pages of the outdated archive file are not reused
+            - The archive file is rotated like the original
+        """
+        ocr.side_effect = lambda **args: shutil.copy(
+            args["input_file"],
+            args["output_file"],
+        )
+        doc = self.make_rotatable()
+
+        queued = self.rotate_queued(doc, 2)
+        with (
+            mock.patch(
+                "paperless_tesseract.parsers.RasterisedDocumentParser.extract_raw_text",
+                return_value="Rotated text",
+            ),
+            mock.patch("documents.tasks.reuse_document_archive_pages") as reuse,
+        ):
+            update_document_archive_file(**queued[1])
+
+        reuse.assert_not_called()
+        ocr.assert_called_once()
+        doc = Document.objects.get(id=doc.id)
+        with pikepdf.open(doc.archive_path) as pdf:
+            self.assertEqual(pdf.pages[0].Rotate, 180)
+
     def test_unknown_mime_type(self):
         doc = self.make_models()
         doc.mime_type = "sdgfh"
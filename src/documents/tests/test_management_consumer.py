@@ -1,12 +1,15 @@
 import filecmp
 import os
 import shutil
+import uuid
 from pathlib import Path
 from threading import Thread
 from time import sleep
 from unittest import mock
 
+import celery
 from django.conf import settings
+from django.core.cache import cache
 from django.core.management import CommandError
 from django.core.management import call_command
 from django.test import TransactionTestCase
@@ -16,6 +19,8 @@ from documents.consumer import ConsumerError
 from documents.data_models import ConsumableDocument
 from documents.management.commands import document_consumer
 from documents.models import Tag
+from documents.signals.handlers import task_postrun_handler
+from documents.tasks import consume_file
 from documents.tests.utils import DirectoriesMixin
 from documents.tests.utils import DocumentConsumeDelayMixin
 
@@ -340,6 +345,209 @@ class TestConsumer(DirectoriesMixin, ConsumerThreadMixin, TransactionTestCase):
         self.consume_file_mock.assert_not_called()
 
 
+class TestConsumerStartup(
+    DirectoriesMixin,
+    DocumentConsumeDelayMixin,
+    TransactionTestCase,
+):
+    sample_file: Path = (
+        Path(__file__).parent / Path("samples") / Path("simple.pdf")
+    ).resolve()
+
+    def setUp(self) -> None:
+        super().setUp()
+        cache.clear()
+
+    def consumed_files(self) -> list[Path]:
+        return [
+            input_doc.original_file
+            for input_doc, _ in self.get_all_consume_delay_call_args()
+        ]
+
+    def test_restart(self):
+        """
+        GIVEN:
+            - A file in the consumption directory, queued by the consumer
+        WHEN:
+            - The consumer starts again
+            - The consumer starts again after the file changed
+        THEN:
+            - The file is not queued again while unchanged
+            - The changed file is queued again
+        """
+        f = self.dirs.consumption_dir / "my_file.pdf"
+        shutil.copy(self.sample_file, f)
+
+        call_command("document_consumer", "--oneshot")
+        call_command("document_consumer", "--oneshot")
+
+        self.assertEqual(self.consumed_files(), [f])
+
+        with f.open("ab") as out:
+            out.write(b"\n")
+        call_command("document_consumer", "--oneshot")
+
+        self.assertEqual(self.consumed_files(), [f, f])
+
+    def test_restart_after_task_done(self):
+        """
+        GIVEN:
+            - A file in the consumption directory, queued by the consumer
+            - The consume task of the file failed and the file is still there
+        WHEN:
+            - The consumer starts again
+        THEN:
+            - The file is queued again
+        """
+        f = self.dirs.consumption_dir / "my_file.pdf"
+        shutil.copy(self.sample_file, f)
+
+        call_command("document_consumer", "--oneshot")
+
+        task_postrun_handler(
+            task_id=str(uuid.uuid4()),
+            task=consume_file,
+            state=celery.states.FAILURE,
+            args=self.get_last_consume_delay_call_args(),
+        )
+        call_command("document_consumer", "--oneshot")
+
+        self.assertEqual(self.consumed_files(), [f, f])
+
+    @override_settings(CONSUMER_RECURSIVE=True)
+    def test_scan_recursive(self):
+        """
+        GIVEN:
+            - Files in the consumption directory and its subdirectories
+            - Some of them ignored or not supported
+        WHEN:
+            - The consumer starts
+        THEN:
+            - Only the supported files which are not ignored are queued
+        """
+        files = [
+            self.dirs.consumption_dir / "my_file.pdf",
+            self.dirs.consumption_dir / "foo" / "bar" / "my_file.pdf",
+        ]
+        ignored = [
+            self.dirs.consumption_dir / ".stfolder" / "my_file.pdf",
+            self.dirs.consumption_dir / "._my_file.pdf",
+            self.dirs.consumption_dir / "foo" / "my_file.wow",
+        ]
+        for f in files + ignored:
+            f.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy(self.sample_file, f)
+
+        call_command("document_consumer", "--oneshot")
+
+        self.assertCountEqual(self.consumed_files(), files)
+
+
+class TestPendingFiles(DirectoriesMixin, TransactionTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.now = 1000.0
+        patcher = mock.patch(
+            "documents.management.commands.document_consumer.monotonic",
+            side_effect=lambda: self.now,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.file = self.dirs.consumption_dir / "my_file.pdf"
+        self.file.write_bytes(b"data")
+
+    def test_debounce(self):
+        """
+        GIVEN:
+            - Files waiting for events to stop
+        WHEN:
+            - The delay passes since the last event of a file
+        THEN:
+            - Only that file is ready
+            - Files which were removed or discarded are not
+        """
+        pending = document_consumer.PendingFiles(1)
+        gone = self.dirs.consumption_dir / "gone.pdf"
+        pending.add(str(self.file))
+        pending.add(str(gone))
+        pending.add(str(self.dirs.consumption_dir / "discarded.pdf"))
+        pending.discard(str(self.dirs.consumption_dir / "discarded.pdf"))
+
+        self.now += 0.5
+        pending.add(str(self.file))
+        self.assertEqual(pending.pop_ready(), [])
+        self.assertEqual(pending.next_timeout(), 0.5)
+
+        self.now += 0.5
+        self.assertEqual(pending.pop_ready(), [])
+        self.assertEqual(len(pending), 1)
+
+        self.now += 0.5
+        self.assertEqual(pending.pop_ready(), [str(self.file)])
+        self.assertEqual(len(pending), 0)
+        self.assertIsNone(pending.next_timeout())
+        self.assertEqual(pending.debounced, 1)
+
+    def test_polling_unmodified(self):
+        """
+        GIVEN:
+            - A file waiting to remain unmodified
+        WHEN:
+            - The file is checked again after it was written to
+            - The file is checked again after it was not written to
+        THEN:
+            - The file is ready only after it remained unmodified
+        """
+        pending = document_consumer.PendingFiles(5, retry_count=5)
+        pending.add(str(self.file))
+        self.assertEqual(pending.pop_ready(), [])
+
+        self.now += 5
+        self.file.write_bytes(b"more data")
+        self.assertEqual(pending.pop_ready(), [])
+
+        self.now += 5
+        self.assertEqual(pending.pop_ready(), [str(self.file)])
+
+    @mock.patch("documents.management.commands.document_consumer.logger.error")
+    def test_polling_timeout(self, error_logger):
+        """
+        GIVEN:
+            - A file waiting to remain unmodified
+        WHEN:
+            - The file is modified before every check
+        THEN:
+            - The file is dropped after the configured number of checks
+        """
+        pending = document_consumer.PendingFiles(5, retry_count=3)
+        pending.add(str(self.file))
+        for size in range(3):
+            self.file.write_bytes(b"x" * size)
+            self.assertEqual(pending.pop_ready(), [])
+            self.now += 5
+
+        self.assertEqual(len(pending), 0)
+        error_logger.assert_called_once()
+
+    def test_restarted_files(self):
+        """
+        GIVEN:
+            - A file waiting for events to stop
+        WHEN:
+            - Many more events arrive for the file
+        THEN:
+            - The outdated entries of the file are dropped
+        """
+        pending = document_consumer.PendingFiles(1)
+        for _ in range(1000):
+            pending.add(str(self.file))
+
+        self.assertLessEqual(len(pending._heap), 100)
+        self.now += 2
+        self.assertEqual(pending.pop_ready(), [str(self.file)])
+
+
 @override_settings(
     CONSUMER_POLLING=1,
     # please leave the delay here and down below
@@ -0,0 +1,138 @@
+import shutil
+from pathlib import Path
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from documents.metadata import get_document_metadata
+from documents.models import Document
+from documents.models import DocumentMetadata
+from documents.tests.utils import DirectoriesMixin
+
+SAMPLE_DIR = Path(__file__).parent / "samples"
+
+
+class TestDocumentMetadata(DirectoriesMixin, TestCase):
+    def make_document(self, **kwargs) -> Document:
+        doc = Document.objects.create(
+            title="test",
+            checksum="A",
+            archive_checksum="B",
+            filename="file.pdf",
+            archive_filename="archive.pdf",
+            mime_type="application/pdf",
+            content="This is an english text about an invoice",
+            **kwargs,
+        )
+        shutil.copy(SAMPLE_DIR / "simple.pdf", doc.source_path)
+        shutil.copy(SAMPLE_DIR / "simple.pdf", doc.archive_path)
+        return doc
+
+    def test_metadata_stored(self):
+        """
+        GIVEN:
+            - A document without stored metadata
+        WHEN:
+            - The metadata is requested twice
+        THEN:
+            - The metadata is extracted and stored once
+        """
+        doc = self.make_document()
+
+        metadata = get_document_metadata(doc)
+
+        self.assertEqual(metadata.original_checksum, "A")
+        self.assertEqual(metadata.archive_checksum, "B")
+        self.assertGreater(len(metadata.original_metadata), 0)
+        self.assertGreater(len(metadata.archive_metadata), 0)
+        self.assertEqual(metadata.original_size, doc.source_path.stat().st_size)
+        self.assertEqual(metadata.archive_size, doc.archive_path.stat().st_size)
+        self.assertEqual(metadata.language, "en")
+        self.assertTrue(DocumentMetadata.objects.filter(document=doc).exists())
+
+        with mock.patch("documents.metadata.extract_metadata") as extract_metadata:
+            self.assertEqual(get_document_metadata(doc), metadata)
+            extract_metadata.assert_not_called()
+
+    def test_metadata_outdated(self):
+        """
+        GIVEN:
+            - A document with stored metadata
+        WHEN:
+            - The archive file or the content changes
+        THEN:
+            - The files are read again only if the files changed
+            - The language is detected again if the content changed
+        """
+        doc = self.make_document()
+        get_document_metadata(doc)
+
+        doc.archive_checksum = "C"
+        doc.save()
+
+        with mock.patch(
+            "documents.metadata.extract_metadata",
+            return_value=[],
+        ) as extract_metadata:
+            metadata = get_document_metadata(doc)
+            self.assertEqual(extract_metadata.call_count, 2)
+            self.assertEqual(metadata.archive_checksum, "C")
+
+            doc.content = "Dies ist ein deutscher Text über eine Rechnung"
+            doc.save()
+            extract_metadata.reset_mock()
+
+            metadata = get_document_metadata(doc)
+            extract_metadata.assert_not_called()
+
+        self.assertEqual(metadata.language, "de")
+        self.assertEqual(DocumentMetadata.objects.get(document=doc).language, "de")
+
+    def test_metadata_missing_files(self):
+        """
+        GIVEN:
+            - A document without files
+        WHEN:
+            - The metadata is requested
+        THEN:
+            - The metadata is not stored
+        """
+        doc = self.make_document()
+        doc.archive_path.unlink()
+
+        metadata = get_document_metadata(doc)
+
+        self.assertIsNone(metadata.archive_metadata)
+        self.assertIsNone(metadata.archive_size)
+        self.assertFalse(DocumentMetadata.objects.filter(document=doc).exists())
+
+    def test_management_command(self):
+        """
+        GIVEN:
+            - A document without metadata
+            - A document with metadata of its current files
+        WHEN:
+            - The metadata command is run
+        THEN:
+            - The metadata of the first document is stored
+            - The second document is skipped
+        """
+        doc1 = self.make_document()
+        doc2 = Document.objects.create(
+            title="test",
+            checksum="D",
+            filename="file2.pdf",
+            mime_type="application/pdf",
+        )
+        shutil.copy(SAMPLE_DIR / "simple.pdf", doc2.source_path)
+        get_document_metadata(doc2)
+
+        with mock.patch(
+            "documents.management.commands.document_metadata.update_document_metadata",
+        ) as update_document_metadata:
+            call_command("document_metadata", "--processes", "1", "--no-progress-bar")
+            update_document_metadata.assert_called_once_with(doc1)
+
+        call_command("document_metadata", "--processes", "1", "--no-progress-bar")
+        self.assertEqual(DocumentMetadata.objects.count(), 2)
@@ -0,0 +1,322 @@
+import os
+import shutil
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.test import override_settings
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from documents.management.commands.document_thumbnails import _create_previews
+from documents.models import Document
+from documents.previews import PreviewUnavailableError
+from documents.previews import get_page_preview_path
+from documents.previews import get_thumbnail_path
+from documents.previews import page_preview_tag
+from documents.previews import prune_preview_cache
+from documents.tests.utils import DirectoriesMixin
+from documents.tests.utils import FileSystemAssertsMixin
+
+SAMPLE_DIR = Path(__file__).parent / "samples"
+
+
+class PreviewDocumentMixin:
+    def make_document(self, sample="double-sided-odd.pdf", **kwargs) -> Document:
+        doc = Document.objects.create(
+            title="test",
+            checksum=kwargs.pop("checksum", "abcdef0123"),
+            mime_type=kwargs.pop("mime_type", "application/pdf"),
+            filename=sample,
+            **kwargs,
+        )
+        shutil.copy(SAMPLE_DIR / sample, doc.source_path)
+        shutil.copy(
+            SAMPLE_DIR / "documents" / "thumbnails" / "0000001.webp",
+            doc.thumbnail_path,
+        )
+        return doc
+
+
+class TestPreviews(
+    DirectoriesMixin,
+    FileSystemAssertsMixin,
+    PreviewDocumentMixin,
+    TestCase,
+):
+    def test_small_thumbnail(self):
+        """
+        GIVEN:
+            - A document with a thumbnail
+        WHEN:
+            - The small thumbnail is requested twice
+        THEN:
+            - The small thumbnail is derived from the stored one, once
+            - The medium thumbnail is the stored one
+        """
+        doc = self.make_document()
+
+        path = get_thumbnail_path(doc, "small")
+
+        self.assertIsFile(path)
+        self.assertTrue(path.is_relative_to(self.dirs.data_dir / "previews"))
+        with Image.open(path) as image:
+            self.assertLessEqual(image.width, 200)
+
+        with mock.patch("documents.previews._store") as store:
+            self.assertEqual(get_thumbnail_path(doc, "small"), path)
+            store.assert_not_called()
+
+        self.assertEqual(get_thumbnail_path(doc), doc.thumbnail_path)
+
+        with self.assertRaises(ValueError):
+            get_thumbnail_path(doc, "huge")
+
+    def test_page_preview(self):
+        """
+        GIVEN:
+            - A PDF document with 3 pages
+        WHEN:
+            - Previews of its pages are requested
+        THEN:
+            - Each page is rendered within the requested size
+            - Pages beyond the document raise an IndexError
+        """
+        doc = self.make_document()
+
+        medium = get_page_preview_path(doc, 2, "medium")
+        large = get_page_preview_path(doc, 2, "large")
+
+        self.assertNotEqual(medium, large)
+        with Image.open(medium) as image:
+            self.assertLessEqual(image.width, 1000)
+        with Image.open(large) as image:
+            self.assertLessEqual(image.width, 2000)
+            self.assertGreater(image.width, 1000)
+
+        with self.assertRaises(IndexError):
+            get_page_preview_path(doc, 4)
+        with self.assertRaises(IndexError):
+            get_page_preview_path(doc, 0)
+
+    @override_settings(THUMBNAIL_ENGINE="CONVERT")
+    @mock.patch("documents.previews.run_convert")
+    def test_page_preview_convert(self, run_convert):
+        """
+        GIVEN:
+            - A PDF document with 3 pages
+            - Pages are rendered with convert
+        WHEN:
+            - Previews of all pages are created
+        THEN:
+            - Pages beyond the document raise an IndexError without running
+              convert
+            - The previews of all sizes are rendered
+        """
+
+        def fake_convert(output_file, **kwargs):
+            Image.new("RGB", (100, 100)).save(output_file, format="WEBP")
+
+        run_convert.side_effect = fake_convert
+        doc = self.make_document()
+
+        with self.assertRaises(IndexError):
+            get_page_preview_path(doc, 4)
+        run_convert.assert_not_called()
+
+        _create_previews(doc, pages=True)
+
+        self.assertEqual(run_convert.call_count, 6)
+        for size in ("medium", "large"):
+            self.assertIsFile(
+                self.dirs.data_dir
+                / "previews"
+                / "ab"
+                / f"abcdef0123-page3-{size}.webp",
+            )
+
+    def test_page_preview_image(self):
+        """
+        GIVEN:
+            - An image document without archive version
+        WHEN:
+            - Previews of its pages are requested
+        THEN:
+            - The image is the only page
+        """
+        doc = self.make_document("simple.png", mime_type="image/png")
+
+        self.assertIsFile(get_page_preview_path(doc, 1))
+
+        with self.assertRaises(IndexError):
+            get_page_preview_path(doc, 2)
+
+    def test_page_preview_unavailable(self):
+        """
+        GIVEN:
+            - A text document and an encrypted document
+        WHEN:
+            - Previews of their pages are requested
+        THEN:
+            - The previews are unavailable
+        """
+        text = self.make_document("simple.txt", mime_type="text/plain")
+        encrypted = self.make_document(
+            checksum="123456",
+            storage_type=Document.STORAGE_TYPE_GPG,
+        )
+
+        with self.assertRaises(PreviewUnavailableError):
+            get_page_preview_path(text, 1)
+        with self.assertRaises(PreviewUnavailableError):
+            get_page_preview_path(encrypted, 1)
+        with self.assertRaises(PreviewUnavailableError):
+            get_thumbnail_path(encrypted, "small")
+
+    def test_prune_cache(self):
+        """
+        GIVEN:
+            - A preview cache with images of different age
+        WHEN:
+            - The cache is pruned to a limit
+        THEN:
+            - The least recently used images are removed
+        """
+        doc = self.make_document()
+        first = get_page_preview_path(doc, 1)
+        second = get_page_preview_path(doc, 2)
+        third = get_page_preview_path(doc, 3)
+
+        now = time.time()
+        os.utime(first, (now - 30, now - 30))
+        os.utime(second, (now - 20, now - 20))
+        os.utime(third, (now - 10, now - 10))
+
+        # Using the first image marks it as recently used
+        get_page_preview_path(doc, 1)
+
+        remaining = prune_preview_cache(
+            limit=first.stat().st_size + third.stat().st_size,
+        )
+
+        self.assertIsFile(first)
+        self.assertIsNotFile(second)
+        self.assertIsFile(third)
+        self.assertEqual(remaining, first.stat().st_size + third.stat().st_size)
+
+    def test_management_command(self):
+        """
+        GIVEN:
+            - A PDF document with 3 pages
+        WHEN:
+            - Thumbnails are recreated including the page previews
+        THEN:
+            - The small thumbnail and all page previews are cached
+        """
+        doc = self.make_document()
+
+        call_command("document_thumbnails", "--pages", "--processes", "1")
+
+        cached = {path.name for path in (self.dirs.data_dir / "previews").glob("*/*")}
+        self.assertEqual(
+            cached,
+            {f"{doc.checksum}-thumb-small.webp"}
+            | {
+                f"{doc.checksum}-page{page}-{size}.webp"
+                for page in (1, 2, 3)
+                for size in ("medium", "large")
+            },
+        )
+
+
+@override_settings(THUMBNAIL_ENGINE="PDFIUM")
+class TestPreviewsApi(DirectoriesMixin, PreviewDocumentMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create_superuser(username="temp_admin")
+        self.client.force_authenticate(user=self.user)
+
+    def test_small_thumbnail(self):
+        """
+        GIVEN:
+            - A document with a thumbnail
+        WHEN:
+            - The thumbnail is requested in different sizes
+        THEN:
+            - The requested size is returned
+            - Unknown sizes are rejected
+        """
+        doc = self.make_document()
+
+        response = self.client.get(f"/api/documents/{doc.pk}/thumb/?size=small")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.content,
+            get_thumbnail_path(doc, "small").read_bytes(),
+        )
+
+        response = self.client.get(f"/api/documents/{doc.pk}/thumb/?size=medium")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, doc.thumbnail_path.read_bytes())
+
+        response = self.client.get(f"/api/documents/{doc.pk}/thumb/?size=huge")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_page_preview(self):
+        """
+        GIVEN:
+            - A PDF document with 3 pages
+        WHEN:
+            - Previews of pages are requested
+        THEN:
+            - The preview is returned with its ETag
+            - Requests naming the content may be cached indefinitely
+            - Requests for pages outside the document fail
+        """
+        doc = self.make_document()
+        tag = page_preview_tag(doc, 2, "large")
+
+        response = self.client.get(f"/api/documents/{doc.pk}/pages/2/?size=large")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertEqual(response["ETag"], f'"{tag}"')
+        self.assertIn("max-age=3000", response["Cache-Control"])
+
+        response = self.client.get(
+            f"/api/documents/{doc.pk}/pages/2/?size=large&v={tag}",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("immutable", response["Cache-Control"])
+
+        response = self.client.get(
+            f"/api/documents/{doc.pk}/pages/2/?size=large",
+            HTTP_IF_NONE_MATCH=f'"{tag}"',
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(f"/api/documents/{doc.pk}/pages/4/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get(f"/api/documents/{doc.pk}/pages/1/?size=huge")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_page_preview_permissions(self):
+        """
+        GIVEN:
+            - A document owned by another user
+        WHEN:
+            - A user without permissions requests a page preview
+        THEN:
+            - The request is forbidden
+        """
+        owner = User.objects.create_user(username="owner")
+        doc = self.make_document(owner=owner)
+        self.client.force_authenticate(User.objects.create_user(username="other"))
+
+        response = self.client.get(f"/api/documents/{doc.pk}/pages/1/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
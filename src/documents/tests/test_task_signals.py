@@ -4,6 +4,7 @@ from unittest import mock
 import celery
 from django.test import TestCase
 
+from documents import bulk_edit
 from documents.data_models import ConsumableDocument
 from documents.data_models import DocumentSource
 from documents.models import PaperlessTask
@@ -67,6 +68,38 @@ class TestTaskSignalHandler(DirectoriesMixin, TestCase):
         self.assertEqual("documents.tasks.consume_file", task.task_name)
         self.assertEqual(celery.states.PENDING, task.status)
 
+    def test_before_task_publish_handler_bulk_edit_job(self):
+        """
+        GIVEN:
+            - A bulk edit of many documents is started as a job
+        WHEN:
+            - Task before publish handler is called
+        THEN:
+            - The task is created and marked as pending, without a file name
+        """
+        headers = {
+            "id": str(uuid.uuid4()),
+            "task": "documents.bulk_edit.bulk_edit_job",
+        }
+        body = (
+            # args
+            (bulk_edit.add_tag, [1, 2, 3], {"tag": 1}),
+            # kwargs
+            {},
+            # celery stuff
+            {"callbacks": None, "errbacks": None, "chain": None, "chord": None},
+        )
+        self.util_call_before_task_publish_handler(
+            headers_to_use=headers,
+            body_to_use=body,
+        )
+
+        task = PaperlessTask.objects.get()
+        self.assertEqual(headers["id"], task.task_id)
+        self.assertIsNone(task.task_file_name)
+        self.assertEqual("documents.bulk_edit.bulk_edit_job", task.task_name)
+        self.assertEqual(celery.states.PENDING, task.status)
+
     def test_task_prerun_handler(self):
         """
         GIVEN:
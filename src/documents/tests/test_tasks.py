@@ -4,8 +4,10 @@ from unittest import mock
 
 from django.conf import settings
 from django.test import TestCase
+from django.test import override_settings
 from django.utils import timezone
 
+from documents import index
 from documents import tasks
 from documents.models import Correspondent
 from documents.models import Document
@@ -139,7 +141,7 @@ class TestSanityCheck(DirectoriesMixin, TestCase):
         m.assert_called_once()
 
 
-class TestBulkUpdate(DirectoriesMixin, TestCase):
+class TestBulkUpdate(DirectoriesMixin, FileSystemAssertsMixin, TestCase):
     def test_bulk_update_documents(self):
         doc1 = Document.objects.create(
             title="test",
@@ -152,6 +154,46 @@ class TestBulkUpdate(DirectoriesMixin, TestCase):
 
         tasks.bulk_update_documents([doc1.pk])
 
+    @override_settings(FILENAME_FORMAT="{correspondent}/{title}")
+    @mock.patch("documents.tasks.BULK_UPDATE_CHUNK_SIZE", 2)
+    def test_bulk_update_documents_chunked(self):
+        """
+        GIVEN:
+            - Documents whose correspondent was changed without saving them
+        WHEN:
+            - The documents are updated in bulk, in several chunks
+        THEN:
+            - The files of all documents are moved to their new filenames
+            - All documents are indexed, with one writer per chunk
+        """
+        docs = []
+        for i in range(3):
+            doc = Document.objects.create(
+                title=f"doc{i}",
+                checksum=f"checksum{i}",
+                mime_type="application/pdf",
+                filename=f"doc{i}.pdf",
+            )
+            doc.source_path.touch()
+            docs.append(doc)
+        correspondent = Correspondent.objects.create(name="c")
+        Document.objects.update(correspondent=correspondent)
+
+        with mock.patch(
+            "documents.tasks.index.update_documents",
+            wraps=index.update_documents,
+        ) as update_documents:
+            tasks.bulk_update_documents([doc.pk for doc in docs])
+
+        self.assertEqual(update_documents.call_count, 2)
+        for i, doc in enumerate(docs):
+            doc.refresh_from_db()
+            self.assertEqual(doc.filename, f"c/doc{i}.pdf")
+            self.assertIsFile(doc.source_path)
+
+        with index.open_index_searcher() as searcher:
+            self.assertEqual(searcher.doc_count(), 3)
+
 
 class TestEmptyTrashTask(DirectoriesMixin, FileSystemAssertsMixin, TestCase):
     """
@@ -0,0 +1,103 @@
+import hashlib
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.test import TestCase
+
+from documents.utils import PathPatternMatcher
+from documents.utils import compute_checksum
+from documents.utils import copy_file_with_basic_stats
+
+
+class TestChecksums(TestCase):
+    SAMPLE_DIR = Path(__file__).parent / "samples"
+
+    def setUp(self) -> None:
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        return super().setUp()
+
+    def test_compute_checksum(self):
+        """
+        GIVEN:
+            - A file larger than the chunk size
+        WHEN:
+            - The checksum is computed
+        THEN:
+            - The checksum equals the MD5 of the complete file
+        """
+        source = self.SAMPLE_DIR / "simple.pdf"
+
+        self.assertEqual(
+            compute_checksum(source, chunk_size=128),
+            hashlib.md5(source.read_bytes()).hexdigest(),
+        )
+
+    def test_copy_file_with_checksum(self):
+        """
+        GIVEN:
+            - A source file
+        WHEN:
+            - The file is copied with a checksum requested
+        THEN:
+            - The copy is identical, keeps the modified time and the MD5 of the
+              file is returned
+        """
+        source = self.SAMPLE_DIR / "simple.pdf"
+        dest = self.tmp_dir / "copy.pdf"
+
+        checksum = copy_file_with_basic_stats(source, dest, checksum=True)
+
+        self.assertEqual(checksum, hashlib.md5(source.read_bytes()).hexdigest())
+        self.assertEqual(dest.read_bytes(), source.read_bytes())
+        self.assertEqual(dest.stat().st_mtime_ns, source.stat().st_mtime_ns)
+
+        self.assertIsNone(
+            copy_file_with_basic_stats(source, self.tmp_dir / "copy2.pdf"),
+        )
+
+
+class TestPathPatternMatcher(TestCase):
+    PATTERNS = [".DS_Store", "._*", ".stfolder/*", "@eaDir/*", "*.tmp", "~$*"]
+
+    def test_matches(self):
+        """
+        GIVEN:
+            - Glob patterns for names and for directories
+        WHEN:
+            - Relative paths are matched
+        THEN:
+            - Names match name patterns, directories match patterns ending in /*
+        """
+        matcher = PathPatternMatcher(self.PATTERNS)
+
+        for path, expected in [
+            ("foo.pdf", False),
+            ("foo/bar.pdf", False),
+            (".DS_Store", True),
+            (".DS_STORE", False),
+            ("foo/._bar.pdf", True),
+            ("._foo/bar.pdf", True),
+            (".stfolder/foo.pdf", True),
+            ("foo/.stfolder/bar.pdf", True),
+            (".stfolder.pdf", False),
+            ("@eaDir/SYNO@.fileindexdb/_1jk.fnm", True),
+            ("scans/scan.pdf.tmp", True),
+            ("scans.tmp/scan.pdf", False),
+            ("~$report.docx", True),
+            ("", False),
+        ]:
+            with self.subTest(path=path):
+                self.assertEqual(matcher.matches(path), expected)
+
+    def test_no_patterns(self):
+        """
+        GIVEN:
+            - No patterns
+        WHEN:
+            - A path is matched
+        THEN:
+            - Nothing matches
+        """
+        self.assertFalse(PathPatternMatcher([]).matches(".DS_Store"))
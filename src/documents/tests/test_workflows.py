@@ -4,6 +4,7 @@ from pathlib import Path
 from typing import TYPE_CHECKING
 from unittest import mock
 
+from auditlog.models import LogEntry
 from django.contrib.auth.models import Group
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -16,7 +17,9 @@ if TYPE_CHECKING:
     from django.db.models import QuerySet
 
 from documents import tasks
+from documents.consumer import WorkflowTriggerPlugin
 from documents.data_models import ConsumableDocument
+from documents.data_models import DocumentMetadataOverrides
 from documents.data_models import DocumentSource
 from documents.matching import document_matches_workflow
 from documents.models import Correspondent
@@ -34,6 +37,7 @@ from documents.signals import document_consumption_finished
 from documents.tests.utils import DirectoriesMixin
 from documents.tests.utils import DummyProgressManager
 from documents.tests.utils import FileSystemAssertsMixin
+from documents.workflows import get_workflow_plans
 from paperless_mail.models import MailAccount
 from paperless_mail.models import MailRule
 
@@ -1807,3 +1811,350 @@ class TestWorkflows(DirectoriesMixin, FileSystemAssertsMixin, APITestCase):
         self.assertEqual(doc.owner, self.user2)
         self.assertEqual(doc.tags.all().count(), 1)
         self.assertIn(self.t2, doc.tags.all())
+
+    def test_workflow_plans_cached(self):
+        """
+        GIVEN:
+            - Existing workflow
+        WHEN:
+            - Workflow plans are requested multiple times
+            - The workflow is changed
+        THEN:
+            - Plans are only compiled once
+            - Plans are compiled again after the change
+        """
+        trigger = WorkflowTrigger.objects.create(
+            type=WorkflowTrigger.WorkflowTriggerType.DOCUMENT_UPDATED,
+        )
+        trigger.filter_has_tags.add(self.t1)
+        action = WorkflowAction.objects.create(
+            assign_correspondent=self.c,
+        )
+        action.assign_tags.add(self.t2)
+        w = Workflow.objects.create(
+            name="Workflow 1",
+            order=0,
+        )
+        w.triggers.add(trigger)
+        w.actions.add(action)
+
+        plans = get_workflow_plans()
+        self.assertEqual(len(plans), 1)
+        self.assertEqual(plans[0].triggers[0].filter_has_tag_ids, {self.t1.pk})
+        self.assertEqual(plans[0].actions[0].assign_tag_ids, (self.t2.pk,))
+        self.assertEqual(plans[0].actions[0].assign_correspondent_id, self.c.pk)
+
+        with self.assertNumQueries(0):
+            self.assertIs(get_workflow_plans(), plans)
+
+        action.assign_tags.add(self.t3)
+
+        plans = get_workflow_plans()
+        self.assertCountEqual(
+            plans[0].actions[0].assign_tag_ids,
+            [self.t2.pk, self.t3.pk],
+        )
+
+        w.enabled = False
+        w.save()
+
+        self.assertEqual(get_workflow_plans(), ())
+
+    def test_workflow_plans_content_matcher(self):
+        """
+        GIVEN:
+            - Existing workflow matching the content by regular expression
+        WHEN:
+            - Several documents are matched against the compiled plan
+        THEN:
+            - The regular expression is compiled with the plan, not per document
+            - Only the matching documents match
+        """
+        trigger = WorkflowTrigger.objects.create(
+            type=WorkflowTrigger.WorkflowTriggerType.DOCUMENT_UPDATED,
+            matching_algorithm=MatchingModel.MATCH_REGEX,
+            match=r"invoice \d+",
+        )
+        w = Workflow.objects.create(
+            name="Workflow 1",
+            order=0,
+        )
+        w.triggers.add(trigger)
+        w.actions.add(WorkflowAction.objects.create())
+
+        plan = get_workflow_plans()[0]
+        docs = [
+            Document.objects.create(
+                title=f"doc {i}",
+                content=content,
+                checksum=str(i),
+            )
+            for i, content in enumerate(["invoice 123", "letter", "invoice 7"])
+        ]
+
+        with mock.patch("documents.matching.re.compile") as compile_regex:
+            results = [
+                document_matches_workflow(
+                    doc,
+                    plan,
+                    WorkflowTrigger.WorkflowTriggerType.DOCUMENT_UPDATED,
+                )
+                for doc in docs
+            ]
+            compile_regex.assert_not_called()
+
+        self.assertEqual(results, [True, False, True])
+
+    def test_workflow_plans_referenced_object_deleted(self):
+        """
+        GIVEN:
+            - Existing workflow assigning a tag
+        WHEN:
+            - The tag is deleted
+        THEN:
+            - The compiled plans no longer reference the tag
+        """
+        trigger = WorkflowTrigger.objects.create(
+            type=WorkflowTrigger.WorkflowTriggerType.DOCUMENT_UPDATED,
+        )
+        action = WorkflowAction.objects.create()
+        action.assign_tags.add(self.t1, self.t2)
+        w = Workflow.objects.create(
+            name="Workflow 1",
+            order=0,
+        )
+        w.triggers.add(trigger)
+        w.actions.add(action)
+
+        self.assertEqual(len(get_workflow_plans()[0].actions[0].assign_tag_ids), 2)
+
+        self.t1.delete()
+
+        self.assertEqual(
+            get_workflow_plans()[0].actions[0].assign_tag_ids,
+            (self.t2.pk,),
+        )
+
+    def test_removal_action_consumption_plugin(self):
+        """
+        GIVEN:
+            - Workflow with assignment and removal actions
+        WHEN:
+            - The consumption trigger is evaluated
+        THEN:
+            - Removed tags, custom fields and permissions are dropped from the overrides
+        """
+        trigger = WorkflowTrigger.objects.create(
+            type=WorkflowTrigger.WorkflowTriggerType.CONSUMPTION,
+            sources=f"{DocumentSource.ApiUpload},{DocumentSource.ConsumeFolder},{DocumentSource.MailFetch}",
+            filter_filename="*simple*",
+        )
+        action = WorkflowAction.objects.create(
+            assign_correspondent=self.c,
+        )
+        action.assign_tags.add(self.t1, self.t2)
+        action.assign_custom_fields.add(self.cf1, self.cf2)
+        action.assign_view_users.add(self.user2, self.user3)
+        removal = WorkflowAction.objects.create(
+            type=WorkflowAction.WorkflowActionType.REMOVAL,
+        )
+        removal.remove_tags.add(self.t1)
+        removal.remove_custom_fields.add(self.cf2)
+        removal.remove_view_users.add(self.user3)
+        removal.remove_correspondents.add(self.c)
+        w = Workflow.objects.create(
+            name="Workflow 1",
+            order=0,
+        )
+        w.triggers.add(trigger)
+        w.actions.add(action, removal)
+
+        test_file = shutil.copy(
+            self.SAMPLE_DIR / "simple.pdf",
+            self.dirs.scratch_dir / "simple.pdf",
+        )
+
+        plugin = WorkflowTriggerPlugin(
+            ConsumableDocument(
+                source=DocumentSource.ConsumeFolder,
+                original_file=test_file,
+            ),
+            DocumentMetadataOverrides(),
+            DummyProgressManager(test_file.name, None),
+            self.dirs.scratch_dir,
+            "task-id",
+        )
+        plugin.run()
+
+        self.assertEqual(plugin.metadata.tag_ids, [self.t2.pk])
+        self.assertEqual(plugin.metadata.custom_field_ids, [self.cf1.pk])
+        self.assertEqual(plugin.metadata.view_users, [self.user2.pk])
+        self.assertIsNone(plugin.metadata.correspondent_id)
+
+    def test_bulk_update_workflows(self):
+        """
+        GIVEN:
+            - Workflows with document updated triggers, the second one matching on a
+              tag the first one assigns
+        WHEN:
+            - Many documents are bulk updated
+        THEN:
+            - The workflows are applied to every matching document in order
+            - Each document gets its own audit log entries
+        """
+        trigger = WorkflowTrigger.objects.create(
+            type=WorkflowTrigger.WorkflowTriggerType.DOCUMENT_UPDATED,
+            filter_has_document_type=self.dt,
+        )
+        action = WorkflowAction.objects.create(
+            assign_title="Doc from {correspondent}",
+            assign_correspondent=self.c2,
+            assign_owner=self.user2,
+        )
+        action.assign_tags.add(self.t1)
+        action.assign_custom_fields.add(self.cf1)
+        action.assign_view_users.add(self.user3)
+        w = Workflow.objects.create(
+            name="Workflow 1",
+            order=0,
+        )
+        w.triggers.add(trigger)
+        w.actions.add(action)
+
+        trigger2 = WorkflowTrigger.objects.create(
+            type=WorkflowTrigger.WorkflowTriggerType.DOCUMENT_UPDATED,
+        )
+        trigger2.filter_has_tags.add(self.t1)
+        removal = WorkflowAction.objects.create(
+            type=WorkflowAction.WorkflowActionType.REMOVAL,
+        )
+        removal.remove_tags.add(self.t2)
+        w2 = Workflow.objects.create(
+            name="Workflow 2",
+            order=1,
+        )
+        w2.triggers.add(trigger2)
+        w2.actions.add(removal)
+
+        docs = [
+            Document.objects.create(
+                title=f"sample test {i}",
+                correspondent=self.c,
+                document_type=self.dt if i < 3 else None,
+                checksum=f"{i}",
+                original_filename="sample.pdf",
+            )
+            for i in range(4)
+        ]
+        for doc in docs:
+            doc.tags.add(self.t2)
+        CustomFieldInstance.objects.create(document=docs[0], field=self.cf1)
+
+        tasks.bulk_update_documents([doc.pk for doc in docs])
+
+        for doc in docs[:3]:
+            doc.refresh_from_db()
+            self.assertEqual(doc.title, "Doc from Correspondent Name 2")
+            self.assertEqual(doc.correspondent, self.c2)
+            self.assertEqual(doc.owner, self.user2)
+            self.assertEqual(list(doc.tags.all()), [self.t1])
+            self.assertEqual(doc.custom_fields.filter(field=self.cf1).count(), 1)
+            self.assertIn(self.user3, get_users_with_perms(doc))
+            self.assertGreaterEqual(
+                LogEntry.objects.filter(
+                    object_pk=doc.pk,
+                    content_type__model="document",
+                )
+                .filter(changes__icontains="tags")
+                .count(),
+                2,
+            )
+
+        docs[3].refresh_from_db()
+        self.assertEqual(docs[3].title, "sample test 3")
+        self.assertEqual(docs[3].correspondent, self.c)
+        self.assertEqual(list(docs[3].tags.all()), [self.t2])
+        self.assertEqual(docs[3].custom_fields.count(), 0)
+
+    def test_bulk_update_workflows_removal(self):
+        """
+        GIVEN:
+            - Workflow with document updated trigger which removes permissions,
+              custom fields and the owner
+        WHEN:
+            - Documents are bulk updated
+        THEN:
+            - The removals are applied to all documents
+        """
+        trigger = WorkflowTrigger.objects.create(
+            type=WorkflowTrigger.WorkflowTriggerType.DOCUMENT_UPDATED,
+        )
+        removal = WorkflowAction.objects.create(
+            type=WorkflowAction.WorkflowActionType.REMOVAL,
+            remove_all_owners=True,
+            remove_all_custom_fields=True,
+        )
+        removal.remove_view_users.add(self.user3)
+        w = Workflow.objects.create(
+            name="Workflow 1",
+            order=0,
+        )
+        w.triggers.add(trigger)
+        w.actions.add(removal)
+
+        docs = [
+            Document.objects.create(
+                title=f"sample test {i}",
+                owner=self.user2,
+                checksum=f"{i}",
+            )
+            for i in range(3)
+        ]
+        for doc in docs:
+            assign_perm("documents.view_document", self.user3, doc)
+            CustomFieldInstance.objects.create(document=doc, field=self.cf1)
+
+        tasks.bulk_update_documents([doc.pk for doc in docs])
+
+        for doc in docs:
+            doc.refresh_from_db()
+            self.assertIsNone(doc.owner)
+            self.assertEqual(doc.custom_fields.count(), 0)
+            self.assertNotIn(self.user3, get_users_with_perms(doc))
+
+    def test_bulk_update_workflows_auditlog_unregistered(self):
+        """
+        GIVEN:
+            - Workflow with document updated trigger which assigns a title and
+              a custom field
+            - Documents and custom fields are not registered with auditlog,
+              as while importing
+        WHEN:
+            - Documents are bulk updated
+        THEN:
+            - The workflow is applied to all documents
+            - Nothing is logged
+        """
+        trigger = WorkflowTrigger.objects.create(
+            type=WorkflowTrigger.WorkflowTriggerType.DOCUMENT_UPDATED,
+        )
+        action = WorkflowAction.objects.create(assign_title="Updated")
+        action.assign_custom_fields.add(self.cf1)
+        w = Workflow.objects.create(name="Workflow 1", order=0)
+        w.triggers.add(trigger)
+        w.actions.add(action)
+
+        docs = [
+            Document.objects.create(title=f"sample test {i}", checksum=f"{i}")
+            for i in range(2)
+        ]
+        log_entries = LogEntry.objects.count()
+
+        with mock.patch("auditlog.registry.auditlog.contains", return_value=False):
+            tasks.bulk_update_documents([doc.pk for doc in docs])
+
+        for doc in docs:
+            doc.refresh_from_db()
+            self.assertEqual(doc.title, "Updated")
+            self.assertEqual(doc.custom_fields.filter(field=self.cf1).count(), 1)
+        self.assertEqual(LogEntry.objects.count(), log_entries)
@@ -63,6 +63,8 @@ def setup_directories():
         STATIC_ROOT=dirs.static_dir,
         MODEL_FILE=dirs.data_dir / "classification_model.pickle",
         MEDIA_LOCK=dirs.media_dir / "media.lock",
+        PREVIEW_CACHE_DIR=dirs.data_dir / "previews",
+        OCR_CACHE_DIR=dirs.data_dir / "ocr-cache",
     )
     dirs.settings_override.enable()
 
@@ -1,7 +1,14 @@
+import fnmatch
+import hashlib
 import logging
+import os
+import re
 import shutil
+from collections.abc import Iterable
+from functools import lru_cache
 from os import utime
 from pathlib import Path
+from pathlib import PurePath
 from subprocess import CompletedProcess
 from subprocess import run
 from typing import Optional
@@ -32,22 +39,70 @@ def copy_basic_file_stats(source: Union[Path, str], dest: Union[Path, str]) -> N
     utime(dest, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
 
 
+# Files are hashed and copied in chunks of this size, so even huge scans are
+# never held in memory completely
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
+
+def compute_checksum(
+    path: Union[Path, str],
+    chunk_size: int = CHECKSUM_CHUNK_SIZE,
+) -> str:
+    """
+    Returns the MD5 checksum of the given file, reading it in chunks
+    """
+    checksum = hashlib.md5()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def copy_file_with_checksum(
+    source: Union[Path, str],
+    dest: Union[Path, str],
+    chunk_size: int = CHECKSUM_CHUNK_SIZE,
+) -> str:
+    """
+    Copies the content of source to dest in chunks, returning the MD5 checksum of
+    the copied data, so the file is only read once
+    """
+    checksum = hashlib.md5()
+    with open(source, "rb") as read_file, open(dest, "wb") as write_file:
+        while chunk := read_file.read(chunk_size):
+            checksum.update(chunk)
+            write_file.write(chunk)
+    return checksum.hexdigest()
+
+
 def copy_file_with_basic_stats(
     source: Union[Path, str],
     dest: Union[Path, str],
-) -> None:
+    *,
+    checksum: bool = False,
+) -> Optional[str]:
     """
     A sort of simpler copy2 that doesn't copy extended file attributes,
     only the access time and modified times from source to dest.
 
     The extended attribute copy does weird things with SELinux and files
     copied from temporary directories.
+
+    If checksum is True, the MD5 checksum of the file is calculated while
+    copying and returned.
     """
     source, dest = _coerce_to_path(source, dest)
 
-    shutil.copy(source, dest)
+    if checksum:
+        digest = copy_file_with_checksum(source, dest)
+        shutil.copymode(source, dest)
+    else:
+        shutil.copy(source, dest)
+        digest = None
     copy_basic_file_stats(source, dest)
 
+    return digest
+
 
 def maybe_override_pixel_limit() -> None:
     """
@@ -61,6 +116,85 @@ def maybe_override_pixel_limit() -> None:
         Image.MAX_IMAGE_PIXELS = pixel_count
 
 
+def prune_least_recently_used(directory: Path, pattern: str, limit: int) -> int:
+    """
+    Removes the least recently modified files matching the pattern in the
+    directory, until their total size is no larger than the limit in bytes.
+    Returns the remaining total size.
+    """
+    entries = []
+    total = 0
+    for path in Path(directory).glob(pattern):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:  # pragma: no cover
+            # Removed by another process
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, path))
+        total += stat.st_size
+
+    if total <= limit:
+        return total
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= limit:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+    return total
+
+
+class PathPatternMatcher:
+    """
+    Matches relative paths against glob patterns, like fnmatch matching every
+    part of the path against every pattern.  Directories are matched with a
+    trailing slash, so "dir/*" matches everything in the directory "dir".
+
+    The patterns are compiled into a single regular expression once, and the
+    results are cached by part, as the paths of many files share the same
+    directories.
+    """
+
+    def __init__(self, patterns: Iterable[str], cache_size: int = 4096) -> None:
+        translated = [
+            fnmatch.translate(os.path.normcase(pattern)) for pattern in patterns
+        ]
+        self._regex = re.compile("|".join(translated)) if translated else None
+        self._match_part = lru_cache(maxsize=cache_size)(self._match_part_uncached)
+
+    def _match_part_uncached(self, part: str) -> bool:
+        return self._regex.match(os.path.normcase(part)) is not None
+
+    def matches(self, path: Union[PurePath, str]) -> bool:
+        parts = PurePath(path).parts
+        if self._regex is None or not parts:
+            return False
+        *directories, name = parts
+        return self._match_part(name) or any(
+            self._match_part(directory + "/") for directory in directories
+        )
+
+
+def rotate_pdf_pages(pdf, degrees: int) -> None:
+    """
+    Rotates all pages of the pikepdf PDF by the degrees, relative to their
+    current rotation
+    """
+    for page in pdf.pages:
+        page.rotate(degrees, relative=True)
+
+
+def remove_pdf_pages(pdf, pages: list[int]) -> None:
+    """
+    Removes the pages, by their 1-based number, from the pikepdf PDF
+    """
+    for page_num in sorted(pages, reverse=True):
+        del pdf.pages[page_num - 1]
+    pdf.remove_unreferenced_resources()
+
+
 def run_subprocess(
     arguments: list[str],
     env: Optional[dict[str, str]] = None,
@@ -38,6 +38,7 @@ from django.http import HttpResponseForbidden
 from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
 from django.utils.decorators import method_decorator
 from django.utils.timezone import make_aware
 from django.utils.translation import get_language
@@ -47,7 +48,6 @@ from django.views.decorators.http import condition
 from django.views.decorators.http import last_modified
 from django.views.generic import TemplateView
 from django_filters.rest_framework import DjangoFilterBackend
-from langdetect import detect
 from packaging import version as packaging_version
 from redis import Redis
 from rest_framework import parsers
@@ -73,16 +73,18 @@ from documents import index
 from documents.bulk_download import ArchiveOnlyStrategy
 from documents.bulk_download import OriginalAndArchiveStrategy
 from documents.bulk_download import OriginalsOnlyStrategy
+from documents.caching import CACHE_1_YEAR
 from documents.caching import CACHE_50_MINUTES
-from documents.caching import get_metadata_cache
+from documents.caching import get_consumer_metrics
+from documents.caching import get_date_suggestions_cache
 from documents.caching import get_suggestion_cache
-from documents.caching import refresh_metadata_cache
 from documents.caching import refresh_suggestions_cache
-from documents.caching import set_metadata_cache
+from documents.caching import set_date_suggestions_cache
 from documents.caching import set_suggestions_cache
 from documents.classifier import load_classifier
 from documents.conditionals import metadata_etag
 from documents.conditionals import metadata_last_modified
+from documents.conditionals import page_preview_etag
 from documents.conditionals import preview_etag
 from documents.conditionals import preview_last_modified
 from documents.conditionals import suggestions_etag
@@ -104,6 +106,7 @@ from documents.matching import match_correspondents
 from documents.matching import match_document_types
 from documents.matching import match_storage_paths
 from documents.matching import match_tags
+from documents.metadata import get_document_metadata
 from documents.models import Correspondent
 from documents.models import CustomField
 from documents.models import Document
@@ -118,7 +121,6 @@ from documents.models import UiSettings
 from documents.models import Workflow
 from documents.models import WorkflowAction
 from documents.models import WorkflowTrigger
-from documents.parsers import get_parser_class_for_mime_type
 from documents.parsers import parse_date_generator
 from documents.permissions import PaperlessAdminPermissions
 from documents.permissions import PaperlessNotePermissions
@@ -126,6 +128,14 @@ from documents.permissions import PaperlessObjectPermissions
 from documents.permissions import get_objects_for_user_owner_aware
 from documents.permissions import has_perms_owner_aware
 from documents.permissions import set_permissions_for_object
+from documents.previews import PAGE_PREVIEW_SIZE_DEFAULT
+from documents.previews import PAGE_PREVIEW_SIZES
+from documents.previews import THUMBNAIL_SIZE_MEDIUM
+from documents.previews import THUMBNAIL_SIZES
+from documents.previews import PreviewUnavailableError
+from documents.previews import get_page_preview_path
+from documents.previews import get_thumbnail_path
+from documents.previews import page_preview_tag
 from documents.serialisers import AcknowledgeTasksViewSerializer
 from documents.serialisers import BulkDownloadSerializer
 from documents.serialisers import BulkEditObjectsSerializer
@@ -426,30 +436,6 @@ class DocumentViewSet(
             disposition=disposition,
         )
 
-    def get_metadata(self, file, mime_type):
-        if not os.path.isfile(file):
-            return None
-
-        parser_class = get_parser_class_for_mime_type(mime_type)
-        if parser_class:
-            parser = parser_class(progress_callback=None, logging_group=None)
-
-            try:
-                return parser.extract_metadata(file, mime_type)
-            except Exception:  # pragma: no cover
-                logger.exception(f"Issue getting metadata for {file}")
-                # TODO: cover GPG errors, remove later.
-                return []
-        else:  # pragma: no cover
-            logger.warning(f"No parser for {mime_type}")
-            return []
-
-    def get_filesize(self, filename):
-        if os.path.isfile(filename):
-            return os.stat(filename).st_size
-        else:
-            return None
-
     @action(methods=["get"], detail=True)
     @method_decorator(
         condition(etag_func=metadata_etag, last_modified_func=metadata_last_modified),
@@ -466,46 +452,23 @@ class DocumentViewSet(
         except Document.DoesNotExist:
             raise Http404
 
-        document_cached_metadata = get_metadata_cache(doc.pk)
-
-        archive_metadata = None
-        archive_filesize = None
-        if document_cached_metadata is not None:
-            original_metadata = document_cached_metadata.original_metadata
-            archive_metadata = document_cached_metadata.archive_metadata
-            refresh_metadata_cache(doc.pk)
-        else:
-            original_metadata = self.get_metadata(doc.source_path, doc.mime_type)
-
-            if doc.has_archive_version:
-                archive_filesize = self.get_filesize(doc.archive_path)
-                archive_metadata = self.get_metadata(
-                    doc.archive_path,
-                    "application/pdf",
-                )
-            set_metadata_cache(doc, original_metadata, archive_metadata)
+        metadata = get_document_metadata(doc)
 
         meta = {
             "original_checksum": doc.checksum,
-            "original_size": self.get_filesize(doc.source_path),
+            "original_size": metadata.original_size,
             "original_mime_type": doc.mime_type,
             "media_filename": doc.filename,
             "has_archive_version": doc.has_archive_version,
-            "original_metadata": original_metadata,
+            "original_metadata": metadata.original_metadata,
             "archive_checksum": doc.archive_checksum,
             "archive_media_filename": doc.archive_filename,
             "original_filename": doc.original_filename,
-            "archive_size": archive_filesize,
-            "archive_metadata": archive_metadata,
+            "archive_size": metadata.archive_size,
+            "archive_metadata": metadata.archive_metadata,
+            "lang": metadata.language,
         }
 
-        lang = "en"
-        try:
-            lang = detect(doc.content)
-        except Exception:
-            pass
-        meta["lang"] = lang
-
         return Response(meta)
 
     @action(methods=["get"], detail=True)
@@ -534,10 +497,18 @@ class DocumentViewSet(
 
         dates = []
         if settings.NUMBER_OF_SUGGESTED_DATES > 0:
-            gen = parse_date_generator(doc.filename, doc.content)
-            dates = sorted(
-                {i for i in itertools.islice(gen, settings.NUMBER_OF_SUGGESTED_DATES)},
-            )
+            # Dates only depend on the content, so they are cached by content
+            # and survive changes of the classifier
+            dates = get_date_suggestions_cache(doc.filename, doc.content)
+            if dates is None:
+                gen = parse_date_generator(doc.filename, doc.content)
+                dates = [
+                    date.strftime("%Y-%m-%d")
+                    for date in sorted(
+                        set(itertools.islice(gen, settings.NUMBER_OF_SUGGESTED_DATES)),
+                    )
+                ]
+                set_date_suggestions_cache(doc.filename, doc.content, dates)
 
         resp_data = {
             "correspondents": [
@@ -550,7 +521,7 @@ class DocumentViewSet(
             "storage_paths": [
                 dt.id for dt in match_storage_paths(doc, classifier, request.user)
             ],
-            "dates": [date.strftime("%Y-%m-%d") for date in dates if date is not None],
+            "dates": dates,
         }
 
         # Cache the suggestions and the classifier hash for later
@@ -574,6 +545,9 @@ class DocumentViewSet(
     @method_decorator(cache_control(public=False, max_age=CACHE_50_MINUTES))
     @method_decorator(last_modified(thumbnail_last_modified))
     def thumb(self, request, pk=None):
+        size = request.query_params.get("size", THUMBNAIL_SIZE_MEDIUM)
+        if size != THUMBNAIL_SIZE_MEDIUM and size not in THUMBNAIL_SIZES:
+            return HttpResponseBadRequest("Invalid thumbnail size")
         try:
             doc = Document.objects.select_related("owner").get(id=pk)
             if request.user is not None and not has_perms_owner_aware(
@@ -583,14 +557,51 @@ class DocumentViewSet(
             ):
                 return HttpResponseForbidden("Insufficient permissions")
             if doc.storage_type == Document.STORAGE_TYPE_GPG:
+                # Encrypted thumbnails are not cached in other sizes
                 handle = GnuPG.decrypted(doc.thumbnail_file)
             else:
-                handle = doc.thumbnail_file
+                handle = get_thumbnail_path(doc, size).read_bytes()
 
             return HttpResponse(handle, content_type="image/webp")
         except (FileNotFoundError, Document.DoesNotExist):
             raise Http404
 
+    @action(methods=["get"], detail=True, url_path=r"pages/(?P<page>[0-9]+)")
+    @method_decorator(condition(etag_func=page_preview_etag))
+    def page_preview(self, request, pk=None, page=None):
+        size = request.query_params.get("size", PAGE_PREVIEW_SIZE_DEFAULT)
+        if size not in PAGE_PREVIEW_SIZES:
+            return HttpResponseBadRequest("Invalid page preview size")
+        try:
+            doc = Document.objects.select_related("owner").get(id=pk)
+            if request.user is not None and not has_perms_owner_aware(
+                request.user,
+                "view_document",
+                doc,
+            ):
+                return HttpResponseForbidden("Insufficient permissions")
+            handle = get_page_preview_path(doc, int(page), size).read_bytes()
+        except (
+            FileNotFoundError,
+            IndexError,
+            PreviewUnavailableError,
+            Document.DoesNotExist,
+        ):
+            raise Http404
+
+        response = HttpResponse(handle, content_type="image/webp")
+        if request.query_params.get("v") == page_preview_tag(doc, page, size):
+            # The URL names the content of the document, so it never changes
+            patch_cache_control(
+                response,
+                private=True,
+                max_age=CACHE_1_YEAR,
+                immutable=True,
+            )
+        else:
+            patch_cache_control(response, private=True, max_age=CACHE_50_MINUTES)
+        return response
+
     @action(methods=["get"], detail=True)
     def download(self, request, pk=None):
         try:
@@ -999,6 +1010,14 @@ class BulkEditView(PassUserMixin):
                 return HttpResponseForbidden("Insufficient permissions")
 
         try:
+            if (
+                method in bulk_edit.CHUNKED_METHODS
+                and len(documents) > settings.BULK_EDIT_CHUNK_SIZE
+            ):
+                # Too many documents to edit within the request
+                task = bulk_edit.bulk_edit_job.delay(method, documents, parameters)
+                return Response({"result": "OK", "task_id": task.id})
+
             # TODO: parameter validation
             result = method(documents, **parameters)
             return Response({"result": result})
@@ -2030,6 +2049,12 @@ class SystemStatusView(PassUserMixin):
                 f"System status detected a possible problem while loading the classifier: {e}",
             )
 
+        # Imported here, so the documents app doesn't depend on the parser
+        from paperless_tesseract.scheduler import get_scheduler_metrics
+        from paperless_tesseract.scheduler import scheduler_enabled
+
+        ocr_scheduler_metrics = get_scheduler_metrics() if scheduler_enabled() else None
+
         return Response(
             {
                 "pngx_version": current_version,
@@ -2063,6 +2088,8 @@ class SystemStatusView(PassUserMixin):
                     "classifier_last_trained": classifier_last_trained,
                     "classifier_error": classifier_error,
                 },
+                "ocr_scheduler": ocr_scheduler_metrics,
+                "consumer": get_consumer_metrics(),
             },
         )
 
@@ -0,0 +1,282 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+from typing import Optional
+
+from django.db import transaction
+from django.db.models import Prefetch
+
+from documents.caching import bump_workflow_generation
+from documents.caching import get_workflow_generation
+from documents.models import MatchingModel
+from documents.models import Workflow
+from documents.models import WorkflowAction
+from documents.models import WorkflowTrigger
+
+if TYPE_CHECKING:
+    from documents.matching import ContentMatcher
+
+logger = logging.getLogger("paperless.workflows")
+
+
+@dataclass(frozen=True)
+class WorkflowTriggerPlan:
+    """
+    A workflow trigger with all of its filters resolved, so matching a document
+    against it does not require further queries
+    """
+
+    # Kept for logging
+    trigger: WorkflowTrigger
+    type: int
+    # None if the trigger does not filter by content
+    content_matcher: Optional["ContentMatcher"]
+    sources: frozenset[int]
+    filter_filename: Optional[str]
+    filter_path: Optional[str]
+    filter_mailrule_id: Optional[int]
+    filter_has_tag_ids: frozenset[int]
+    filter_has_correspondent_id: Optional[int]
+    filter_has_document_type_id: Optional[int]
+
+    def __str__(self) -> str:
+        return str(self.trigger)
+
+
+@dataclass(frozen=True)
+class WorkflowActionPlan:
+    """
+    A workflow action with every assignment and removal resolved to primary keys
+    """
+
+    action: WorkflowAction
+    type: int
+    assign_title: Optional[str]
+    assign_tag_ids: tuple[int, ...]
+    assign_correspondent_id: Optional[int]
+    assign_document_type_id: Optional[int]
+    assign_storage_path_id: Optional[int]
+    assign_owner_id: Optional[int]
+    assign_view_user_ids: tuple[int, ...]
+    assign_view_group_ids: tuple[int, ...]
+    assign_change_user_ids: tuple[int, ...]
+    assign_change_group_ids: tuple[int, ...]
+    assign_custom_field_ids: tuple[int, ...]
+    remove_all_tags: bool
+    remove_tag_ids: frozenset[int]
+    remove_all_correspondents: bool
+    remove_correspondent_ids: frozenset[int]
+    remove_all_document_types: bool
+    remove_document_type_ids: frozenset[int]
+    remove_all_storage_paths: bool
+    remove_storage_path_ids: frozenset[int]
+    remove_all_owners: bool
+    remove_owner_ids: frozenset[int]
+    remove_all_permissions: bool
+    remove_view_user_ids: frozenset[int]
+    remove_view_group_ids: frozenset[int]
+    remove_change_user_ids: frozenset[int]
+    remove_change_group_ids: frozenset[int]
+    remove_all_custom_fields: bool
+    remove_custom_field_ids: frozenset[int]
+
+    def __str__(self) -> str:
+        return str(self.action)
+
+    @property
+    def assigns_permissions(self) -> bool:
+        return bool(
+            self.assign_view_user_ids
+            or self.assign_view_group_ids
+            or self.assign_change_user_ids
+            or self.assign_change_group_ids,
+        )
+
+    @property
+    def removes_permissions(self) -> bool:
+        return bool(
+            self.remove_view_user_ids
+            or self.remove_view_group_ids
+            or self.remove_change_user_ids
+            or self.remove_change_group_ids,
+        )
+
+
+@dataclass(frozen=True)
+class WorkflowPlan:
+    """
+    An immutable, compiled form of a Workflow, its triggers and its actions
+    """
+
+    workflow: Workflow
+    triggers: tuple[WorkflowTriggerPlan, ...]
+    actions: tuple[WorkflowActionPlan, ...]
+
+    def __str__(self) -> str:
+        return str(self.workflow)
+
+    def triggers_of_type(
+        self,
+        trigger_type: WorkflowTrigger.WorkflowTriggerType,
+    ) -> tuple[WorkflowTriggerPlan, ...]:
+        return tuple(
+            trigger for trigger in self.triggers if trigger.type == trigger_type
+        )
+
+
+def _pks(related_objects) -> tuple[int, ...]:
+    return tuple(obj.pk for obj in related_objects.all())
+
+
+def compile_trigger(trigger: WorkflowTrigger) -> WorkflowTriggerPlan:
+    # documents.matching builds on the plans
+    from documents.matching import ContentMatcher
+
+    return WorkflowTriggerPlan(
+        trigger=trigger,
+        type=trigger.type,
+        content_matcher=(
+            ContentMatcher(trigger)
+            if trigger.matching_algorithm > MatchingModel.MATCH_NONE
+            else None
+        ),
+        sources=frozenset(int(x) for x in trigger.sources),
+        filter_filename=trigger.filter_filename or None,
+        filter_path=trigger.filter_path or None,
+        filter_mailrule_id=trigger.filter_mailrule_id,
+        filter_has_tag_ids=frozenset(_pks(trigger.filter_has_tags)),
+        filter_has_correspondent_id=trigger.filter_has_correspondent_id,
+        filter_has_document_type_id=trigger.filter_has_document_type_id,
+    )
+
+
+def compile_action(action: WorkflowAction) -> WorkflowActionPlan:
+    return WorkflowActionPlan(
+        action=action,
+        type=action.type,
+        assign_title=action.assign_title,
+        assign_tag_ids=_pks(action.assign_tags),
+        assign_correspondent_id=action.assign_correspondent_id,
+        assign_document_type_id=action.assign_document_type_id,
+        assign_storage_path_id=action.assign_storage_path_id,
+        assign_owner_id=action.assign_owner_id,
+        assign_view_user_ids=_pks(action.assign_view_users),
+        assign_view_group_ids=_pks(action.assign_view_groups),
+        assign_change_user_ids=_pks(action.assign_change_users),
+        assign_change_group_ids=_pks(action.assign_change_groups),
+        assign_custom_field_ids=_pks(action.assign_custom_fields),
+        remove_all_tags=action.remove_all_tags,
+        remove_tag_ids=frozenset(_pks(action.remove_tags)),
+        remove_all_correspondents=action.remove_all_correspondents,
+        remove_correspondent_ids=frozenset(_pks(action.remove_correspondents)),
+        remove_all_document_types=action.remove_all_document_types,
+        remove_document_type_ids=frozenset(_pks(action.remove_document_types)),
+        remove_all_storage_paths=action.remove_all_storage_paths,
+        remove_storage_path_ids=frozenset(_pks(action.remove_storage_paths)),
+        remove_all_owners=action.remove_all_owners,
+        remove_owner_ids=frozenset(_pks(action.remove_owners)),
+        remove_all_permissions=action.remove_all_permissions,
+        remove_view_user_ids=frozenset(_pks(action.remove_view_users)),
+        remove_view_group_ids=frozenset(_pks(action.remove_view_groups)),
+        remove_change_user_ids=frozenset(_pks(action.remove_change_users)),
+        remove_change_group_ids=frozenset(_pks(action.remove_change_groups)),
+        remove_all_custom_fields=action.remove_all_custom_fields,
+        remove_custom_field_ids=frozenset(_pks(action.remove_custom_fields)),
+    )
+
+
+def compile_workflow(workflow: Workflow) -> WorkflowPlan:
+    """
+    Compiles the given Workflow into a plan.  Prefetch the triggers and actions
+    (see load_workflow_plans) to avoid queries per related object.
+    """
+    return WorkflowPlan(
+        workflow=workflow,
+        triggers=tuple(compile_trigger(trigger) for trigger in workflow.triggers.all()),
+        actions=tuple(compile_action(action) for action in workflow.actions.all()),
+    )
+
+
+def load_workflow_plans() -> tuple[WorkflowPlan, ...]:
+    """
+    Compiles all enabled workflows, in order, using a fixed number of queries
+    """
+    workflows = (
+        Workflow.objects.filter(enabled=True)
+        .prefetch_related(
+            Prefetch(
+                "triggers",
+                queryset=WorkflowTrigger.objects.select_related(
+                    "filter_has_correspondent",
+                    "filter_has_document_type",
+                ).prefetch_related("filter_has_tags"),
+            ),
+            Prefetch(
+                "actions",
+                queryset=WorkflowAction.objects.prefetch_related(
+                    "assign_tags",
+                    "assign_view_users",
+                    "assign_view_groups",
+                    "assign_change_users",
+                    "assign_change_groups",
+                    "assign_custom_fields",
+                    "remove_tags",
+                    "remove_correspondents",
+                    "remove_document_types",
+                    "remove_storage_paths",
+                    "remove_owners",
+                    "remove_view_users",
+                    "remove_view_groups",
+                    "remove_change_users",
+                    "remove_change_groups",
+                    "remove_custom_fields",
+                ),
+            ),
+        )
+        .order_by("order")
+    )
+    return tuple(compile_workflow(workflow) for workflow in workflows)
+
+
+_plans_lock = threading.Lock()
+_plans: Optional[tuple[str, tuple[WorkflowPlan, ...]]] = None
+
+
+def get_workflow_plans() -> tuple[WorkflowPlan, ...]:
+    """
+    Returns the compiled plans of all enabled workflows.  The plans are cached
+    per process and recompiled once the workflow generation changes.
+    """
+    global _plans
+
+    generation = get_workflow_generation()
+    if generation is None:  # pragma: no cover
+        # The cache cannot tell us about changes, so never trust old plans
+        return load_workflow_plans()
+
+    with _plans_lock:
+        if _plans is None or _plans[0] != generation:
+            logger.debug(f"Compiling workflows for generation {generation}")
+            _plans = (generation, load_workflow_plans())
+        return _plans[1]
+
+
+def _clear_workflow_plans() -> None:
+    global _plans
+
+    bump_workflow_generation()
+    with _plans_lock:
+        _plans = None
+
+
+def invalidate_workflow_plans() -> None:
+    """
+    Marks the compiled workflows as outdated in all processes.
+
+    The generation is bumped right away for this process and again once the
+    surrounding transaction commits, so other processes cannot compile and keep
+    plans from data which was not yet visible to them.
+    """
+    _clear_workflow_plans()
+    transaction.on_commit(_clear_workflow_plans)
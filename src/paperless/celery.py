@@ -15,3 +15,25 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """
+    Routes the tasks which parse documents to the consumer queues.  Documents
+    uploaded through the API go to the priority queue, as a user is likely
+    waiting for them.  All other tasks use the default queue.
+
+    https://docs.celeryq.dev/en/stable/userguide/routing.html#routers
+    """
+    from django.conf import settings
+
+    from documents.data_models import DocumentSource
+
+    if name == "documents.tasks.consume_file":
+        input_doc = args[0] if args else kwargs.get("input_doc")
+        if input_doc is not None and input_doc.source == DocumentSource.ApiUpload:
+            return {"queue": settings.CONSUMER_PRIORITY_TASK_QUEUE}
+        return {"queue": settings.CONSUMER_TASK_QUEUE}
+    elif name == "documents.tasks.update_document_archive_file":
+        return {"queue": settings.CONSUMER_TASK_QUEUE}
+    return None
@@ -176,6 +176,17 @@ def settings_values_check(app_configs, **kwargs):
             )
         return msgs
 
+    def _thumbnail_engine_validate():
+        """
+        Validates the thumbnail engine
+        """
+        msgs = []
+        if settings.THUMBNAIL_ENGINE not in ["PDFIUM", "CONVERT"]:
+            msgs.append(
+                Error(f'Invalid thumbnail engine "{settings.THUMBNAIL_ENGINE}"'),
+            )
+        return msgs
+
     def _email_certificate_validate():
         msgs = []
         # Existence checks
@@ -194,6 +205,7 @@ def settings_values_check(app_configs, **kwargs):
         _ocrmypdf_settings_check()
         + _timezone_validate()
         + _barcode_scanner_validate()
+        + _thumbnail_engine_validate()
         + _email_certificate_validate()
     )
 
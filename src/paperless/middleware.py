@@ -1,5 +1,6 @@
 from django.conf import settings
 
+from documents.signals.handlers import defer_filename_updates
 from paperless import version
 
 
@@ -15,3 +16,17 @@ class ApiVersionMiddleware:
             response["X-Version"] = version.__full_version_str__
 
         return response
+
+
+class DeferredFilenameUpdateMiddleware:
+    """
+    Moves the files of the documents changed by a request in the background,
+    once the request is done
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with defer_filename_updates():
+            return self.get_response(request)
@@ -17,6 +17,7 @@ from celery.schedules import crontab
 from concurrent_log_handler.queue import setup_logging_queues
 from django.utils.translation import gettext_lazy as _
 from dotenv import load_dotenv
+from kombu import Queue
 
 # Tap paperless.conf if it's available
 configuration_path = os.getenv("PAPERLESS_CONFIGURATION_PATH")
@@ -355,6 +356,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "allauth.account.middleware.AccountMiddleware",
+    "paperless.middleware.DeferredFilenameUpdateMiddleware",
 ]
 
 # Optional to enable compression
@@ -811,6 +813,10 @@ CELERY_BROKER_TRANSPORT_OPTIONS = {
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT: Final[int] = __get_int("PAPERLESS_WORKER_TIMEOUT", 1800)
 
+# Bulk edits of more documents are run as background jobs, this many documents
+# at a time
+BULK_EDIT_CHUNK_SIZE: Final[int] = __get_int("PAPERLESS_BULK_EDIT_CHUNK_SIZE", 500)
+
 CELERY_RESULT_EXTENDED = True
 CELERY_RESULT_BACKEND = "django-db"
 CELERY_CACHE_BACKEND = "default"
@@ -820,6 +826,40 @@ CELERY_TASK_SERIALIZER = "pickle"
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#std-setting-accept_content
 CELERY_ACCEPT_CONTENT = ["application/json", "application/x-python-serialize"]
 
+# Documents are processed on their own queues, so the many small tasks are not
+# stuck behind a backlog of documents.  Uploads through the API go to the
+# priority queue.  A worker consumes all queues unless started with -Q, which
+# allows dedicated workers with their own concurrency per queue.
+CELERY_TASK_DEFAULT_QUEUE: Final[str] = "celery"
+CONSUMER_TASK_QUEUE: Final[str] = os.getenv(
+    "PAPERLESS_CONSUMER_TASK_QUEUE",
+    "consume",
+)
+CONSUMER_PRIORITY_TASK_QUEUE: Final[str] = os.getenv(
+    "PAPERLESS_CONSUMER_PRIORITY_TASK_QUEUE",
+    "consume_priority",
+)
+CELERY_TASK_QUEUES = [
+    Queue(name)
+    for name in dict.fromkeys(
+        [
+            CELERY_TASK_DEFAULT_QUEUE,
+            CONSUMER_PRIORITY_TASK_QUEUE,
+            CONSUMER_TASK_QUEUE,
+        ],
+    )
+]
+CELERY_TASK_ROUTES = ("paperless.celery.route_task",)
+
+# Task modules outside of the tasks modules found automatically
+CELERY_IMPORTS = ("documents.bulk_edit",)
+
+# Don't let a worker reserve several long running documents while another
+# one of its processes is idle.  This only keeps uploads and small tasks from
+# waiting behind documents with dedicated workers per queue, like the Docker
+# image starts.
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#beat-schedule
 CELERY_BEAT_SCHEDULE = _parse_beat_schedule()
 
@@ -858,6 +898,11 @@ THREADS_PER_WORKER = os.getenv(
     default_threads_per_worker(CELERY_WORKER_CONCURRENCY),
 )
 
+# The cores of this node shared by the OCR jobs of all workers.  Each job is
+# granted as many free cores as its document has pages, instead of
+# THREADS_PER_WORKER.  0 disables the scheduling.
+OCR_CORES: Final[int] = __get_int("PAPERLESS_OCR_CORES", 0)
+
 ###############################################################################
 # Paperless Specific Settings                                                 #
 ###############################################################################
@@ -925,6 +970,19 @@ CONSUMER_BARCODE_UPSCALE: Final[float] = __get_float(
 
 CONSUMER_BARCODE_DPI: Final[int] = __get_int("PAPERLESS_CONSUMER_BARCODE_DPI", 300)
 
+# Pages are first scanned at this lower DPI, and only pages with barcodes
+# found are scanned again at CONSUMER_BARCODE_DPI.  0 disables the first scan.
+CONSUMER_BARCODE_PREVIEW_DPI: Final[int] = __get_int(
+    "PAPERLESS_CONSUMER_BARCODE_PREVIEW_DPI",
+    0,
+)
+
+# OCR a batch once before splitting it, the split documents then find their
+# pages in the OCR cache
+CONSUMER_BARCODE_OCR_BEFORE_SPLIT: Final[bool] = __get_boolean(
+    "PAPERLESS_CONSUMER_BARCODE_OCR_BEFORE_SPLIT",
+)
+
 CONSUMER_BARCODE_MAX_PAGES: Final[int] = __get_int(
     "PAPERLESS_CONSUMER_BARCODE_MAX_PAGES",
     0,
@@ -994,6 +1052,14 @@ OCR_COLOR_CONVERSION_STRATEGY = os.getenv(
 
 OCR_USER_ARGS = os.getenv("PAPERLESS_OCR_USER_ARGS")
 
+# The OCRmyPDF output of every page is kept in this directory, keyed by the
+# content of the page and the OCR settings, so pages are not OCRed again when
+# a document is reprocessed, or its pages end up in another document.  Once the
+# cache grows beyond its size in megabytes, the least recently used pages are
+# removed.  A size of 0 disables the cache.
+OCR_CACHE_DIR = __get_path("PAPERLESS_OCR_CACHE_DIR", DATA_DIR / "ocr-cache")
+OCR_CACHE_SIZE: Final[int] = __get_int("PAPERLESS_OCR_CACHE_SIZE", 0)
+
 MAX_IMAGE_PIXELS: Final[Optional[int]] = __get_optional_int(
     "PAPERLESS_MAX_IMAGE_PIXELS",
 )
@@ -1008,6 +1074,19 @@ CONVERT_MEMORY_LIMIT = os.getenv("PAPERLESS_CONVERT_MEMORY_LIMIT")
 
 GS_BINARY = os.getenv("PAPERLESS_GS_BINARY", "gs")
 
+# PDFIUM renders thumbnails in process, CONVERT uses ImageMagick and Ghostscript.
+# CONVERT is also the fallback if pdfium cannot render a document.
+THUMBNAIL_ENGINE: Final[str] = os.getenv(
+    "PAPERLESS_THUMBNAIL_ENGINE",
+    "PDFIUM",
+).upper()
+
+# Smaller thumbnails and page previews are rendered on demand and kept in this
+# directory, keyed by the content of the document.  Once the cache grows beyond
+# its size in megabytes, the least recently used images are removed.
+PREVIEW_CACHE_DIR = __get_path("PAPERLESS_PREVIEW_CACHE_DIR", DATA_DIR / "previews")
+PREVIEW_CACHE_SIZE: Final[int] = __get_int("PAPERLESS_PREVIEW_CACHE_SIZE", 500)
+
 
 # Pre-2.x versions of Paperless stored your documents locally with GPG
 # encryption, but that is no longer the default.  This behaviour is still
@@ -1035,6 +1114,17 @@ FILENAME_DATE_ORDER = os.getenv("PAPERLESS_FILENAME_DATE_ORDER")
 # fewer dates shown.
 NUMBER_OF_SUGGESTED_DATES = __get_int("PAPERLESS_NUMBER_OF_SUGGESTED_DATES", 3)
 
+# Dates are only searched for in this many characters from the start of the
+# content, and in this many possible dates.  0 disables the limit.
+DATE_PARSER_MAX_CHARACTERS: Final[int] = __get_int(
+    "PAPERLESS_DATE_PARSER_MAX_CHARACTERS",
+    100_000,
+)
+DATE_PARSER_MAX_MATCHES: Final[int] = __get_int(
+    "PAPERLESS_DATE_PARSER_MAX_MATCHES",
+    500,
+)
+
 # Transformations applied before filename parsing
 FILENAME_PARSE_TRANSFORMS = []
 for t in json.loads(os.getenv("PAPERLESS_FILENAME_PARSE_TRANSFORMS", "[]")):
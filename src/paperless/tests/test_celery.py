@@ -0,0 +1,94 @@
+from pathlib import Path
+
+from django.test import TestCase
+from django.test import override_settings
+
+from documents.data_models import ConsumableDocument
+from documents.data_models import DocumentMetadataOverrides
+from documents.data_models import DocumentSource
+from paperless.celery import app
+
+
+class TestTaskRouting(TestCase):
+    SAMPLE_FILE = (
+        Path(__file__).parent.parent.parent
+        / "documents"
+        / "tests"
+        / "samples"
+        / "simple.pdf"
+    )
+
+    def _route(self, name: str, args=(), kwargs=None) -> str:
+        options = app.amqp.router.route({}, name, args, kwargs or {})
+        return options["queue"].name
+
+    def test_route_consume_by_source(self):
+        """
+        GIVEN:
+            - Documents from the API, the consumption folder and mail
+        WHEN:
+            - The consume task is routed
+        THEN:
+            - API uploads use the priority queue, all others the consumer queue
+        """
+        for source, queue in [
+            (DocumentSource.ApiUpload, "consume_priority"),
+            (DocumentSource.ConsumeFolder, "consume"),
+            (DocumentSource.MailFetch, "consume"),
+        ]:
+            with self.subTest(source=source):
+                input_doc = ConsumableDocument(
+                    source=source,
+                    original_file=self.SAMPLE_FILE,
+                )
+                self.assertEqual(
+                    self._route(
+                        "documents.tasks.consume_file",
+                        (input_doc, DocumentMetadataOverrides()),
+                    ),
+                    queue,
+                )
+
+    def test_route_other_tasks(self):
+        """
+        GIVEN:
+            - Tasks which do not parse documents
+        WHEN:
+            - The tasks are routed
+        THEN:
+            - The default queue is used
+        """
+        self.assertEqual(
+            self._route("documents.tasks.bulk_update_documents", ([1],)),
+            "celery",
+        )
+        self.assertEqual(
+            self._route("paperless_mail.tasks.process_mail_accounts"),
+            "celery",
+        )
+        self.assertEqual(
+            self._route(
+                "documents.tasks.update_document_archive_file",
+                kwargs={"document_id": 1},
+            ),
+            "consume",
+        )
+
+    @override_settings(CONSUMER_PRIORITY_TASK_QUEUE="consume")
+    def test_route_single_consumer_queue(self):
+        """
+        GIVEN:
+            - The priority queue is configured to the consumer queue
+        WHEN:
+            - An API upload is routed
+        THEN:
+            - The consumer queue is used
+        """
+        input_doc = ConsumableDocument(
+            source=DocumentSource.ApiUpload,
+            original_file=self.SAMPLE_FILE,
+        )
+        self.assertEqual(
+            self._route("documents.tasks.consume_file", (input_doc,)),
+            "consume",
+        )
@@ -212,6 +212,22 @@ class TestBarcodeSettingsChecks(DirectoriesMixin, TestCase):
         self.assertEqual(len(msgs), 0)
 
 
+class TestThumbnailSettingsChecks(DirectoriesMixin, TestCase):
+    @override_settings(THUMBNAIL_ENGINE="Invalid")
+    def test_thumbnail_engine_invalid(self):
+        msgs = settings_values_check(None)
+        self.assertEqual(len(msgs), 1)
+
+        msg = msgs[0]
+
+        self.assertIn('Invalid thumbnail engine "Invalid"', msg.msg)
+
+    @override_settings(THUMBNAIL_ENGINE="CONVERT")
+    def test_thumbnail_engine_valid(self):
+        msgs = settings_values_check(None)
+        self.assertEqual(len(msgs), 0)
+
+
 class TestEmailCertSettingsChecks(DirectoriesMixin, FileSystemAssertsMixin, TestCase):
     @override_settings(EMAIL_CERTIFICATE_FILE=Path("/tmp/not_actually_here.pem"))
     def test_not_valid_file(self):
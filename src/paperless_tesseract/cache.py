@@ -0,0 +1,194 @@
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+from typing import Optional
+
+from django.conf import settings
+
+from documents.utils import prune_least_recently_used
+from paperless.config import OcrConfig
+
+if TYPE_CHECKING:
+    import pikepdf
+
+logger = logging.getLogger("paperless.parsing.tesseract.cache")
+
+# Attributes a page may inherit from the page tree, which affect how it looks
+INHERITABLE_PAGE_KEYS = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+_cache_size: Optional[int] = None
+_cache_size_lock = threading.Lock()
+
+
+@dataclasses.dataclass(frozen=True)
+class CachedPage:
+    """
+    The OCRmyPDF output of one page: a PDF containing only this page, and the
+    text found on it
+    """
+
+    pdf_path: Path
+    text: str
+
+
+def ocr_cache_enabled() -> bool:
+    return settings.OCR_CACHE_SIZE > 0
+
+
+def config_fingerprint(config: OcrConfig) -> str:
+    """
+    Identifies everything which changes the OCRmyPDF output of a page, other
+    than the page itself
+    """
+    import ocrmypdf
+
+    values = dataclasses.asdict(config)
+    # Only decides whether the output is kept
+    values.pop("skip_archive_file")
+    values["ocrmypdf"] = ocrmypdf.__version__
+
+    return hashlib.sha256(
+        json.dumps(values, sort_keys=True, default=str).encode(),
+    ).hexdigest()
+
+
+def _hash_object(obj, digest, seen: dict) -> None:
+    import pikepdf
+
+    if isinstance(obj, pikepdf.Object) and obj.is_indirect:
+        if obj.objgen in seen:
+            # Shared or cyclic references are hashed by their first occurrence
+            digest.update(f"R{seen[obj.objgen]}".encode())
+            return
+        seen[obj.objgen] = len(seen)
+
+    if isinstance(obj, pikepdf.Stream):
+        digest.update(b"stream")
+        _hash_object(obj.stream_dict, digest, seen)
+        digest.update(obj.read_raw_bytes())
+    elif isinstance(obj, pikepdf.Dictionary):
+        digest.update(b"<<")
+        for key in sorted(obj.keys()):
+            # The page tree and stream lengths are not part of the content
+            if key in {"/Parent", "/Length"}:
+                continue
+            digest.update(key.encode())
+            _hash_object(obj[key], digest, seen)
+        digest.update(b">>")
+    elif isinstance(obj, pikepdf.Array):
+        digest.update(b"[")
+        for item in obj:
+            _hash_object(item, digest, seen)
+        digest.update(b"]")
+    elif isinstance(obj, pikepdf.String):
+        digest.update(b"(" + bytes(obj) + b")")
+    else:
+        digest.update(repr(obj).encode())
+
+
+def page_key(page: "pikepdf.Page", fingerprint: str) -> str:
+    """
+    Hashes everything a page is drawn from, so the key stays the same when the
+    page is moved to another document, or other pages are removed around it
+    """
+    digest = hashlib.sha256(fingerprint.encode())
+    seen = {}
+
+    _hash_object(page.obj, digest, seen)
+
+    for key in INHERITABLE_PAGE_KEYS:
+        if key in page.obj:
+            continue
+        node = page.obj.get("/Parent")
+        while node is not None and key not in node:
+            node = node.get("/Parent")
+        if node is not None:
+            digest.update(key.encode())
+            _hash_object(node[key], digest, seen)
+
+    return digest.hexdigest()
+
+
+def file_key(path: Path, fingerprint: str) -> str:
+    """
+    Files which aren't PDFs are OCRed as a whole, so they are keyed by their
+    content
+    """
+    digest = hashlib.sha256(fingerprint.encode())
+    digest.update(Path(path).read_bytes())
+    return digest.hexdigest()
+
+
+def _cache_path(key: str, suffix: str) -> Path:
+    return Path(settings.OCR_CACHE_DIR) / key[:2] / f"{key}{suffix}"
+
+
+def get_cached_page(key: str) -> Optional[CachedPage]:
+    pdf_path = _cache_path(key, ".pdf")
+    text_path = _cache_path(key, ".txt")
+    try:
+        # Updating the modified time marks the entry as recently used
+        os.utime(pdf_path)
+        os.utime(text_path)
+        return CachedPage(pdf_path, text_path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        # Not cached, or partially removed by pruning
+        return None
+
+
+def _write_atomic(path: Path, data: bytes) -> int:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_name, path)
+    except Exception:
+        Path(temp_name).unlink(missing_ok=True)
+        raise
+    return len(data)
+
+
+def store_page(key: str, pdf_data: bytes, text: str) -> None:
+    """
+    Stores the output of one page.  The text is written last, so an entry is
+    only found once it is complete.
+    """
+    size = _write_atomic(_cache_path(key, ".pdf"), pdf_data)
+    size += _write_atomic(_cache_path(key, ".txt"), text.encode("utf-8"))
+    _account(size)
+
+
+def _cache_limit() -> int:
+    return settings.OCR_CACHE_SIZE * 1024 * 1024
+
+
+def prune_ocr_cache(limit: Optional[int] = None) -> int:
+    """
+    Removes the least recently used entries until the cache is no larger than
+    the limit in bytes.  Returns the remaining size of the cache.
+    """
+    if limit is None:
+        limit = _cache_limit()
+
+    total = prune_least_recently_used(Path(settings.OCR_CACHE_DIR), "*/*.*", limit)
+
+    logger.debug(f"Pruned the OCR cache to {total} bytes")
+
+    return total
+
+
+def _account(size: int) -> None:
+    global _cache_size
+
+    with _cache_size_lock:
+        if _cache_size is None or _cache_size + size > _cache_limit():
+            _cache_size = prune_ocr_cache()
+        else:
+            _cache_size += size
@@ -1,6 +1,8 @@
 import os
 import re
 import tempfile
+from contextlib import ExitStack
+from io import BytesIO
 from pathlib import Path
 from typing import TYPE_CHECKING
 from typing import Optional
@@ -10,13 +12,37 @@ from PIL import Image
 
 from documents.parsers import DocumentParser
 from documents.parsers import ParseError
+from documents.parsers import make_thumbnail_from_page_image
 from documents.parsers import make_thumbnail_from_pdf
 from documents.utils import maybe_override_pixel_limit
 from documents.utils import run_subprocess
 from paperless.config import OcrConfig
 from paperless.models import ArchiveFileChoices
 from paperless.models import CleanChoices
+from paperless.models import ColorConvertChoices
 from paperless.models import ModeChoices
+from paperless_tesseract.cache import config_fingerprint
+from paperless_tesseract.cache import file_key
+from paperless_tesseract.cache import get_cached_page
+from paperless_tesseract.cache import ocr_cache_enabled
+from paperless_tesseract.cache import page_key
+from paperless_tesseract.cache import store_page
+from paperless_tesseract.scheduler import ocr_jobs
+from paperless_tesseract.scheduler import scheduler_enabled
+
+if TYPE_CHECKING:
+    import pikepdf
+
+# Entries of the document catalog which the pages stored in the OCR cache keep,
+# for the PDF/A conformance of the documents assembled from them
+PDF_DOCUMENT_KEYS = ("/Metadata", "/OutputIntents", "/MarkInfo", "/Lang")
+
+# How much text the original of a PDF needs, to be considered to have text.
+# A page with less text than this is also OCRed, if it is a scan.
+VALID_TEXT_LENGTH = 50
+
+# How much of a page an image has to cover, for the page to count as a scan
+FULL_PAGE_IMAGE_COVERAGE = 0.5
 
 
 class NoTextFoundException(Exception):
@@ -81,12 +107,51 @@ class RasterisedDocumentParser(DocumentParser):
         return result
 
     def get_thumbnail(self, document_path, mime_type, file_name=None):
+        # Only the original is rendered before, so the archive file isn't
+        # read just to look for its pages
+        if self.page_images is not None and self.archive_path is None:
+            try:
+                thumbnail = make_thumbnail_from_page_image(
+                    self.page_images,
+                    document_path,
+                    self.tempdir,
+                )
+            except Exception as e:
+                self.log.warning(f"Unable to use the rendered first page: {e}")
+            else:
+                if thumbnail is not None:
+                    return thumbnail
+
         return make_thumbnail_from_pdf(
             self.archive_path or document_path,
             self.tempdir,
             self.logging_group,
         )
 
+    def caches_pages(self) -> bool:
+        return ocr_cache_enabled()
+
+    def supports_concurrent_thumbnail(self, mime_type) -> bool:
+        """
+        The thumbnail is made from the archive file if there is one, so it can
+        only be made from the original while parsing if OCRmyPDF won't change
+        how the pages look
+        """
+        if self.settings.skip_archive_file == ArchiveFileChoices.ALWAYS:
+            return True
+        if mime_type != "application/pdf":
+            return False
+        if self.settings.rotate:
+            return False
+        if (
+            "pdfa" in self.settings.output_type
+            and self.settings.color_conversion_strategy == ColorConvertChoices.GRAY
+        ):
+            return False
+        return self.settings.mode == ModeChoices.REDO or not (
+            self.settings.deskew or self.settings.clean == CleanChoices.FINAL
+        )
+
     def is_image(self, mime_type) -> bool:
         return mime_type in [
             "image/png",
@@ -142,6 +207,18 @@ class RasterisedDocumentParser(DocumentParser):
         sidecar_file: Optional[Path],
         pdf_file: Path,
     ) -> Optional[str]:
+        return post_process_text(self.extract_raw_text(sidecar_file, pdf_file))
+
+    def extract_raw_text(
+        self,
+        sidecar_file: Optional[Path],
+        pdf_file: Path,
+    ) -> Optional[str]:
+        """
+        Reads the text of the sidecar file, or the PDF file if the sidecar
+        doesn't contain the text of all pages.  Pages are separated by form
+        feeds.
+        """
         # When re-doing OCR, the sidecar contains ONLY the new text, not
         # the whole text, so do not utilize it in that case
         if (
@@ -155,7 +232,7 @@ class RasterisedDocumentParser(DocumentParser):
                 # This happens when there's already text in the input file.
                 # The sidecar file will only contain text for OCR'ed pages.
                 self.log.debug("Using text from sidecar file")
-                return post_process_text(text)
+                return text
             else:
                 self.log.debug("Incomplete sidecar file: discarding.")
 
@@ -184,7 +261,7 @@ class RasterisedDocumentParser(DocumentParser):
                 )
                 text = self.read_file_handle_unicode_errors(Path(tmp.name))
 
-            return post_process_text(text)
+            return text
 
         except Exception:
             #  If pdftotext fails, fall back to OCR.
@@ -315,13 +392,308 @@ class RasterisedDocumentParser(DocumentParser):
 
         return ocrmypdf_args
 
+    def count_pages(self, input_file: Path) -> int:
+        import pikepdf
+
+        try:
+            with pikepdf.open(input_file) as pdf:
+                return len(pdf.pages)
+        except Exception:
+            pass
+        try:
+            with Image.open(input_file) as im:
+                return getattr(im, "n_frames", 1)
+        except Exception:
+            return 1
+
+    def call_ocrmypdf(self, args: dict) -> None:
+        """
+        Runs OCRmyPDF with as many jobs as the OCR scheduler grants for the
+        pages of the input file
+        """
+        import ocrmypdf
+
+        page_count = self.count_pages(args["input_file"]) if scheduler_enabled() else 1
+
+        with ocr_jobs(page_count) as jobs:
+            ocrmypdf.ocr(**{**args, "jobs": jobs})
+
+    def ocr_cache_keys(self, input_file: Path, mime_type) -> list[str]:
+        """
+        PDFs are cached page by page, other files as a whole
+        """
+        fingerprint = config_fingerprint(self.settings)
+
+        if mime_type != "application/pdf":
+            return [file_key(input_file, fingerprint)]
+
+        import pikepdf
+
+        with pikepdf.open(input_file) as pdf:
+            return [page_key(page, fingerprint) for page in pdf.pages]
+
+    def store_ocr_pages(
+        self,
+        keys: list[str],
+        pdf_file: Path,
+        texts: list[str],
+    ) -> None:
+        """
+        Stores every page of the OCRmyPDF output in the OCR cache.  Each page
+        keeps the document level information, such as PDF/A metadata, so any
+        of them can start an assembled document.
+        """
+        if len(keys) == 1:
+            store_page(keys[0], pdf_file.read_bytes(), texts[0])
+            return
+
+        import pikepdf
+
+        with pikepdf.open(pdf_file) as pdf:
+            for index, key in enumerate(keys):
+                with pikepdf.Pdf.new() as page_pdf:
+                    page_pdf.pages.append(pdf.pages[index])
+                    for name in PDF_DOCUMENT_KEYS:
+                        if name in pdf.Root:
+                            page_pdf.Root[name] = page_pdf.copy_foreign(
+                                pdf.make_indirect(pdf.Root[name]),
+                            )
+                    page_pdf.docinfo = page_pdf.copy_foreign(
+                        pdf.make_indirect(pdf.docinfo),
+                    )
+                    buffer = BytesIO()
+                    page_pdf.save(buffer)
+                store_page(key, buffer.getvalue(), texts[index])
+
+    def reuse_archive_pages(self, document_path: Path, archive_path: Path) -> bool:
+        """
+        Stores the pages of the archive file in the OCR cache, for the pages of
+        the document they were made from, together with the text of their text
+        layer
+        """
+        if not ocr_cache_enabled():
+            return False
+
+        import pikepdf
+
+        keys = self.ocr_cache_keys(Path(document_path), "application/pdf")
+        with pikepdf.open(archive_path) as pdf:
+            if len(pdf.pages) != len(keys):
+                return False
+
+        text = self.extract_raw_text(None, Path(archive_path))
+        texts = split_pages(text, len(keys)) if text is not None else None
+        if texts is None:
+            return False
+
+        self.store_ocr_pages(keys, Path(archive_path), texts)
+        return True
+
+    def run_ocrmypdf(self, args: dict, mime_type) -> Optional[str]:
+        """
+        Runs OCRmyPDF, only on the pages which aren't found in the OCR cache.
+        The archive file is assembled from the cached and the new pages.
+
+        Returns the text of all pages if any were cached, otherwise None, and
+        the text is read from the OCRmyPDF output as usual.
+        """
+        if not ocr_cache_enabled() or "sidecar" not in args:
+            # Only some pages are processed, their output isn't complete
+            self.call_ocrmypdf(args)
+            return None
+
+        try:
+            keys = self.ocr_cache_keys(Path(args["input_file"]), mime_type)
+        except Exception as e:
+            self.log.debug(f"Unable to use the OCR cache: {e}")
+            self.call_ocrmypdf(args)
+            return None
+
+        cached = [get_cached_page(key) for key in keys]
+        missing = [index for index, page in enumerate(cached) if page is None]
+
+        if len(missing) == len(keys):
+            self.call_ocrmypdf(args)
+            try:
+                texts = self.split_ocr_pages(
+                    args["sidecar"],
+                    Path(args["output_file"]),
+                    len(keys),
+                )
+                if texts is not None:
+                    self.store_ocr_pages(keys, Path(args["output_file"]), texts)
+            except Exception as e:  # pragma: no cover
+                self.log.warning(f"Unable to store pages in the OCR cache: {e}")
+            return None
+
+        self.log.debug(
+            f"Found {len(keys) - len(missing)} of {len(keys)} pages "
+            f"in the OCR cache",
+        )
+
+        import pikepdf
+
+        texts = [page.text if page is not None else None for page in cached]
+
+        if missing:
+            missing_file = Path(self.tempdir) / "ocr-missing.pdf"
+            missing_archive = Path(self.tempdir) / "ocr-missing-archive.pdf"
+            missing_sidecar = Path(self.tempdir) / "ocr-missing-sidecar.txt"
+
+            extract_pages(args["input_file"], missing, missing_file)
+
+            self.call_ocrmypdf(
+                {
+                    **args,
+                    "input_file": missing_file,
+                    "output_file": missing_archive,
+                    "sidecar": missing_sidecar,
+                },
+            )
+
+            missing_texts = self.split_ocr_pages(
+                missing_sidecar,
+                missing_archive,
+                len(missing),
+            )
+            if missing_texts is None:
+                self.log.debug(
+                    "Unable to split the text into pages, running OCRmyPDF "
+                    "on all pages",
+                )
+                self.call_ocrmypdf(args)
+                return None
+
+            try:
+                self.store_ocr_pages(
+                    [keys[index] for index in missing],
+                    missing_archive,
+                    missing_texts,
+                )
+            except Exception as e:  # pragma: no cover
+                self.log.warning(f"Unable to store pages in the OCR cache: {e}")
+
+            for index, text in zip(missing, missing_texts):
+                texts[index] = text
+
+        with ExitStack() as stack:
+            if missing:
+                archive = stack.enter_context(pikepdf.open(missing_archive))
+                first = 0
+            else:
+                archive = stack.enter_context(pikepdf.open(cached[0].pdf_path))
+                first = 1
+            # The new pages are in order already, the cached ones are put
+            # in between
+            for index in range(first, len(cached)):
+                if cached[index] is not None:
+                    page_pdf = stack.enter_context(
+                        pikepdf.open(cached[index].pdf_path),
+                    )
+                    archive.pages.insert(index, page_pdf.pages[0])
+            archive.save(args["output_file"])
+
+        return "\f".join(texts)
+
+    def split_ocr_pages(
+        self,
+        sidecar_file: Path,
+        pdf_file: Path,
+        page_count: int,
+    ) -> Optional[list[str]]:
+        """
+        Reads the text of the OCRmyPDF output, split into the given number of
+        pages.  Returns None, if the text can't be split like this.
+        """
+        text = self.extract_raw_text(sidecar_file, pdf_file)
+        if text is None:
+            return None
+        return split_pages(text, page_count)
+
+    def ocr_pages_without_text(
+        self,
+        document_path: Path,
+        original_text: str,
+    ) -> str:
+        """
+        Runs OCRmyPDF only on the pages of a PDF without text, and merges
+        their text with the text of the other pages.  A page has no text, if
+        none can be read from it, or if it is a scan with only a little text,
+        like a stamped page number.  Returns the original text if all pages
+        have text, their text can't be told apart, or OCRing the pages fails.
+        """
+        import pikepdf
+
+        if self.settings.pages:
+            # Only the first pages would be processed anyway
+            return original_text
+
+        with pikepdf.open(document_path) as pdf:
+            page_count = len(pdf.pages)
+
+            # pdftotext separates pages by form feeds, but the page index can
+            # only be trusted if there are as many of them as there are pages
+            texts = split_pages(original_text, page_count)
+            if texts is None:
+                self.log.debug(
+                    "Unable to tell the text of the pages apart, skipping "
+                    "OCRmyPDF entirely.",
+                )
+                return original_text
+
+            missing = [
+                index
+                for index, (page, text) in enumerate(zip(pdf.pages, texts))
+                if page_needs_ocr(page, text)
+            ]
+
+        if not missing:
+            self.log.debug("Document has text, skipping OCRmyPDF entirely.")
+            return original_text
+
+        self.log.debug(f"OCRing {len(missing)} of {page_count} pages without text")
+
+        pages_file = Path(self.tempdir) / "pages-without-text.pdf"
+        pages_archive = Path(self.tempdir) / "pages-without-text-archive.pdf"
+        pages_sidecar = Path(self.tempdir) / "pages-without-text-sidecar.txt"
+
+        try:
+            extract_pages(document_path, missing, pages_file)
+            args = self.construct_ocrmypdf_parameters(
+                pages_file,
+                "application/pdf",
+                pages_archive,
+                pages_sidecar,
+            )
+            self.log.debug(f"Calling OCRmyPDF with args: {args}")
+            cached_text = self.run_ocrmypdf(args, "application/pdf")
+            if cached_text is not None:
+                ocr_texts = split_pages(cached_text, len(missing))
+            else:
+                ocr_texts = self.split_ocr_pages(
+                    pages_sidecar,
+                    pages_archive,
+                    len(missing),
+                )
+        except Exception as e:
+            self.log.warning(f"Unable to OCR the pages without text: {e}")
+            return original_text
+
+        if ocr_texts is None:
+            return original_text
+
+        for index, text in zip(missing, ocr_texts):
+            texts[index] = text
+
+        return "\f".join(texts)
+
     def parse(self, document_path: Path, mime_type, file_name=None):
         # This forces tesseract to use one core per page.
         os.environ["OMP_THREAD_LIMIT"] = "1"
-        VALID_TEXT_LENGTH = 50
 
         if mime_type == "application/pdf":
-            text_original = self.extract_text(None, document_path)
+            raw_text_original = self.extract_raw_text(None, document_path)
+            text_original = post_process_text(raw_text_original)
             original_has_text = (
                 text_original is not None and len(text_original) > VALID_TEXT_LENGTH
             )
@@ -340,15 +712,15 @@ class RasterisedDocumentParser(DocumentParser):
             }
         )
         if skip_archive_for_text and original_has_text:
-            self.log.debug("Document has text, skipping OCRmyPDF entirely.")
-            self.text = text_original
+            self.text = post_process_text(
+                self.ocr_pages_without_text(document_path, raw_text_original),
+            )
             return
 
         # Either no text was in the original or there should be an archive
         # file created, so OCR the file and create an archive with any
         # text located via OCR
 
-        import ocrmypdf
         from ocrmypdf import EncryptedPdfError
         from ocrmypdf import InputFileError
         from ocrmypdf import SubprocessOutputError
@@ -365,12 +737,15 @@ class RasterisedDocumentParser(DocumentParser):
 
         try:
             self.log.debug(f"Calling OCRmyPDF with args: {args}")
-            ocrmypdf.ocr(**args)
+            cached_text = self.run_ocrmypdf(args, mime_type)
 
             if self.settings.skip_archive_file != ArchiveFileChoices.ALWAYS:
                 self.archive_path = archive_path
 
-            self.text = self.extract_text(sidecar_file, archive_path)
+            if cached_text is not None:
+                self.text = post_process_text(cached_text)
+            else:
+                self.text = self.extract_text(sidecar_file, archive_path)
 
             if not self.text:
                 raise NoTextFoundException("No text was found in the original document")
@@ -416,7 +791,7 @@ class RasterisedDocumentParser(DocumentParser):
 
             try:
                 self.log.debug(f"Fallback: Calling OCRmyPDF with args: {args}")
-                ocrmypdf.ocr(**args)
+                self.call_ocrmypdf(args)
 
                 # Don't return the archived file here, since this file
                 # is bigger and blurry due to --force-ocr.
@@ -447,6 +822,84 @@ class RasterisedDocumentParser(DocumentParser):
                 self.text = ""
 
 
+def page_needs_ocr(page: "pikepdf.Page", text: str) -> bool:
+    """
+    Checks whether the page of a PDF has to be OCRed, given the text read
+    from it.  Pages without any text do.  So do scanned pages, which are
+    mostly a single image, if their text is too short to be more than a
+    page number, header or stamp.
+    """
+    text = text.strip()
+    if not text:
+        return True
+    return len(text) <= VALID_TEXT_LENGTH and page_has_full_page_image(page)
+
+
+def page_has_full_page_image(page: "pikepdf.Page") -> bool:
+    """
+    Checks whether the page draws an image covering most of the page, by
+    following the transformations of its content stream
+    """
+    import pikepdf
+
+    x1, y1, x2, y2 = (float(value) for value in page.mediabox)
+    page_area = abs((x2 - x1) * (y2 - y1))
+    if not page_area:
+        return False
+
+    images = set(page.images.keys())
+    ctm = pikepdf.Matrix()
+    saved = []
+    for operands, operator in pikepdf.parse_content_stream(page):
+        operator = str(operator)
+        if operator == "q":
+            saved.append(ctm)
+        elif operator == "Q":
+            ctm = saved.pop() if saved else pikepdf.Matrix()
+        elif operator == "cm":
+            ctm = pikepdf.Matrix(*(float(value) for value in operands)) @ ctm
+        elif (
+            operator == "Do" and str(operands[0]) in images
+        ) or operator == "INLINE IMAGE":
+            # Images are drawn into the unit square, so the determinant is
+            # the area they cover on the page
+            image_area = abs(ctm.a * ctm.d - ctm.b * ctm.c)
+            if image_area >= FULL_PAGE_IMAGE_COVERAGE * page_area:
+                return True
+    return False
+
+
+def split_pages(text: str, page_count: int) -> Optional[list[str]]:
+    """
+    Splits text read from a PDF into the text of its pages, which are separated
+    by form feeds.  Returns None, if the text can't be split like this.
+    """
+    if page_count == 1:
+        return [text]
+
+    pages = text.split("\f")
+    if len(pages) == page_count + 1 and not pages[-1].strip():
+        # pdftotext ends every page with a form feed
+        pages.pop()
+    return pages if len(pages) == page_count else None
+
+
+def extract_pages(input_file: Path, pages: list[int], output_file: Path) -> None:
+    """
+    Saves the given pages of the PDF, by their index, as a new PDF.  Other
+    pages are removed from a copy of the PDF, so the document level
+    information is kept.
+    """
+    import pikepdf
+
+    with pikepdf.open(input_file) as pdf:
+        keep = set(pages)
+        for index in reversed(range(len(pdf.pages))):
+            if index not in keep:
+                del pdf.pages[index]
+        pdf.save(output_file)
+
+
 def post_process_text(text):
     if not text:
         return None
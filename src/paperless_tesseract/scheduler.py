@@ -0,0 +1,152 @@
+import logging
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from filelock import FileLock
+from filelock import Timeout
+
+logger = logging.getLogger("paperless.parsing.tesseract.scheduler")
+
+# How often a job waiting for a core checks whether one was released
+POLL_INTERVAL_SECONDS = 0.5
+
+METRICS_KEY_PREFIX = "ocr_scheduler_"
+METRICS_COUNTERS = ("jobs", "cores_granted", "wait_ms", "core_ms")
+CORES_IN_USE_KEY = f"{METRICS_KEY_PREFIX}cores_in_use"
+
+
+def scheduler_enabled() -> bool:
+    return settings.OCR_CORES > 0
+
+
+def _core_locks() -> list[FileLock]:
+    """
+    Every core is a lock file.  The locks are held by the OCR jobs of all
+    worker processes of this node, and released by the operating system if
+    a worker dies.
+    """
+    cores_dir = Path(settings.SCRATCH_DIR) / "ocr-cores"
+    cores_dir.mkdir(parents=True, exist_ok=True)
+    return [
+        FileLock(cores_dir / f"core-{core}.lock") for core in range(settings.OCR_CORES)
+    ]
+
+
+def _try_acquire(locks: list[FileLock], wanted: int) -> list[FileLock]:
+    acquired = []
+    for lock in locks:
+        if len(acquired) >= wanted:
+            break
+        try:
+            lock.acquire(timeout=0)
+        except Timeout:
+            continue
+        acquired.append(lock)
+    return acquired
+
+
+def _count_in_use(cores: int) -> None:
+    """
+    Counts the cores held by OCR jobs, so they can be reported without
+    touching the locks, which would keep a waiting job from getting them
+    """
+    try:
+        cache.add(CORES_IN_USE_KEY, 0, timeout=None)
+        cache.incr(CORES_IN_USE_KEY, cores)
+    except Exception as e:  # pragma: no cover
+        logger.debug(f"Unable to count the OCR cores in use: {e}")
+
+
+def _record(cores: int, waited: float, used: float) -> None:
+    for counter, value in (
+        ("jobs", 1),
+        ("cores_granted", cores),
+        ("wait_ms", round(waited * 1000)),
+        ("core_ms", round(cores * used * 1000)),
+    ):
+        key = f"{METRICS_KEY_PREFIX}{counter}"
+        try:
+            cache.add(key, 0, timeout=None)
+            cache.incr(key, value)
+        except Exception as e:  # pragma: no cover
+            # The metrics are not worth failing the OCR for
+            logger.debug(f"Unable to record OCR scheduler metrics: {e}")
+            return
+
+
+@contextmanager
+def ocr_jobs(page_count: int) -> Iterator[int]:
+    """
+    Grants cores to an OCR job, from the cores shared by the OCR jobs of all
+    workers on this node.  OCRmyPDF processes one page per core, so a job
+    gets as many free cores as it has pages, and waits if no core is free.
+
+    Yields the number of jobs OCRmyPDF may run.  Without a configured number
+    of cores, every job may use PAPERLESS_THREADS_PER_WORKER.
+    """
+    if not scheduler_enabled():
+        yield int(settings.THREADS_PER_WORKER)
+        return
+
+    try:
+        locks = _core_locks()
+    except OSError as e:
+        logger.warning(f"Unable to schedule OCR jobs, not limiting cores: {e}")
+        locks = None
+
+    if locks is None:
+        yield int(settings.THREADS_PER_WORKER)
+        return
+
+    wanted = max(1, min(page_count, len(locks)))
+    started = time.monotonic()
+    acquired = _try_acquire(locks, wanted)
+    while not acquired:
+        time.sleep(POLL_INTERVAL_SECONDS)
+        acquired = _try_acquire(locks, wanted)
+    granted = time.monotonic()
+    _count_in_use(len(acquired))
+
+    logger.debug(
+        f"Granted {len(acquired)} of {wanted} wanted cores for {page_count} "
+        f"pages after {granted - started:.1f}s",
+    )
+
+    try:
+        yield len(acquired)
+    finally:
+        for lock in acquired:
+            lock.release()
+        _count_in_use(-len(acquired))
+        _record(len(acquired), granted - started, time.monotonic() - granted)
+
+
+def get_scheduler_metrics() -> dict:
+    """
+    Reports the cores in use right now, and totals of all OCR jobs since the
+    cache was cleared
+    """
+    totals = cache.get_many(
+        [
+            CORES_IN_USE_KEY,
+            *(f"{METRICS_KEY_PREFIX}{counter}" for counter in METRICS_COUNTERS),
+        ],
+    )
+    # The cores of a worker which died are never counted as released
+    in_use = min(max(totals.get(CORES_IN_USE_KEY, 0), 0), settings.OCR_CORES)
+
+    def total(counter: str) -> int:
+        return totals.get(f"{METRICS_KEY_PREFIX}{counter}", 0)
+
+    return {
+        "cores": settings.OCR_CORES,
+        "cores_in_use": in_use,
+        "jobs": total("jobs"),
+        "cores_granted": total("cores_granted"),
+        "wait_seconds": total("wait_ms") / 1000,
+        "core_seconds": total("core_ms") / 1000,
+    }
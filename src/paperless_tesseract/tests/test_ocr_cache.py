@@ -0,0 +1,241 @@
+import shutil
+import uuid
+from pathlib import Path
+from unittest import mock
+
+import pikepdf
+from django.test import TestCase
+from django.test import override_settings
+
+from documents.tests.utils import DirectoriesMixin
+from documents.tests.utils import FileSystemAssertsMixin
+from paperless_tesseract.cache import get_cached_page
+from paperless_tesseract.cache import page_key
+from paperless_tesseract.cache import prune_ocr_cache
+from paperless_tesseract.parsers import RasterisedDocumentParser
+
+
+class FakeOcr:
+    """
+    Copies the input to the output, and names the call and page in the text
+    """
+
+    def __init__(self):
+        self.inputs = []
+
+    def __call__(self, input_file, output_file, sidecar, **kwargs):
+        self.inputs.append(Path(input_file))
+        shutil.copy(input_file, output_file)
+        with pikepdf.open(input_file) as pdf:
+            count = len(pdf.pages)
+        Path(sidecar).write_text(
+            "\f".join(
+                f"Text of call {len(self.inputs)} page {page}"
+                for page in range(1, count + 1)
+            ),
+        )
+
+
+@override_settings(OCR_CACHE_SIZE=1000)
+class TestOcrCache(DirectoriesMixin, FileSystemAssertsMixin, TestCase):
+    SAMPLE_FILES = Path(__file__).resolve().parent / "samples"
+
+    def setUp(self):
+        super().setUp()
+
+        self.ocr = FakeOcr()
+        patcher = mock.patch("ocrmypdf.ocr", side_effect=self.ocr)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def parse(self, document_path: Path) -> RasterisedDocumentParser:
+        parser = RasterisedDocumentParser(uuid.uuid4())
+        parser.parse(document_path, "application/pdf")
+        return parser
+
+    def page_count(self, path: Path) -> int:
+        with pikepdf.open(path) as pdf:
+            return len(pdf.pages)
+
+    def test_reprocess(self):
+        """
+        GIVEN:
+            - A PDF which was OCRed before
+        WHEN:
+            - The PDF is parsed again
+        THEN:
+            - OCRmyPDF is not called again
+            - The archive file and the text are assembled from the cache
+        """
+        document = self.SAMPLE_FILES / "multi-page-digital.pdf"
+
+        first = self.parse(document)
+
+        self.assertEqual(self.ocr.inputs, [document])
+        self.assertEqual(
+            first.get_text(),
+            "Text of call 1 page 1 Text of call 1 page 2 Text of call 1 page 3",
+        )
+
+        second = self.parse(document)
+
+        self.assertEqual(len(self.ocr.inputs), 1)
+        self.assertEqual(second.get_text(), first.get_text())
+        self.assertIsFile(second.get_archive_path())
+        self.assertEqual(self.page_count(second.get_archive_path()), 3)
+
+    def test_changed_pages(self):
+        """
+        GIVEN:
+            - A PDF which was OCRed before
+        WHEN:
+            - A PDF with one of its pages removed and a new page is parsed
+        THEN:
+            - Only the new page is OCRed
+            - The pages and their text are in the order of the new PDF
+        """
+        self.parse(self.SAMPLE_FILES / "multi-page-digital.pdf")
+
+        changed = Path(self.dirs.scratch_dir) / "changed.pdf"
+        with pikepdf.open(self.SAMPLE_FILES / "multi-page-digital.pdf") as pdf:
+            with pikepdf.open(self.SAMPLE_FILES / "simple-digital.pdf") as other:
+                del pdf.pages[1]
+                pdf.pages.insert(1, other.pages[0])
+                pdf.save(changed)
+
+        parser = self.parse(changed)
+
+        self.assertEqual(len(self.ocr.inputs), 2)
+        self.assertEqual(self.page_count(self.ocr.inputs[1]), 1)
+        self.assertEqual(
+            parser.get_text(),
+            "Text of call 1 page 1 Text of call 2 page 1 Text of call 1 page 3",
+        )
+        self.assertEqual(self.page_count(parser.get_archive_path()), 3)
+
+    def test_page_key(self):
+        """
+        GIVEN:
+            - A page of a PDF
+        WHEN:
+            - The page is moved into another PDF
+        THEN:
+            - The key of the page stays the same
+        """
+        with pikepdf.open(self.SAMPLE_FILES / "multi-page-digital.pdf") as pdf:
+            keys = [page_key(page, "settings") for page in pdf.pages]
+
+            moved = pikepdf.new()
+            moved.pages.append(pdf.pages[2])
+            self.assertEqual(page_key(moved.pages[0], "settings"), keys[2])
+
+        self.assertEqual(len(set(keys)), 3)
+        self.assertNotEqual(keys[2], page_key(moved.pages[0], "other settings"))
+
+    def test_settings_changed(self):
+        """
+        GIVEN:
+            - A PDF which was OCRed before
+        WHEN:
+            - The PDF is parsed again with another OCR language
+        THEN:
+            - The PDF is OCRed again
+        """
+        document = self.SAMPLE_FILES / "simple-digital.pdf"
+        self.parse(document)
+
+        with override_settings(OCR_LANGUAGE="deu"):
+            self.parse(document)
+
+        self.assertEqual(len(self.ocr.inputs), 2)
+
+    def test_store_pages(self):
+        """
+        GIVEN:
+            - The archive file of a PDF with PDF/A metadata
+        WHEN:
+            - Its pages are stored in the cache
+        THEN:
+            - Every page is stored on its own, with the metadata of the file
+        """
+        archive = Path(self.dirs.scratch_dir) / "archive.pdf"
+        with pikepdf.open(self.SAMPLE_FILES / "multi-page-digital.pdf") as pdf:
+            with pdf.open_metadata() as meta:
+                meta["pdfaid:part"] = "2"
+                meta["pdfaid:conformance"] = "B"
+            pdf.save(archive)
+
+        parser = RasterisedDocumentParser(uuid.uuid4())
+        keys = ["a", "b", "c"]
+        parser.store_ocr_pages(keys, archive, ["A", "B", "C"])
+
+        for key in keys:
+            page = get_cached_page(key)
+            with pikepdf.open(page.pdf_path) as pdf:
+                self.assertEqual(len(pdf.pages), 1)
+                self.assertEqual(pdf.open_metadata()["pdfaid:part"], "2")
+        self.assertEqual(get_cached_page("b").text, "B")
+
+    @override_settings(OCR_CACHE_SIZE=0)
+    def test_cache_disabled(self):
+        """
+        GIVEN:
+            - The OCR cache is disabled
+        WHEN:
+            - A PDF is parsed twice
+        THEN:
+            - The PDF is OCRed twice, and nothing is cached
+        """
+        document = self.SAMPLE_FILES / "simple-digital.pdf"
+        self.parse(document)
+        self.parse(document)
+
+        self.assertEqual(len(self.ocr.inputs), 2)
+        self.assertIsNotDir(self.dirs.data_dir / "ocr-cache")
+
+    def test_prune_cache(self):
+        """
+        GIVEN:
+            - Pages in the OCR cache
+        WHEN:
+            - The cache is pruned to nothing
+        THEN:
+            - The pages are OCRed again
+        """
+        document = self.SAMPLE_FILES / "simple-digital.pdf"
+        self.parse(document)
+
+        self.assertEqual(prune_ocr_cache(limit=0), 0)
+
+        self.parse(document)
+        self.assertEqual(len(self.ocr.inputs), 2)
+
+    def test_reuse_archive_pages(self):
+        """
+        GIVEN:
+            - A PDF with an archive file, whose pages are not in the cache
+        WHEN:
+            - The pages of the archive file are reused
+            - A document made from some of the pages is parsed
+        THEN:
+            - The pages are not OCRed again
+        """
+        document = self.SAMPLE_FILES / "multi-page-digital.pdf"
+        archive = Path(self.dirs.scratch_dir) / "archive.pdf"
+        shutil.copy(document, archive)
+
+        parser = RasterisedDocumentParser(uuid.uuid4())
+        with mock.patch.object(
+            parser,
+            "extract_raw_text",
+            return_value="Page 1\fPage 2\fPage 3\f",
+        ):
+            self.assertTrue(parser.reuse_archive_pages(document, archive))
+
+        split = Path(self.dirs.scratch_dir) / "split.pdf"
+        with pikepdf.open(document) as pdf:
+            del pdf.pages[0]
+            pdf.save(split)
+
+        self.assertEqual(self.parse(split).get_text(), "Page 2 Page 3")
+        self.assertEqual(self.ocr.inputs, [])
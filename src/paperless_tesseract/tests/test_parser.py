@@ -5,10 +5,13 @@ import uuid
 from pathlib import Path
 from unittest import mock
 
+import pikepdf
 from django.test import TestCase
 from django.test import override_settings
 from ocrmypdf import SubprocessOutputError
+from PIL import Image
 
+from documents.page_images import PageImageCache
 from documents.parsers import ParseError
 from documents.parsers import run_convert
 from documents.tests.utils import DirectoriesMixin
@@ -65,6 +68,7 @@ class TestParser(DirectoriesMixin, FileSystemAssertsMixin, TestCase):
         )
         self.assertIsFile(thumb)
 
+    @override_settings(THUMBNAIL_ENGINE="CONVERT")
     @mock.patch("documents.parsers.run_convert")
     def test_thumbnail_fallback(self, m):
         def call_convert(input_file, output_file, **kwargs):
@@ -82,6 +86,109 @@ class TestParser(DirectoriesMixin, FileSystemAssertsMixin, TestCase):
         )
         self.assertIsFile(thumb)
 
+    @override_settings(THUMBNAIL_ENGINE="PDFIUM")
+    @mock.patch("documents.parsers.run_convert")
+    def test_thumbnail_pdfium(self, m):
+        """
+        GIVEN:
+            - Thumbnail engine pdfium
+        WHEN:
+            - A thumbnail is created for a PDF
+        THEN:
+            - The page is rendered without calling convert, at most 500px wide
+        """
+        parser = RasterisedDocumentParser(uuid.uuid4())
+        thumb = parser.get_thumbnail(
+            os.path.join(self.SAMPLE_FILES, "simple-digital.pdf"),
+            "application/pdf",
+        )
+        self.assertIsFile(thumb)
+        m.assert_not_called()
+        with Image.open(thumb) as im:
+            self.assertEqual(im.format, "WEBP")
+            self.assertLessEqual(im.width, 500)
+
+    @mock.patch("documents.parsers.render_pdf_page_pdfium")
+    @mock.patch("documents.parsers.run_convert")
+    def test_thumbnail_page_image(self, convert, pdfium):
+        """
+        GIVEN:
+            - The first page of the document was rendered before at 300 DPI
+        WHEN:
+            - A thumbnail is created for the document
+        THEN:
+            - The page is not rendered again, the thumbnail is made from it
+        """
+        document = self.SAMPLE_FILES / "simple-digital.pdf"
+        page_images = PageImageCache(self.dirs.scratch_dir / "page-images")
+        page_images.put(
+            page_images.document_key(document),
+            0,
+            300,
+            Image.new("RGB", (2480, 3508), "white"),
+        )
+
+        parser = RasterisedDocumentParser(uuid.uuid4())
+        parser.page_images = page_images
+        thumb = parser.get_thumbnail(document, "application/pdf")
+
+        convert.assert_not_called()
+        pdfium.assert_not_called()
+        with Image.open(thumb) as im:
+            self.assertEqual(im.format, "WEBP")
+            self.assertEqual(im.size, (500, 707))
+
+    @mock.patch("documents.parsers.make_thumbnail_from_pdf_pdfium")
+    def test_thumbnail_page_image_too_small(self, pdfium):
+        """
+        GIVEN:
+            - The first page of the document was rendered before, but too small
+              for the thumbnail
+        WHEN:
+            - A thumbnail is created for the document
+        THEN:
+            - The page is rendered again
+        """
+        pdfium.return_value = self.dirs.scratch_dir / "pdfium.webp"
+        document = self.SAMPLE_FILES / "simple-digital.pdf"
+        page_images = PageImageCache(self.dirs.scratch_dir / "page-images")
+        page_images.put(
+            page_images.document_key(document),
+            0,
+            40,
+            Image.new("RGB", (330, 467), "white"),
+        )
+
+        parser = RasterisedDocumentParser(uuid.uuid4())
+        parser.page_images = page_images
+        thumb = parser.get_thumbnail(document, "application/pdf")
+
+        self.assertEqual(thumb, pdfium.return_value)
+
+    @mock.patch("paperless_tesseract.parsers.make_thumbnail_from_pdf")
+    @mock.patch("paperless_tesseract.parsers.make_thumbnail_from_page_image")
+    def test_thumbnail_archive_page_images(self, page_image, from_pdf):
+        """
+        GIVEN:
+            - Pages of the original were rendered before
+            - The document has an archive file
+        WHEN:
+            - A thumbnail is created for the document
+        THEN:
+            - The rendered pages are not looked up, the thumbnail is made
+              from the archive file
+        """
+        document = self.SAMPLE_FILES / "simple-digital.pdf"
+        parser = RasterisedDocumentParser(uuid.uuid4())
+        parser.page_images = PageImageCache(self.dirs.scratch_dir / "page-images")
+        parser.archive_path = self.SAMPLE_FILES / "multi-page-digital.pdf"
+
+        thumb = parser.get_thumbnail(document, "application/pdf")
+
+        page_image.assert_not_called()
+        self.assertEqual(thumb, from_pdf.return_value)
+        self.assertEqual(from_pdf.call_args.args[0], parser.archive_path)
+
     def test_thumbnail_encrypted(self):
         parser = RasterisedDocumentParser(uuid.uuid4())
         thumb = parser.get_thumbnail(
@@ -90,6 +197,57 @@ class TestParser(DirectoriesMixin, FileSystemAssertsMixin, TestCase):
         )
         self.assertIsFile(thumb)
 
+    def test_supports_concurrent_thumbnail(self):
+        """
+        GIVEN:
+            - Different OCR settings
+        WHEN:
+            - The parser is asked if the thumbnail can be created while parsing
+        THEN:
+            - Only settings which leave the look of the pages unchanged allow it
+        """
+        for overrides, mime_type, expected in [
+            ({}, "application/pdf", False),
+            (
+                {"OCR_ROTATE_PAGES": False, "OCR_DESKEW": False},
+                "application/pdf",
+                True,
+            ),
+            (
+                {"OCR_ROTATE_PAGES": False, "OCR_DESKEW": False},
+                "image/png",
+                False,
+            ),
+            ({"OCR_ROTATE_PAGES": False, "OCR_MODE": "redo"}, "application/pdf", True),
+            (
+                {
+                    "OCR_ROTATE_PAGES": False,
+                    "OCR_DESKEW": False,
+                    "OCR_CLEAN": "clean-final",
+                },
+                "application/pdf",
+                False,
+            ),
+            (
+                {
+                    "OCR_ROTATE_PAGES": False,
+                    "OCR_DESKEW": False,
+                    "OCR_COLOR_CONVERSION_STRATEGY": "Gray",
+                },
+                "application/pdf",
+                False,
+            ),
+            ({"OCR_SKIP_ARCHIVE_FILE": "always"}, "image/png", True),
+        ]:
+            with self.subTest(overrides=overrides, mime_type=mime_type):
+                with override_settings(**overrides):
+                    parser = RasterisedDocumentParser(None)
+                    self.assertEqual(
+                        parser.supports_concurrent_thumbnail(mime_type),
+                        expected,
+                    )
+                    parser.cleanup()
+
     def test_get_dpi(self):
         parser = RasterisedDocumentParser(None)
 
@@ -641,6 +799,144 @@ class TestParser(DirectoriesMixin, FileSystemAssertsMixin, TestCase):
             ["page 4", "page 5", "page 6"],
         )
 
+    @override_settings(OCR_MODE="skip_noarchive")
+    @mock.patch("ocrmypdf.ocr")
+    def test_multi_page_mixed_no_archive_ocr_pages(self, ocr):
+        """
+        GIVEN:
+            - File with text on its first and last page only
+            - OCR mode set to skip_noarchive
+        WHEN:
+            - Document is parsed
+        THEN:
+            - Only the page without text is OCRed
+            - The text of the pages is merged in order
+            - No archive file is created
+        """
+        original_text = (
+            "Text of the first page, long enough to count as text.\f"
+            "\f"
+            "Text of the last page\f"
+        )
+
+        def extract_raw_text(sidecar_file, pdf_file):
+            if sidecar_file is None:
+                return original_text
+            return Path(sidecar_file).read_text()
+
+        def fake_ocr(input_file, output_file, sidecar, **kwargs):
+            with pikepdf.open(input_file) as pdf:
+                self.assertEqual(len(pdf.pages), 1)
+            shutil.copy(input_file, output_file)
+            Path(sidecar).write_text("Text of the second page")
+
+        ocr.side_effect = fake_ocr
+
+        parser = RasterisedDocumentParser(None)
+        with mock.patch.object(
+            parser,
+            "extract_raw_text",
+            side_effect=extract_raw_text,
+        ):
+            parser.parse(
+                self.SAMPLE_FILES / "multi-page-digital.pdf",
+                "application/pdf",
+            )
+
+        ocr.assert_called_once()
+        self.assertIsNone(parser.archive_path)
+        self.assertEqual(
+            parser.get_text(),
+            "Text of the first page, long enough to count as text. "
+            "Text of the second page Text of the last page",
+        )
+
+    @override_settings(OCR_MODE="skip_noarchive")
+    @mock.patch("ocrmypdf.ocr")
+    def test_multi_page_no_archive_pages_unknown(self, ocr):
+        """
+        GIVEN:
+            - File with text, which is not separated into its pages
+            - OCR mode set to skip_noarchive
+        WHEN:
+            - Document is parsed
+        THEN:
+            - OCRmyPDF is not called
+            - The text of the original is used
+            - No archive file is created
+        """
+        parser = RasterisedDocumentParser(None)
+        with mock.patch.object(
+            parser,
+            "extract_raw_text",
+            return_value="Text of some page, which is long enough to count as text.",
+        ):
+            parser.parse(
+                self.SAMPLE_FILES / "multi-page-digital.pdf",
+                "application/pdf",
+            )
+
+        ocr.assert_not_called()
+        self.assertIsNone(parser.archive_path)
+        self.assertEqual(
+            parser.get_text(),
+            "Text of some page, which is long enough to count as text.",
+        )
+
+    @override_settings(OCR_MODE="skip_noarchive")
+    @mock.patch("ocrmypdf.ocr")
+    def test_multi_page_no_archive_ocr_scanned_pages(self, ocr):
+        """
+        GIVEN:
+            - File with scanned pages
+            - The text read from one page is only a short stamp
+            - OCR mode set to skip_noarchive
+        WHEN:
+            - Document is parsed
+        THEN:
+            - The scanned page with only the stamp is OCRed
+            - The scanned pages with text are not
+            - No archive file is created
+        """
+        original_text = (
+            "Text of the first page, long enough to count as text.\f"
+            "Page 2\f"
+            "Text of the last page, long enough to count as text.\f"
+        )
+
+        def extract_raw_text(sidecar_file, pdf_file):
+            if sidecar_file is None:
+                return original_text
+            return Path(sidecar_file).read_text()
+
+        def fake_ocr(input_file, output_file, sidecar, **kwargs):
+            with pikepdf.open(input_file) as pdf:
+                self.assertEqual(len(pdf.pages), 1)
+            shutil.copy(input_file, output_file)
+            Path(sidecar).write_text("Page 2 with the text of the second page")
+
+        ocr.side_effect = fake_ocr
+
+        parser = RasterisedDocumentParser(None)
+        with mock.patch.object(
+            parser,
+            "extract_raw_text",
+            side_effect=extract_raw_text,
+        ):
+            parser.parse(
+                self.SAMPLE_FILES / "multi-page-images.pdf",
+                "application/pdf",
+            )
+
+        ocr.assert_called_once()
+        self.assertIsNone(parser.archive_path)
+        self.assertEqual(
+            parser.get_text(),
+            "Text of the first page, long enough to count as text. "
+            "Page 2 with the text of the second page "
+            "Text of the last page, long enough to count as text.",
+        )
+
     @override_settings(OCR_MODE="skip", OCR_ROTATE_PAGES=True)
     def test_rotate(self):
         parser = RasterisedDocumentParser(None)
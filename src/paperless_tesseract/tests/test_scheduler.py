@@ -0,0 +1,120 @@
+from pathlib import Path
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.test import override_settings
+
+from documents.tests.utils import DirectoriesMixin
+from paperless_tesseract.parsers import RasterisedDocumentParser
+from paperless_tesseract.scheduler import get_scheduler_metrics
+from paperless_tesseract.scheduler import ocr_jobs
+
+
+@override_settings(OCR_CORES=4)
+class TestOcrScheduler(DirectoriesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    @override_settings(OCR_CORES=0, THREADS_PER_WORKER=3)
+    def test_disabled(self):
+        """
+        GIVEN:
+            - No cores configured for OCR
+        WHEN:
+            - Cores are requested for a large document
+        THEN:
+            - The threads per worker are granted
+        """
+        with ocr_jobs(100) as jobs:
+            self.assertEqual(jobs, 3)
+
+    def test_grant_by_pages(self):
+        """
+        GIVEN:
+            - 4 cores for OCR
+        WHEN:
+            - Cores are requested by a document with 3 pages, and meanwhile by
+              a document with 10 pages
+        THEN:
+            - The first document is granted a core per page
+            - The second document is granted the remaining core
+            - The cores and their use are reported
+        """
+        with ocr_jobs(3) as first:
+            self.assertEqual(first, 3)
+            with ocr_jobs(10) as second:
+                self.assertEqual(second, 1)
+                self.assertEqual(get_scheduler_metrics()["cores_in_use"], 4)
+
+        metrics = get_scheduler_metrics()
+        self.assertEqual(metrics["cores"], 4)
+        self.assertEqual(metrics["cores_in_use"], 0)
+        self.assertEqual(metrics["jobs"], 2)
+        self.assertEqual(metrics["cores_granted"], 4)
+
+    def test_metrics_leave_locks(self):
+        """
+        GIVEN:
+            - A core is in use
+        WHEN:
+            - The metrics are read
+        THEN:
+            - The cores in use are reported
+            - The locks of the cores are not acquired
+        """
+        with ocr_jobs(1):
+            with mock.patch(
+                "paperless_tesseract.scheduler.FileLock.acquire",
+            ) as acquire:
+                metrics = get_scheduler_metrics()
+
+        acquire.assert_not_called()
+        self.assertEqual(metrics["cores_in_use"], 1)
+
+    def test_wait_for_core(self):
+        """
+        GIVEN:
+            - All cores are in use
+        WHEN:
+            - Cores are requested
+        THEN:
+            - The request waits until a core is released
+        """
+        busy = ocr_jobs(4)
+        self.assertEqual(busy.__enter__(), 4)
+
+        def release(seconds):
+            busy.__exit__(None, None, None)
+
+        with mock.patch(
+            "paperless_tesseract.scheduler.time.sleep",
+            side_effect=release,
+        ) as sleep:
+            with ocr_jobs(2) as jobs:
+                self.assertEqual(jobs, 2)
+
+        sleep.assert_called_once()
+
+    @mock.patch("ocrmypdf.ocr")
+    def test_parser_jobs(self, ocr):
+        """
+        GIVEN:
+            - 4 cores for OCR
+        WHEN:
+            - OCRmyPDF is called for a document with 3 pages
+        THEN:
+            - OCRmyPDF runs 3 jobs
+        """
+        parser = RasterisedDocumentParser(None)
+        parser.call_ocrmypdf(
+            {
+                "input_file": Path(__file__).parent
+                / "samples"
+                / "multi-page-digital.pdf",
+                "jobs": 1,
+            },
+        )
+
+        self.assertEqual(ocr.call_args.kwargs["jobs"], 3)
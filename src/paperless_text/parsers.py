@@ -32,6 +32,9 @@ class TextDocumentParser(DocumentParser):
 
         return out_path
 
+    def supports_concurrent_thumbnail(self, mime_type) -> bool:
+        return True
+
     def parse(self, document_path, mime_type, file_name=None):
         self.text = self.read_file_handle_unicode_errors(document_path)
 